@@ -1,4 +1,4 @@
 #!/bin/bash
 
 apt update
-apt install -y gcc make cmake libcunit1 libcunit1-dev net-tools nftables libnetfilter-queue-dev valgrind cppcheck
+apt install -y gcc make cmake libcunit1 libcunit1-dev net-tools nftables libnetfilter-queue-dev libnftables-dev valgrind cppcheck
@@ -1,12 +1,13 @@
 EXITCODE=0
 
+# Tests run as root, as libnftables needs the CAP_NET_ADMIN capability to access the nftables ruleset
 for file in $GITHUB_WORKSPACE/bin/test/*
 do
     if [[ $# -eq 1 && $1 == valgrind ]]
     then
-        valgrind --tool=memcheck --leak-check=full --show-leak-kinds=all --error-exitcode=1 "$file"
+        sudo valgrind --tool=memcheck --leak-check=full --show-leak-kinds=all --error-exitcode=1 "$file"
     else
-        "$file"
+        sudo "$file"
     fi
     # If the exit code is not 0, set EXITCODE to 1
     if [[ $? -ne 0 ]]
@@ -1,7 +1,2 @@
-for DEVICE in $GITHUB_WORKSPACE/devices/*
-do
-    if [[ -d $DEVICE ]]
-    then
-        python3 $GITHUB_WORKSPACE/src/translator/translator.py $DEVICE/profile.yaml
-    fi
-done
+python3 $GITHUB_WORKSPACE/src/translator/translator.py --jobs $(nproc) $GITHUB_WORKSPACE/devices
+python3 $GITHUB_WORKSPACE/src/translator/translator.py --jobs $(nproc) $GITHUB_WORKSPACE/test/devices
@@ -15,12 +15,21 @@
 #include <stdint.h>
 #include <stdbool.h>
 #include <string.h>
+#include <time.h>
+#include <pthread.h>
 #include "hashmap.h"
 #include "packet_utils.h"
 
 // Initial size of the DNS table
 // If set to 0, the default size will be 16
 #define DNS_MAP_INIT_SIZE 0
+// Default grace period added to the TTL of the DNS answers, in seconds,
+// as devices commonly keep using the addresses they resolved a bit after their TTL expired
+#define DNS_MAP_TTL_GRACE 300
+// Default memory ceiling of the DNS table, in bytes,
+// above which expired, then least recently used, entries are evicted
+// If set to 0, the memory is not limited
+#define DNS_MAP_MAX_MEMORY (1 << 20)
 
 
 ////////// TYPE DEFINITIONS //////////
@@ -29,23 +38,71 @@
  * List of IP addresses
  */
 typedef struct ip_list {
-    uint8_t ip_count;         // Number of IP addresses
+    uint16_t ip_count;        // Number of IP addresses
     ip_addr_t *ip_addresses;  // List of IP addresses
+    uint32_t ttl;             // Time to live of the addresses, in seconds (minimum TTL of the records they were resolved from)
 } ip_list_t;
 
 /**
  * DNS table entry:
  * mapping between domain name and a list of IP addresses.
+ * The addresses are sorted and without duplicates.
  */
 typedef struct dns_entry {
     char *domain_name;  // Domain name
     ip_list_t ip_list;  // List of IP addresses
+    time_t expiry;      // Time after which the entry is expired, in seconds of the monotonic clock
+    time_t last_used;   // Time of the last lookup of the entry, in seconds of the monotonic clock (updated atomically by concurrent lookups)
 } dns_entry_t;
 
 /**
- * Alias for the hashmap structure.
+ * Reverse DNS table entry:
+ * mapping between an IP address and the bitmask of the IDs of the domain names it was resolved for.
+ * The bitmask is stored as an array of 64-bit words, with the bit `id % 64` of word `id / 64` set for domain name ID `id`.
  */
-typedef struct hashmap dns_map_t;
+typedef struct dns_address_entry {
+    ip_addr_t ip_address;  // IP address
+    uint64_t domains[];    // Bitmask of domain name IDs, of `mask_words` words
+} dns_address_entry_t;
+
+/**
+ * DNS table statistics
+ */
+typedef struct dns_map_stats {
+    size_t entries;        // Number of entries, including the expired ones which were not evicted yet
+    size_t memory;         // Memory used by the entries, in bytes
+    uint64_t hits;         // Number of lookups which found a valid entry
+    uint64_t misses;       // Number of lookups which found no entry, or an expired one
+    uint64_t expirations;  // Number of expired entries evicted
+    uint64_t evictions;    // Number of valid entries evicted, as least recently used, to stay below the memory ceiling
+} dns_map_stats_t;
+
+/**
+ * DNS table:
+ * the domain names known at translation time are identified by a dense integer ID,
+ * and their entries are stored in an array indexed by ID,
+ * while the domain names discovered at runtime are stored in a hashmap indexed by name.
+ * The IP addresses of the domain names known at translation time are also indexed in a reverse table,
+ * to check if an address belongs to any domain name of a set with a single lookup.
+ * Entries expire after the TTL of the DNS answer they were added from (plus a grace period):
+ * lookups ignore expired entries, which are evicted by the following additions
+ * when the memory used by the table exceeds its ceiling.
+ * The table can be shared by several threads:
+ * lookups hold its lock for reading, and modifications hold it for writing.
+ */
+typedef struct dns_map {
+    struct hashmap *names;      // Entries of the domain names discovered at runtime, indexed by name
+    uint16_t num_ids;           // Number of domain names known at translation time
+    dns_entry_t *ids;           // Entries of the domain names known at translation time, indexed by ID
+    uint16_t mask_words;        // Number of 64-bit words of the domain name ID bitmasks
+    struct hashmap *addresses;  // Reverse table entries, indexed by IP address
+    uint32_t ttl_grace;         // Grace period added to the TTL of the entries, in seconds (default: DNS_MAP_TTL_GRACE)
+    size_t max_memory;          // Memory ceiling, in bytes, or 0 for no limit (default: DNS_MAP_MAX_MEMORY)
+    size_t addresses_memory;    // Memory used by the IP address lists of the entries, in bytes
+    uint16_t num_id_entries;    // Number of domain name IDs with an entry
+    dns_map_stats_t stats;      // Lookup and eviction counters
+    pthread_rwlock_t lock;      // Read-write lock of the table
+} dns_map_t;
 
 
 ////////// FUNCTIONS //////////
@@ -60,12 +117,20 @@ typedef struct hashmap dns_map_t;
 bool dns_entry_contains(dns_entry_t *dns_entry, ip_addr_t ip_address);
 
 /**
- * Create a new DNS table.
+ * Create a new DNS table, without domain name IDs.
  * 
  * @return the newly created DNS table 
  */
 dns_map_t* dns_map_create();
 
+/**
+ * Create a new DNS table, with entries for a given number of domain name IDs.
+ * 
+ * @param num_ids number of domain names known at translation time, identified by IDs 0 to num_ids - 1
+ * @return the newly created DNS table
+ */
+dns_map_t* dns_map_create_with_ids(uint16_t num_ids);
+
 /**
  * Destroy (free) a DNS table.
  * 
@@ -76,6 +141,7 @@ void dns_map_free(dns_map_t *table);
 /**
  * Add IP addresses corresponding to a given domain name in the DNS table.
  * If the domain name was already present, its IP addresses will be replaced by the new ones.
+ * The entry expires after the TTL of the IP address list.
  * 
  * @param table the DNS table to add the entry to
  * @param domain_name the domain name of the entry
@@ -83,6 +149,18 @@ void dns_map_free(dns_map_t *table);
  */
 void dns_map_add(dns_map_t *table, char *domain_name, ip_list_t ip_list);
 
+/**
+ * Add IP addresses corresponding to a domain name known at translation time in the DNS table.
+ * If the domain name was already present, its IP addresses will be replaced by the new ones.
+ * The entry expires after the TTL of the IP address list.
+ * 
+ * @param table the DNS table to add the entry to
+ * @param id ID of the domain name
+ * @param domain_name the domain name of the entry, which must outlive the entry
+ * @param ip_list an ip_list_t structure containing the list of IP addresses
+ */
+void dns_map_add_id(dns_map_t *table, uint16_t id, char *domain_name, ip_list_t ip_list);
+
 /**
  * Remove a domain name (and its corresponding IP addresses) from the DNS table.
  * 
@@ -93,14 +171,63 @@ void dns_map_remove(dns_map_t *table, char *domain_name);
 
 /**
  * Retrieve the IP addresses corresponding to a given domain name in the DNS table.
+ * The entry is only valid until the next modification of the table,
+ * so threads sharing the table must use the `dns_map_contains_*` functions instead.
  * 
  * @param table the DNS table to retrieve the entry from
  * @param domain_name the domain name of the entry to retrieve
  * @return a pointer to a dns_entry structure containing the IP addresses corresponding to the domain name,
- *         or NULL if the domain name was not found in the DNS table
+ *         or NULL if the domain name was not found in the DNS table, or its entry is expired
  */
 dns_entry_t* dns_map_get(dns_map_t *table, char *domain_name);
 
+/**
+ * Retrieve the IP addresses corresponding to a domain name known at translation time in the DNS table.
+ * The entry is only valid until the next modification of the table,
+ * so threads sharing the table must use the `dns_map_contains_*` functions instead.
+ * 
+ * @param table the DNS table to retrieve the entry from
+ * @param id ID of the domain name
+ * @return a pointer to a dns_entry structure containing the IP addresses corresponding to the domain name,
+ *         or NULL if the domain name was not added to the DNS table yet, or its entry is expired
+ */
+dns_entry_t* dns_map_get_id(dns_map_t *table, uint16_t id);
+
+/**
+ * Check if an IP address was resolved for a domain name known at translation time.
+ * 
+ * @param table the DNS table to search in
+ * @param id ID of the domain name
+ * @param ip_address IP address to check the presence of
+ * @return true if the IP address belongs to the domain name, false otherwise
+ */
+bool dns_map_contains_id(dns_map_t *table, uint16_t id, ip_addr_t ip_address);
+
+/**
+ * Check if an IP address was resolved for any of a set of domain names known at translation time.
+ * 
+ * @param table the DNS table to search in
+ * @param ip_address IP address to check the presence of
+ * @param mask bitmask of the domain name IDs to check, of `(num_ids + 63) / 64` words
+ * @return true if the IP address belongs to one of the domain names, false otherwise
+ */
+bool dns_map_contains_ip(dns_map_t *table, ip_addr_t ip_address, const uint64_t *mask);
+
+/**
+ * Retrieve the statistics of a DNS table.
+ * 
+ * @param table the DNS table to retrieve the statistics of
+ * @return the statistics of the DNS table
+ */
+dns_map_stats_t dns_map_get_stats(dns_map_t *table);
+
+/**
+ * Print the statistics of a DNS table on the standard output.
+ * 
+ * @param table the DNS table to print the statistics of
+ */
+void dns_map_print_stats(dns_map_t *table);
+
 /**
  * Retrieve the IP addresses corresponding to a given domain name,
  * and remove the domain name from the DNS table.
@@ -13,13 +13,52 @@
 
 #include <stdio.h>
 #include <stdlib.h>
+#include <stdint.h>
+#include <inttypes.h>
+#include <stdbool.h>
 #include <unistd.h>
+#include <time.h>
+#include <sys/socket.h>
 #include <netinet/in.h>
 #include <linux/types.h>
 #include <linux/netfilter.h>
 #include <errno.h>
 #include <libnetfilter_queue/libnetfilter_queue.h>
 
+// Copy range of the whole packet
+#define NFQUEUE_COPY_RANGE_FULL 0xffff
+
+// Default values of the high-throughput mode parameters
+#define NFQUEUE_DEFAULT_RCVBUF         (8 * 1024 * 1024)  // Netlink socket receive buffer size, in bytes
+#define NFQUEUE_DEFAULT_QUEUE_MAXLEN   4096               // Maximum number of packets waiting in the kernel queue
+#define NFQUEUE_DEFAULT_BATCH_SIZE     32                 // Maximum number of messages received with a single system call
+#define NFQUEUE_DEFAULT_STATS_INTERVAL 60                 // Interval between two statistics reports, in seconds
+// Size of the buffer receiving a single netlink message (maximum packet size, plus netlink metadata)
+#define NFQUEUE_MSG_BUFSIZE (0xffff + 4096)
+
+/**
+ * @brief Configuration of the high-throughput queue mode.
+ * Parameters set to 0 take their default value.
+ */
+typedef struct {
+    uint32_t rcvbuf;          // Netlink socket receive buffer size, in bytes
+    uint32_t queue_maxlen;    // Maximum number of packets waiting in the kernel queue
+    uint16_t batch_size;      // Maximum number of messages received with a single system call
+    uint32_t stats_interval;  // Interval between two statistics reports on stderr, in seconds
+    bool fail_open;           // Accept the packets instead of dropping them when the kernel queue is full
+} nfqueue_config_t;
+
+/**
+ * @brief Statistics of a queue in high-throughput mode.
+ * Updated atomically by the queue thread, and can be read concurrently.
+ */
+typedef struct {
+    uint64_t packets;   // Number of received packets
+    uint64_t dropped;   // Number of packets dropped by the callback's verdict
+    uint64_t enobufs;   // Number of receive buffer overruns (ENOBUFS), each losing one or more packets
+    uint64_t verdicts;  // Number of verdict messages sent to the kernel
+} nfqueue_stats_t;
+
 /**
  * @brief Packet and duration counters ids.
  * 
@@ -42,12 +81,30 @@ typedef struct {
  */
 typedef uint32_t basic_callback(int pkt_id, int pkt_len, uint8_t *payload, void *arg);
 
+/**
+ * @brief Dispatch table of a queue shared by multiple policies.
+ * Each policy's nftables rule sets the packet mark to the policy's index in the table,
+ * which selects the basic callback function handling the packet.
+ */
+typedef struct {
+    uint32_t num_entries;     // Number of entries in the table
+    basic_callback **funcs;   // Basic callback functions, indexed by packet mark (NULL for unused marks)
+    void **args;              // Arguments to pass to the callback functions, indexed by packet mark
+    uint32_t default_verdict; // Verdict for packets with an unknown mark
+} dispatch_table_t;
+
 /**
  * Structure that stores a basic callback function and its arguments.
  */
 typedef struct callback_struct {
-    basic_callback *func;  // Basic callback function
-    void *arg;             // Arguments to pass to the callback function (the packet and duration counters ids)
+    basic_callback *func;         // Basic callback function
+    void *arg;                    // Arguments to pass to the callback function (the packet and duration counters ids)
+    dispatch_table_t *dispatch;   // Dispatch table selecting the callback function from the packet mark, or NULL
+    nfqueue_stats_t *stats;       // Queue statistics (high-throughput mode only, NULL otherwise)
+    bool batch_verdicts;          // Whether consecutive equal verdicts are sent as a single batch verdict
+    bool has_pending;             // Whether a batch verdict is pending
+    uint32_t pending_id;          // Highest packet ID of the pending batch verdict
+    uint32_t pending_verdict;     // Verdict of the pending batch verdict
 } callback_struct_t;
 
 /**
@@ -59,9 +116,13 @@ typedef struct callback_struct {
  * - the arguments to pass to the callback function
  */
 typedef struct {
-    uint16_t queue_id;     // Queue number to bind to
-    basic_callback *func;  // Basic callback function
-    void *arg;             // Arguments to pass to the callback function (the packet and duration counters ids)
+    uint16_t queue_id;          // Queue number to bind to
+    basic_callback *func;       // Basic callback function
+    void *arg;                  // Arguments to pass to the callback function (the packet and duration counters ids)
+    uint16_t copy_range;        // Number of bytes of each packet copied to userspace, or 0 for the whole packet
+    nfqueue_config_t *config;   // High-throughput mode configuration, or NULL for the default mode
+    nfqueue_stats_t *stats;     // Queue statistics, or NULL if not needed by the caller
+    dispatch_table_t *dispatch; // Dispatch table of a shared queue, or NULL if the queue is bound to a single callback
 } thread_arg_t;
 
 /**
@@ -85,6 +146,46 @@ int get_pkt_id(struct nfq_data *nfad);
  */
 void bind_queue(uint16_t queue_num, basic_callback *callback, void *arg);
 
+/**
+ * Bind queue to callback function, with an optional high-throughput configuration,
+ * and wait for packets.
+ *
+ * In high-throughput mode, the netlink receive buffer is enlarged,
+ * multiple messages are received with a single system call,
+ * consecutive equal verdicts are sent as a single batch verdict,
+ * and statistics are maintained and periodically reported on stderr.
+ *
+ * @param queue_num the number of the queue to bind to
+ * @param callback the basic callback funtion, called upon packet reception
+ * @param arg the argument to pass to the basic callback function
+ * @param copy_range number of bytes of each packet copied to userspace, or 0 for the whole packet
+ * @param config high-throughput mode configuration, or NULL for the default mode
+ * @param stats queue statistics, updated in high-throughput mode, or NULL if not needed by the caller
+ */
+void bind_queue_config(uint16_t queue_num, basic_callback *callback, void *arg, uint16_t copy_range, nfqueue_config_t *config, nfqueue_stats_t *stats);
+
+/**
+ * Bind a queue shared by multiple policies to a dispatch table,
+ * and wait for packets.
+ * Each packet is handled by the basic callback function indexed by its mark in the table.
+ *
+ * @param queue_num the number of the queue to bind to
+ * @param dispatch the dispatch table
+ * @param copy_range number of bytes of each packet copied to userspace, or 0 for the whole packet
+ * @param config high-throughput mode configuration, or NULL for the default mode
+ * @param stats queue statistics, updated in high-throughput mode, or NULL if not needed by the caller
+ */
+void bind_queue_dispatch(uint16_t queue_num, dispatch_table_t *dispatch, uint16_t copy_range, nfqueue_config_t *config, nfqueue_stats_t *stats);
+
+/**
+ * @brief Print the statistics of a queue.
+ *
+ * @param fp file to print to
+ * @param queue_num number of the queue
+ * @param stats queue statistics
+ */
+void nfqueue_stats_print(FILE *fp, uint16_t queue_num, nfqueue_stats_t *stats);
+
 /**
  * @brief pthread wrapper for bind_queue.
  * 
@@ -23,6 +23,18 @@
 #define IPV4_ADDR_LENGTH 4
 #define IPV6_ADDR_LENGTH 16
 
+// 32-bit FNV-1a hash parameters
+#define FNV_OFFSET_BASIS 2166136261U
+#define FNV_PRIME 16777619U
+
+// IPv4 address a.b.c.d as a 32-bit unsigned integer in network byte order,
+// as a constant expression, to statically initialize addresses without parsing them
+#if __BYTE_ORDER__ == __ORDER_LITTLE_ENDIAN__
+#define IPV4_ADDR_NET(a, b, c, d) ((uint32_t) (a) | ((uint32_t) (b) << 8) | ((uint32_t) (c) << 16) | ((uint32_t) (d) << 24))
+#else
+#define IPV4_ADDR_NET(a, b, c, d) (((uint32_t) (a) << 24) | ((uint32_t) (b) << 16) | ((uint32_t) (c) << 8) | (uint32_t) (d))
+#endif
+
 /**
  * @brief IP (v4 or v6) address value
  */
@@ -39,6 +51,31 @@ typedef struct {
     ip_val_t value;   // IP address value
 } ip_addr_t;
 
+/**
+ * @brief IP (v4 or v6) prefix, i.e. network address and mask
+ */
+typedef struct {
+    ip_addr_t address;  // Network address, with the host bits cleared
+    ip_val_t mask;      // Network mask
+} ip_prefix_t;
+
+/**
+ * @brief String of a string set, with its precomputed hash
+ */
+typedef struct {
+    uint32_t hash;  // Hash of the string, as computed by string_hash
+    char *value;    // String
+} string_set_entry_t;
+
+/**
+ * @brief Set of strings, generated at translation time.
+ * The strings are sorted by hash.
+ */
+typedef struct {
+    uint16_t count;                     // Number of strings
+    const string_set_entry_t *entries;  // Strings, sorted by hash
+} string_set_t;
+
 /**
  * Print a packet payload.
  * 
@@ -164,5 +201,31 @@ bool compare_ipv6(uint8_t *ipv6_1, uint8_t *ipv6_2);
  */
 bool compare_ip(ip_addr_t ip_1, ip_addr_t ip_2);
 
+/**
+ * @brief Check if an IP (v4 or v6) address belongs to an IP prefix.
+ *
+ * @param prefix IP prefix
+ * @param ip_addr IP address
+ * @return true if the address belongs to the prefix, false otherwise
+ */
+bool ip_prefix_contains(ip_prefix_t prefix, ip_addr_t ip_addr);
+
+/**
+ * @brief Compute the 32-bit FNV-1a hash of a string.
+ *
+ * @param string the string to hash
+ * @return the hash of the string
+ */
+uint32_t string_hash(char *string);
+
+/**
+ * @brief Check if a string set contains a given string.
+ *
+ * @param set the string set
+ * @param string the string to search for
+ * @return true if the string is in the set, false otherwise
+ */
+bool string_set_contains(const string_set_t *set, char *string);
+
 
 #endif /* _IOTFIREWALL_PACKET_UTILS_ */
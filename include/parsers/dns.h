@@ -107,6 +107,26 @@ typedef struct dns_message {
     dns_resource_record_t *additionals;
 } dns_message_t;
 
+/**
+ * Domain name pattern of a DNS domain set
+ */
+typedef struct dns_domain_pattern {
+    uint32_t hash;      // Hash of the domain name, as computed by dns_domain_hash
+    bool wildcard;      // Whether the pattern matches the subdomains of the domain name (e.g. "*.example.com")
+    char *domain_name;  // Domain name, without the "*." prefix for wildcard patterns
+    uint16_t id;        // ID of the domain name in the DNS map (unused for wildcard patterns)
+} dns_domain_pattern_t;
+
+/**
+ * Set of domain name patterns, generated at translation time.
+ * The patterns are sorted by hash.
+ */
+typedef struct dns_domain_set {
+    uint16_t count;                        // Number of patterns
+    bool has_wildcards;                    // Whether the set contains wildcard patterns
+    const dns_domain_pattern_t *patterns;  // Patterns, sorted by hash
+} dns_domain_set_t;
+
 
 ////////// FUNCTIONS //////////
 
@@ -163,6 +183,41 @@ dns_message_t dns_parse_message(uint8_t *data);
  */
 bool dns_contains_domain_name(dns_question_t *questions, uint16_t qdcount, char *domain_name);
 
+/**
+ * @brief Compute the hash of a domain name.
+ *
+ * The hash is the 32-bit FNV-1a hash of the domain name characters, in reverse order,
+ * such that the hashes of all the suffixes of a domain name are computed in a single pass.
+ *
+ * @param domain_name the domain name to hash
+ * @return the hash of the domain name
+ */
+uint32_t dns_domain_hash(char *domain_name);
+
+/**
+ * @brief Search for the pattern of a domain set matching a domain name.
+ *
+ * A wildcard pattern "*.example.com" matches all the subdomains of "example.com",
+ * but not "example.com" itself.
+ * If several patterns match, the exact domain name is preferred,
+ * then the wildcard pattern with the longest suffix.
+ *
+ * @param set the domain set
+ * @param domain_name the domain name to search for
+ * @return the pattern matching the domain name, or NULL if no pattern matches
+ */
+const dns_domain_pattern_t* dns_domain_set_lookup(const dns_domain_set_t *set, char *domain_name);
+
+/**
+ * @brief Search for a domain name matching a domain set in a DNS Questions list.
+ *
+ * @param questions DNS Questions list
+ * @param qdcount number of Questions in the list
+ * @param set the domain set
+ * @return true if a domain name of the Questions list matches a pattern of the set, false otherwise
+ */
+bool dns_contains_domain_set(dns_question_t *questions, uint16_t qdcount, const dns_domain_set_t *set);
+
 /**
  * @brief Search for a specific domain name in a DNS Questions list.
  * 
@@ -182,7 +237,8 @@ dns_question_t* dns_get_question(dns_question_t *questions, uint16_t qdcount, ch
  * @param answers DNS Answers list to search in
  * @param ancount number of Answers in the list
  * @param domain_name domain name to search for
- * @return struct ip_list representing the list of corresponding IP addresses
+ * @return struct ip_list representing the list of corresponding IP addresses,
+ *         valid for the minimum TTL of the records of the CNAME chain
  */
 ip_list_t dns_get_ip_from_name(dns_resource_record_t *answers, uint16_t ancount, char *domain_name);
 
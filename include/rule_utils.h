@@ -16,7 +16,17 @@
 #include <stdint.h>
 #include <stdbool.h>
 #include <string.h>
+#include <inttypes.h>
+#include <pthread.h>
 #include <sys/time.h>
+#include "packet_utils.h"
+
+// Maximum length of an nftables object name, including the terminating null byte
+#define NFT_NAME_MAXLEN 256
+// Default polling interval of the counter cache, in microseconds
+#define COUNTER_CACHE_DEFAULT_INTERVAL 100000
+// Initial size of the commands buffer of an nftables batch, in bytes
+#define NFT_BATCH_INITIAL_CAPACITY 256
 
 
 // Counter type
@@ -55,6 +65,48 @@ typedef struct {
     uint64_t microseconds;
 } duration_t;
 
+// Value of an nftables counter
+typedef struct {
+    char name[NFT_NAME_MAXLEN];  // Counter name
+    uint64_t packets;            // Packets value
+    uint64_t bytes;              // Bytes value
+} counter_value_t;
+
+/**
+ * Cache of the values of all the nftables counters of a table.
+ * The values are read in a single dump of the table's counters,
+ * which is refreshed at most once per polling interval.
+ */
+typedef struct {
+    char table_name[NFT_NAME_MAXLEN];  // Name of the nftables table, including its family (e.g. "netdev my-device")
+    uint64_t interval;                 // Polling interval, in microseconds
+    uint64_t last_update;              // Timestamp of the last dump, in microseconds (0 if never dumped), accessed atomically
+    bool refreshing;                   // Whether a thread is dumping the counters, accessed atomically
+    uint16_t num_counters;             // Number of counters in the cache
+    uint16_t capacity;                 // Number of counters the cache can hold before growing
+    counter_value_t *counters;         // Counters values
+    pthread_mutex_t mutex;             // Mutex protecting the cache, shared by the queue threads
+    pthread_cond_t refreshed;          // Signaled, with the mutex, when a thread is done dumping the counters
+} counter_cache_t;
+
+/**
+ * Batch of nftables commands, run as a single transaction.
+ */
+typedef struct {
+    char *cmds;         // Commands, separated by newlines
+    size_t length;      // Length of the commands string
+    size_t capacity;    // Size of the commands buffer
+    uint16_t num_cmds;  // Number of commands in the batch
+    bool error;         // Whether a command could not be added to the batch
+} nft_batch_t;
+
+/**
+ * Command sink, receiving the nftables commands instead of running them (e.g. to record them in tests).
+ * Receives the command and the argument registered with the sink,
+ * and returns the command output, allocated with malloc, or NULL if the command failed.
+ */
+typedef char* (*nft_cmd_sink_t)(char *cmd, void *arg);
+
 
 /**
  * @brief Read the packet count value of an nftables counter.
@@ -100,6 +152,193 @@ packet_count_t counter_packets_init(char *nft_table_name, char *nft_counter_name
  */
 duration_t counter_duration_init();
 
+/**
+ * @brief Create a cache of the values of an nftables table's counters.
+ *
+ * @param table_name name of the nftables table, including its family (e.g. "netdev my-device")
+ * @param interval polling interval, in microseconds: cached values are at most this old
+ * @return pointer to the newly created cache, which must be freed with `counter_cache_free`
+ */
+counter_cache_t* counter_cache_create(char *table_name, uint64_t interval);
+
+/**
+ * @brief Free a counter cache.
+ *
+ * @param cache pointer to the counter cache to free
+ */
+void counter_cache_free(counter_cache_t *cache);
+
+/**
+ * @brief Update the values of a counter cache from a dump of the table's counters,
+ * as output by `nft list counters table <table>`.
+ *
+ * @param cache pointer to the counter cache to update
+ * @param dump dump of the table's counters
+ * @return number of counters read from the dump
+ */
+uint16_t counter_cache_update(counter_cache_t *cache, char *dump);
+
+/**
+ * @brief Dump the table's counters, and update the values of a counter cache.
+ *
+ * @param cache pointer to the counter cache to refresh
+ * @return true if the counters were successfully dumped, false otherwise
+ */
+bool counter_cache_refresh(counter_cache_t *cache);
+
+/**
+ * @brief Read the packet count value of an nftables counter, from a counter cache.
+ * The cache is refreshed first if its values are older than its polling interval.
+ *
+ * @param cache pointer to the counter cache
+ * @param counter_name name of the nftables counter to read
+ * @return packet count value of the counter, or 0 if the counter is unknown
+ */
+uint64_t counter_cache_read_packets(counter_cache_t *cache, char *counter_name);
+
+/**
+ * @brief Read the bytes value of an nftables counter, from a counter cache.
+ * The cache is refreshed first if its values are older than its polling interval.
+ *
+ * @param cache pointer to the counter cache
+ * @param counter_name name of the nftables counter to read
+ * @return bytes value of the counter, or 0 if the counter is unknown
+ */
+uint64_t counter_cache_read_bytes(counter_cache_t *cache, char *counter_name);
+
+/**
+ * @brief Initialize the values of a packet_count_t structure, from a counter cache.
+ *
+ * @param cache pointer to the counter cache
+ * @param nft_counter_name name of the associated nftables counter
+ * @param direction direction of the rule (BOTH, OUT or IN)
+ * @return packet_count_t struct containing the initial packet count values
+ */
+packet_count_t counter_cache_packets_init(counter_cache_t *cache, char *nft_counter_name, direction_t direction);
+
+/**
+ * @brief Initialize the nftables context of the process.
+ * The context is shared by all the threads of the process,
+ * and is otherwise created when the first nftables command is run.
+ *
+ * @return true if the context is ready, false otherwise
+ */
+bool nft_context_init();
+
+/**
+ * @brief Free the nftables context of the process.
+ */
+void nft_context_free();
+
+/**
+ * @brief Set the command sink of the process,
+ * which receives all the nftables commands instead of running them.
+ *
+ * @param sink function receiving the nftables commands, or NULL to run the commands again
+ * @param arg argument passed to the sink along with each command
+ */
+void nft_set_cmd_sink(nft_cmd_sink_t sink, void *arg);
+
+/**
+ * @brief Run an nftables command, discarding its output.
+ *
+ * @param cmd nftables command to run, without the leading `nft`
+ * @return true if the command succeeded, false otherwise
+ */
+bool nft_run_cmd(char *cmd);
+
+/**
+ * @brief Start a new batch of nftables commands.
+ *
+ * @param batch pointer to the batch to initialize
+ */
+void nft_batch_begin(nft_batch_t *batch);
+
+/**
+ * @brief Add a command to a batch of nftables commands.
+ * If the command cannot be added, the whole batch is marked as failed.
+ *
+ * @param batch pointer to the batch
+ * @param format printf-like format of the nftables command, without the leading `nft`
+ * @param ... format arguments
+ * @return true if the command was added, false otherwise
+ */
+bool nft_batch_add(nft_batch_t *batch, const char *format, ...) __attribute__((format(printf, 2, 3)));
+
+/**
+ * @brief Discard a batch of nftables commands, without running it.
+ *
+ * @param batch pointer to the batch to discard
+ */
+void nft_batch_abort(nft_batch_t *batch);
+
+/**
+ * @brief Run a batch of nftables commands as a single transaction, then discard it.
+ * Either all the commands are applied, or none of them.
+ *
+ * @param batch pointer to the batch to run
+ * @return true if the batch was successfully applied, or is empty, false otherwise
+ */
+bool nft_batch_commit(nft_batch_t *batch);
+
+/**
+ * @brief Add the addition of an element to an nftables set to a batch.
+ *
+ * @param batch pointer to the batch
+ * @param nft_table nftables table containing the set, including its family (e.g. "netdev my-device")
+ * @param nft_set name of the nftables set
+ * @param element element to add, in nftables syntax
+ * @return true if the command was added to the batch, false otherwise
+ */
+bool nft_batch_add_element(nft_batch_t *batch, char *nft_table, char *nft_set, char *element);
+
+/**
+ * @brief Add the deletion of an element from an nftables set to a batch.
+ * Deleting an element which is not present has no effect.
+ *
+ * @param batch pointer to the batch
+ * @param nft_table nftables table containing the set, including its family (e.g. "netdev my-device")
+ * @param nft_set name of the nftables set
+ * @param element element to delete, in nftables syntax
+ * @return true if the commands were added to the batch, false otherwise
+ */
+bool nft_batch_delete_element(nft_batch_t *batch, char *nft_table, char *nft_set, char *element);
+
+/**
+ * @brief Add the addition of an IP address, with a timeout, to an nftables set to a batch.
+ * If the address is already present, its timeout is reset to the given one.
+ *
+ * @param batch pointer to the batch
+ * @param nft_table nftables table containing the set, including its family (e.g. "netdev my-device")
+ * @param nft_set name of the nftables set, with the `timeout` flag
+ * @param ip_addr IP (v4 or v6) address to add
+ * @param timeout time after which the address is removed from the set, in seconds (at least 1)
+ * @return true if the commands were added to the batch, false otherwise
+ */
+bool nft_batch_add_ip_element(nft_batch_t *batch, char *nft_table, char *nft_set, ip_addr_t ip_addr, uint32_t timeout);
+
+/**
+ * @brief Add an element to an nftables set.
+ * Adding an element which is already present has no effect.
+ *
+ * @param nft_table nftables table containing the set, including its family (e.g. "netdev my-device")
+ * @param nft_set name of the nftables set
+ * @param element element to add, in nftables syntax
+ * @return true if the element was successfully added, false otherwise
+ */
+bool nft_set_add_element(char *nft_table, char *nft_set, char *element);
+
+/**
+ * @brief Delete an element from an nftables set.
+ * Deleting an element which is not present has no effect.
+ *
+ * @param nft_table nftables table containing the set, including its family (e.g. "netdev my-device")
+ * @param nft_set name of the nftables set
+ * @param element element to delete, in nftables syntax
+ * @return true if the element was successfully deleted, false otherwise
+ */
+bool nft_set_delete_element(char *nft_table, char *nft_set, char *element);
+
 /**
  * @brief Delete an nftables rule.
  *
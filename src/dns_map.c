@@ -8,6 +8,7 @@
  * 
  */
 
+#include <inttypes.h>
 #include "dns_map.h"
 
 
@@ -50,8 +51,351 @@ static void dns_free(void *item) {
     free(((dns_entry_t *) item)->ip_list.ip_addresses);
 }
 
+/**
+ * Retrieve the current time of the monotonic clock,
+ * which is not affected by changes of the system time.
+ * 
+ * @return the current time, in seconds
+ */
+static time_t dns_map_now() {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec;
+}
+
+/**
+ * Compare function for IP addresses, defining the order of the addresses of a DNS table entry.
+ * IPv4 addresses come before IPv6 addresses, and addresses of the same version are sorted bytewise.
+ * 
+ * @param a first IP address to compare
+ * @param b second IP address to compare
+ * @return an integer which takes the following value:
+ *         - 0 if a and b are equal
+ *         - less than 0 if a is smaller than b
+ *         - greater than 0 if a is greater than b
+ */
+static int ip_compare(const void *a, const void *b) {
+    const ip_addr_t *ip_1 = (ip_addr_t *) a;
+    const ip_addr_t *ip_2 = (ip_addr_t *) b;
+    if (ip_1->version != ip_2->version) {
+        return ip_1->version < ip_2->version ? -1 : 1;
+    }
+    if (ip_1->version == 4) {
+        return memcmp(&(ip_1->value.ipv4), &(ip_2->value.ipv4), sizeof(uint32_t));
+    }
+    return memcmp(ip_1->value.ipv6, ip_2->value.ipv6, IPV6_ADDR_LENGTH);
+}
+
+/**
+ * Sort a list of IP addresses, and remove its duplicates, in place.
+ * 
+ * @param ip_list the list of IP addresses to process
+ */
+static void ip_list_normalize(ip_list_t *ip_list) {
+    if (ip_list->ip_count < 2) {
+        return;
+    }
+    qsort(ip_list->ip_addresses, ip_list->ip_count, sizeof(ip_addr_t), &ip_compare);
+    uint16_t count = 1;
+    for (uint16_t i = 1; i < ip_list->ip_count; i++) {
+        if (ip_compare(ip_list->ip_addresses + i, ip_list->ip_addresses + count - 1) != 0) {
+            *(ip_list->ip_addresses + count) = *(ip_list->ip_addresses + i);
+            count++;
+        }
+    }
+    ip_list->ip_count = count;
+}
+
+/**
+ * Hash function for the reverse DNS table.
+ * 
+ * @param item reverse DNS table entry to hash
+ * @param seed0 first seed
+ * @param seed1 second seed
+ * @return hash value for the given reverse DNS table entry
+ */
+static uint64_t dns_address_hash(const void *item, uint64_t seed0, uint64_t seed1) {
+    const dns_address_entry_t *entry = (dns_address_entry_t *) item;
+    if (entry->ip_address.version == 4) {
+        return hashmap_sip(&(entry->ip_address.value.ipv4), sizeof(uint32_t), seed0, seed1);
+    } else {
+        return hashmap_sip(entry->ip_address.value.ipv6, IPV6_ADDR_LENGTH, seed0, seed1);
+    }
+}
+
+/**
+ * Compare function for the reverse DNS table.
+ * 
+ * @param a first reverse DNS table entry to compare
+ * @param a second reverse DNS table entry to compare
+ * @param udata user data, unused
+ * @return 0 if a and b have the same IP address, 1 otherwise
+ */
+static int dns_address_compare(const void *a, const void *b, void *udata) {
+    const dns_address_entry_t *entry1 = (dns_address_entry_t *) a;
+    const dns_address_entry_t *entry2 = (dns_address_entry_t *) b;
+    return !compare_ip(entry1->ip_address, entry2->ip_address);
+}
+
+/**
+ * Set or clear the bit of a domain name ID, for a list of IP addresses, in the reverse DNS table.
+ * Addresses whose bitmask becomes empty are removed from the reverse DNS table.
+ * 
+ * @param table the DNS table to update
+ * @param id ID of the domain name
+ * @param ip_list list of IP addresses of the domain name
+ * @param set true to set the bit of the domain name ID, false to clear it
+ */
+static void dns_address_update(dns_map_t *table, uint16_t id, ip_list_t ip_list, bool set) {
+    size_t entry_size = sizeof(dns_address_entry_t) + table->mask_words * sizeof(uint64_t);
+    dns_address_entry_t *new_entry = (dns_address_entry_t *) malloc(entry_size);
+    if (new_entry == NULL) {
+        return;
+    }
+    uint16_t word = id / 64;
+    uint64_t bit = ((uint64_t) 1) << (id % 64);
+    for (uint16_t i = 0; i < ip_list.ip_count; i++) {
+        new_entry->ip_address = *(ip_list.ip_addresses + i);
+        dns_address_entry_t *entry = (dns_address_entry_t *) hashmap_get(table->addresses, new_entry);
+        if (set && entry != NULL) {
+            entry->domains[word] |= bit;
+        } else if (set) {
+            // New address
+            memset(new_entry->domains, 0, table->mask_words * sizeof(uint64_t));
+            new_entry->domains[word] = bit;
+            hashmap_set(table->addresses, new_entry);
+        } else if (entry != NULL) {
+            entry->domains[word] &= ~bit;
+            bool empty = true;
+            for (uint16_t w = 0; w < table->mask_words && empty; w++) {
+                empty = entry->domains[w] == 0;
+            }
+            if (empty) {
+                // Address does not belong to any domain name anymore
+                hashmap_delete(table->addresses, new_entry);
+            }
+        }
+    }
+    free(new_entry);
+}
+
+/**
+ * Compute the memory used by the entries of a DNS table.
+ * 
+ * @param table the DNS table
+ * @return the memory used by the entries, in bytes
+ */
+static size_t dns_map_memory(dns_map_t *table) {
+    return (hashmap_count(table->names) + table->num_ids) * sizeof(dns_entry_t)
+           + hashmap_count(table->addresses) * (sizeof(dns_address_entry_t) + table->mask_words * sizeof(uint64_t))
+           + table->addresses_memory;
+}
+
+/**
+ * Initialize a DNS table entry with a list of IP addresses,
+ * which is sorted and deduplicated, and valid for its TTL plus the table's grace period.
+ * 
+ * @param table the DNS table the entry belongs to
+ * @param entry the entry to initialize
+ * @param domain_name the domain name of the entry
+ * @param ip_list the list of IP addresses of the entry
+ * @param now current time, in seconds
+ */
+static void dns_entry_init(dns_map_t *table, dns_entry_t *entry, char *domain_name, ip_list_t ip_list, time_t now) {
+    ip_list_normalize(&ip_list);
+    entry->domain_name = domain_name;
+    entry->ip_list = ip_list;
+    entry->expiry = now + ip_list.ttl + table->ttl_grace;
+    entry->last_used = now;
+    table->addresses_memory += ip_list.ip_count * sizeof(ip_addr_t);
+}
+
+/**
+ * Check if an entry found by a lookup is valid, i.e. not expired,
+ * and update the lookup statistics accordingly.
+ * 
+ * @param table the DNS table the entry belongs to
+ * @param entry the entry found by the lookup, or NULL if no entry was found
+ * @param now current time, in seconds
+ * @return the entry if it is valid, NULL otherwise
+ */
+static dns_entry_t* dns_entry_lookup(dns_map_t *table, dns_entry_t *entry, time_t now) {
+    if (entry == NULL || entry->expiry <= now) {
+        __atomic_fetch_add(&(table->stats.misses), 1, __ATOMIC_RELAXED);
+        return NULL;
+    }
+    __atomic_store_n(&(entry->last_used), now, __ATOMIC_RELAXED);
+    __atomic_fetch_add(&(table->stats.hits), 1, __ATOMIC_RELAXED);
+    return entry;
+}
+
+/**
+ * Retrieve the entry of a domain name ID, if it is valid,
+ * and update the lookup statistics accordingly.
+ * The table lock must be held.
+ * 
+ * @param table the DNS table to retrieve the entry from
+ * @param id ID of the domain name
+ * @param now current time, in seconds
+ * @return the entry if it is valid, NULL otherwise
+ */
+static dns_entry_t* dns_map_lookup_id(dns_map_t *table, uint16_t id, time_t now) {
+    dns_entry_t *entry = id < table->num_ids && table->ids[id].domain_name != NULL ? table->ids + id : NULL;
+    return dns_entry_lookup(table, entry, now);
+}
+
+/**
+ * Remove a domain name discovered at runtime, and its IP addresses, from the DNS table.
+ * The table lock must be held for writing.
+ * 
+ * @param table the DNS table to remove the entry from
+ * @param domain_name the domain name of the entry to remove
+ */
+static void dns_map_remove_name(dns_map_t *table, char *domain_name) {
+    dns_entry_t *entry = hashmap_delete(table->names, &(dns_entry_t){ .domain_name = domain_name });
+    if (entry != NULL) {
+        table->addresses_memory -= entry->ip_list.ip_count * sizeof(ip_addr_t);
+        dns_free(entry);
+    }
+}
+
+/**
+ * Remove the entry of a domain name ID, and its IP addresses from the reverse DNS table.
+ * The table lock must be held for writing.
+ * 
+ * @param table the DNS table to remove the entry from
+ * @param id ID of the domain name
+ */
+static void dns_map_clear_id(dns_map_t *table, uint16_t id) {
+    dns_entry_t *entry = table->ids + id;
+    if (entry->domain_name == NULL) {
+        return;
+    }
+    dns_address_update(table, id, entry->ip_list, false);
+    table->addresses_memory -= entry->ip_list.ip_count * sizeof(ip_addr_t);
+    dns_free(entry);
+    memset(entry, 0, sizeof(dns_entry_t));
+    table->num_id_entries--;
+}
+
+/**
+ * Candidate entry for eviction from a DNS table.
+ * The candidates reference the entries by domain name or ID,
+ * as the addresses of the hashmap entries change when the hashmap is modified.
+ */
+typedef struct dns_eviction_candidate {
+    time_t expiry;      // Time after which the entry is expired
+    time_t last_used;   // Time of the last lookup of the entry
+    char *domain_name;  // Domain name of the entry
+    int32_t id;         // ID of the domain name, or -1 for a domain name discovered at runtime
+} dns_eviction_candidate_t;
+
+/**
+ * Remove a candidate entry from a DNS table.
+ * 
+ * @param table the DNS table to remove the entry from
+ * @param candidate the candidate entry to remove
+ */
+static void dns_map_evict_candidate(dns_map_t *table, dns_eviction_candidate_t *candidate) {
+    if (candidate->id < 0) {
+        dns_map_remove_name(table, candidate->domain_name);
+    } else {
+        dns_map_clear_id(table, candidate->id);
+    }
+}
+
+/**
+ * Restore the min-heap property, ordered by last use time, of an array of eviction candidates,
+ * by sifting down one of its elements.
+ * 
+ * @param heap array of eviction candidates
+ * @param size number of elements of the heap
+ * @param i index of the element to sift down
+ */
+static void dns_eviction_heap_sift_down(dns_eviction_candidate_t *heap, size_t size, size_t i) {
+    while (true) {
+        size_t smallest = i;
+        size_t left = 2 * i + 1;
+        size_t right = left + 1;
+        if (left < size && heap[left].last_used < heap[smallest].last_used) {
+            smallest = left;
+        }
+        if (right < size && heap[right].last_used < heap[smallest].last_used) {
+            smallest = right;
+        }
+        if (smallest == i) {
+            return;
+        }
+        dns_eviction_candidate_t tmp = heap[i];
+        heap[i] = heap[smallest];
+        heap[smallest] = tmp;
+        i = smallest;
+    }
+}
+
+/**
+ * Evict entries from a DNS table until it uses less memory than its ceiling:
+ * first the expired entries, in a single pass,
+ * then the least recently used ones, popped from a min-heap ordered by last use time.
+ * The table lock must be held for writing.
+ * 
+ * @param table the DNS table to evict entries from
+ * @param now current time, in seconds
+ */
+static void dns_map_evict(dns_map_t *table, time_t now) {
+    if (table->max_memory == 0 || dns_map_memory(table) <= table->max_memory) {
+        return;
+    }
+
+    // Snapshot the entries, as the hashmap cannot be modified while iterating over it
+    size_t num_candidates = 0;
+    dns_eviction_candidate_t *candidates = (dns_eviction_candidate_t *) malloc((hashmap_count(table->names) + table->num_id_entries) * sizeof(dns_eviction_candidate_t));
+    if (candidates == NULL) {
+        return;
+    }
+    size_t i = 0;
+    void *item;
+    while (hashmap_iter(table->names, &i, &item)) {
+        dns_entry_t *entry = (dns_entry_t *) item;
+        candidates[num_candidates++] = (dns_eviction_candidate_t) { entry->expiry, entry->last_used, entry->domain_name, -1 };
+    }
+    for (uint16_t id = 0; id < table->num_ids; id++) {
+        dns_entry_t *entry = table->ids + id;
+        if (entry->domain_name != NULL) {
+            candidates[num_candidates++] = (dns_eviction_candidate_t) { entry->expiry, entry->last_used, entry->domain_name, id };
+        }
+    }
+
+    // Evict expired entries, and keep the valid ones as candidates for the LRU eviction
+    size_t num_valid = 0;
+    for (i = 0; i < num_candidates; i++) {
+        if (candidates[i].expiry <= now) {
+            dns_map_evict_candidate(table, candidates + i);
+            table->stats.expirations++;
+        } else {
+            candidates[num_valid++] = candidates[i];
+        }
+    }
+
+    // Evict least recently used entries
+    if (dns_map_memory(table) > table->max_memory) {
+        for (i = num_valid / 2; i > 0; i--) {
+            dns_eviction_heap_sift_down(candidates, num_valid, i - 1);
+        }
+        while (num_valid > 0 && dns_map_memory(table) > table->max_memory) {
+            dns_map_evict_candidate(table, candidates);
+            table->stats.evictions++;
+            candidates[0] = candidates[--num_valid];
+            dns_eviction_heap_sift_down(candidates, num_valid, 0);
+        }
+    }
+
+    free(candidates);
+}
+
 /**
  * @brief Checks if a dns_entry_t structure contains a given IP address.
+ * The IP addresses of the entry are sorted, and searched by binary search.
  *
  * @param dns_entry pointer to the DNS entry to process
  * @param ip_address IP address to check the presence of
@@ -64,24 +408,32 @@ bool dns_entry_contains(dns_entry_t *dns_entry, ip_addr_t ip_address) {
     }
 
     // Not NULL, search for the IP address
-    for (uint8_t i = 0; i < dns_entry->ip_list.ip_count; i++) {
-        if (compare_ip(*(dns_entry->ip_list.ip_addresses + i), ip_address)) {
-            // IP address found
-            return true;
-        }
-    }
-    // IP address not found
-    return false;
+    return bsearch(&ip_address, dns_entry->ip_list.ip_addresses, dns_entry->ip_list.ip_count, sizeof(ip_addr_t), &ip_compare) != NULL;
 }
 
 /**
- * Create a new DNS table.
+ * Create a new DNS table, without domain name IDs.
  * Uses random seeds for the hash function.
  * 
  * @return the newly created DNS table, or NULL if creation failed
  */
 dns_map_t* dns_map_create() {
-    return hashmap_new(
+    return dns_map_create_with_ids(0);
+}
+
+/**
+ * Create a new DNS table, with entries for a given number of domain name IDs.
+ * Uses random seeds for the hash function.
+ * 
+ * @param num_ids number of domain names known at translation time, identified by IDs 0 to num_ids - 1
+ * @return the newly created DNS table, or NULL if creation failed
+ */
+dns_map_t* dns_map_create_with_ids(uint16_t num_ids) {
+    dns_map_t *table = (dns_map_t *) malloc(sizeof(dns_map_t));
+    if (table == NULL) {
+        return NULL;
+    }
+    table->names = hashmap_new(
         sizeof(dns_entry_t), // Size of one entry
         DNS_MAP_INIT_SIZE,   // Hashmap initial size
         rand(),              // Optional seed 1
@@ -91,6 +443,33 @@ dns_map_t* dns_map_create() {
         &dns_free,           // Element free function
         NULL                 // User data, unused
     );
+    table->num_ids = num_ids;
+    table->ids = num_ids > 0 ? (dns_entry_t *) calloc(num_ids, sizeof(dns_entry_t)) : NULL;
+    table->mask_words = (num_ids + 63) / 64;
+    table->addresses = hashmap_new(
+        sizeof(dns_address_entry_t) + table->mask_words * sizeof(uint64_t),  // Size of one entry
+        DNS_MAP_INIT_SIZE,     // Hashmap initial size
+        rand(),                // Optional seed 1
+        rand(),                // Optional seed 2
+        &dns_address_hash,     // Hash function
+        &dns_address_compare,  // Compare function
+        NULL,                  // Element free function, unused
+        NULL                   // User data, unused
+    );
+    table->ttl_grace = DNS_MAP_TTL_GRACE;
+    table->max_memory = DNS_MAP_MAX_MEMORY;
+    table->addresses_memory = 0;
+    table->num_id_entries = 0;
+    memset(&(table->stats), 0, sizeof(dns_map_stats_t));
+    if (table->names == NULL || (num_ids > 0 && table->ids == NULL) || table->addresses == NULL
+        || pthread_rwlock_init(&(table->lock), NULL) != 0) {
+        hashmap_free(table->names);
+        hashmap_free(table->addresses);
+        free(table->ids);
+        free(table);
+        return NULL;
+    }
+    return table;
 }
 
 /**
@@ -99,19 +478,71 @@ dns_map_t* dns_map_create() {
  * @param table the DNS table to free
  */
 void dns_map_free(dns_map_t *table) {
-    hashmap_free(table);
+    if (table == NULL) {
+        return;
+    }
+    hashmap_free(table->names);
+    hashmap_free(table->addresses);
+    for (uint16_t id = 0; id < table->num_ids; id++) {
+        dns_free(table->ids + id);
+    }
+    free(table->ids);
+    pthread_rwlock_destroy(&(table->lock));
+    free(table);
 }
 
 /**
  * Add IP addresses corresponding to a given domain name in the DNS table.
  * If the domain name was already present, its IP addresses will be replaced by the new ones.
+ * The entry expires after the TTL of the IP address list,
+ * and entries are evicted if the table exceeds its memory ceiling.
  *
  * @param table the DNS table to add the entry to
  * @param domain_name the domain name of the entry
  * @param ip_list an ip_list_t structure containing the list of IP addresses
  */
 void dns_map_add(dns_map_t *table, char *domain_name, ip_list_t ip_list) {
-    hashmap_set(table, &(dns_entry_t){ .domain_name = domain_name, .ip_list = ip_list });
+    time_t now = dns_map_now();
+    dns_entry_t entry;
+    pthread_rwlock_wrlock(&(table->lock));
+    dns_entry_init(table, &entry, domain_name, ip_list, now);
+    dns_entry_t *old_entry = (dns_entry_t *) hashmap_set(table->names, &entry);
+    if (old_entry != NULL) {
+        table->addresses_memory -= old_entry->ip_list.ip_count * sizeof(ip_addr_t);
+        dns_free(old_entry);
+    }
+    dns_map_evict(table, now);
+    pthread_rwlock_unlock(&(table->lock));
+}
+
+/**
+ * Add IP addresses corresponding to a domain name known at translation time in the DNS table.
+ * If the domain name was already present, its IP addresses will be replaced by the new ones.
+ * The reverse DNS table is updated accordingly.
+ * The entry expires after the TTL of the IP address list,
+ * and entries are evicted if the table exceeds its memory ceiling.
+ * Adding an unknown ID has no effect, and frees the IP addresses.
+ *
+ * @param table the DNS table to add the entry to
+ * @param id ID of the domain name
+ * @param domain_name the domain name of the entry, which must outlive the entry
+ * @param ip_list an ip_list_t structure containing the list of IP addresses
+ */
+void dns_map_add_id(dns_map_t *table, uint16_t id, char *domain_name, ip_list_t ip_list) {
+    if (id >= table->num_ids) {
+        fprintf(stderr, "Unknown domain name ID %hu for %s\n", id, domain_name);
+        free(ip_list.ip_addresses);
+        return;
+    }
+    time_t now = dns_map_now();
+    pthread_rwlock_wrlock(&(table->lock));
+    dns_map_clear_id(table, id);
+    dns_entry_t *entry = table->ids + id;
+    dns_entry_init(table, entry, domain_name, ip_list, now);
+    table->num_id_entries++;
+    dns_address_update(table, id, entry->ip_list, true);
+    dns_map_evict(table, now);
+    pthread_rwlock_unlock(&(table->lock));
 }
 
 /**
@@ -121,21 +552,97 @@ void dns_map_add(dns_map_t *table, char *domain_name, ip_list_t ip_list) {
  * @param domain_name the domain name of the entry to remove
  */
 void dns_map_remove(dns_map_t *table, char *domain_name) {
-    dns_entry_t *entry = hashmap_delete(table, &(dns_entry_t){ .domain_name = domain_name });
-    if (entry != NULL)
-        dns_free(entry);
+    pthread_rwlock_wrlock(&(table->lock));
+    dns_map_remove_name(table, domain_name);
+    pthread_rwlock_unlock(&(table->lock));
 }
 
 /**
  * Retrieve the IP addresses corresponding to a given domain name in the DNS table.
+ * The entry is only valid until the next modification of the table.
  * 
  * @param table the DNS table to retrieve the entry from
  * @param domain_name the domain name of the entry to retrieve
  * @return a pointer to a dns_entry structure containing the IP addresses corresponding to the domain name,
- *         or NULL if the domain name was not found in the DNS table
+ *         or NULL if the domain name was not found in the DNS table, or its entry is expired
  */
 dns_entry_t* dns_map_get(dns_map_t *table, char *domain_name) {
-    return (dns_entry_t *) hashmap_get(table, &(dns_entry_t){ .domain_name = domain_name });
+    time_t now = dns_map_now();
+    pthread_rwlock_rdlock(&(table->lock));
+    dns_entry_t *entry = (dns_entry_t *) hashmap_get(table->names, &(dns_entry_t){ .domain_name = domain_name });
+    entry = dns_entry_lookup(table, entry, now);
+    pthread_rwlock_unlock(&(table->lock));
+    return entry;
+}
+
+/**
+ * Retrieve the IP addresses corresponding to a domain name known at translation time in the DNS table,
+ * in constant time, without hashing nor comparing the domain name.
+ * The entry is only valid until the next modification of the table.
+ * 
+ * @param table the DNS table to retrieve the entry from
+ * @param id ID of the domain name
+ * @return a pointer to a dns_entry structure containing the IP addresses corresponding to the domain name,
+ *         or NULL if the domain name was not added to the DNS table yet, or its entry is expired
+ */
+dns_entry_t* dns_map_get_id(dns_map_t *table, uint16_t id) {
+    time_t now = dns_map_now();
+    pthread_rwlock_rdlock(&(table->lock));
+    dns_entry_t *entry = dns_map_lookup_id(table, id, now);
+    pthread_rwlock_unlock(&(table->lock));
+    return entry;
+}
+
+/**
+ * Check if an IP address was resolved for a domain name known at translation time,
+ * while holding the table lock, so that the entry cannot be replaced or evicted during the search.
+ * 
+ * @param table the DNS table to search in
+ * @param id ID of the domain name
+ * @param ip_address IP address to check the presence of
+ * @return true if the IP address belongs to the domain name, false otherwise
+ */
+bool dns_map_contains_id(dns_map_t *table, uint16_t id, ip_addr_t ip_address) {
+    time_t now = dns_map_now();
+    pthread_rwlock_rdlock(&(table->lock));
+    bool found = dns_entry_contains(dns_map_lookup_id(table, id, now), ip_address);
+    pthread_rwlock_unlock(&(table->lock));
+    return found;
+}
+
+/**
+ * Check if an IP address was resolved for any of a set of domain names known at translation time,
+ * with a single lookup in the reverse DNS table, whatever the number of domain names.
+ * 
+ * @param table the DNS table to search in
+ * @param ip_address IP address to check the presence of
+ * @param mask bitmask of the domain name IDs to check, of `(num_ids + 63) / 64` words
+ * @return true if the IP address belongs to one of the domain names, false otherwise
+ */
+bool dns_map_contains_ip(dns_map_t *table, ip_addr_t ip_address, const uint64_t *mask) {
+    time_t now = dns_map_now();
+    bool found = false;
+    pthread_rwlock_rdlock(&(table->lock));
+    dns_address_entry_t key = { .ip_address = ip_address };
+    dns_address_entry_t *entry = (dns_address_entry_t *) hashmap_get(table->addresses, &key);
+    if (entry != NULL) {
+        for (uint16_t w = 0; w < table->mask_words && !found; w++) {
+            // The address matches if one of the domain names it was resolved for is in the set, and is not expired
+            uint64_t candidates = entry->domains[w] & mask[w];
+            while (candidates != 0) {
+                dns_entry_t *dns_entry = table->ids + w * 64 + __builtin_ctzll(candidates);
+                if (dns_entry->expiry > now) {
+                    __atomic_store_n(&(dns_entry->last_used), now, __ATOMIC_RELAXED);
+                    found = true;
+                    break;
+                }
+                candidates &= candidates - 1;
+            }
+        }
+    }
+    pthread_rwlock_unlock(&(table->lock));
+    __atomic_fetch_add(found ? &(table->stats.hits) : &(table->stats.misses), 1, __ATOMIC_RELAXED);
+    return found;
 }
 
 /**
@@ -148,5 +655,42 @@ dns_entry_t* dns_map_get(dns_map_t *table, char *domain_name) {
  *         or NULL if the domain name was not found in the DNS table
  */
 dns_entry_t* dns_map_pop(dns_map_t *table, char *domain_name) {
-    return (dns_entry_t *) hashmap_delete(table, &(dns_entry_t){ .domain_name = domain_name });
+    pthread_rwlock_wrlock(&(table->lock));
+    dns_entry_t *entry = (dns_entry_t *) hashmap_delete(table->names, &(dns_entry_t){ .domain_name = domain_name });
+    if (entry != NULL) {
+        table->addresses_memory -= entry->ip_list.ip_count * sizeof(ip_addr_t);
+    }
+    pthread_rwlock_unlock(&(table->lock));
+    return entry;
+}
+
+/**
+ * Retrieve the statistics of a DNS table.
+ * 
+ * @param table the DNS table to retrieve the statistics of
+ * @return the statistics of the DNS table
+ */
+dns_map_stats_t dns_map_get_stats(dns_map_t *table) {
+    pthread_rwlock_rdlock(&(table->lock));
+    dns_map_stats_t stats = table->stats;
+    stats.entries = hashmap_count(table->names) + table->num_id_entries;
+    stats.memory = dns_map_memory(table);
+    stats.hits = __atomic_load_n(&(table->stats.hits), __ATOMIC_RELAXED);
+    stats.misses = __atomic_load_n(&(table->stats.misses), __ATOMIC_RELAXED);
+    pthread_rwlock_unlock(&(table->lock));
+    return stats;
+}
+
+/**
+ * Print the statistics of a DNS table on the standard output.
+ * The statistics are read under the table lock, but printed after releasing it.
+ * 
+ * @param table the DNS table to print the statistics of
+ */
+void dns_map_print_stats(dns_map_t *table) {
+    dns_map_stats_t stats = dns_map_get_stats(table);
+    uint64_t lookups = stats.hits + stats.misses;
+    printf("DNS map: %zu entries, %zu bytes, hit rate %.1f%% (%" PRIu64 " hits, %" PRIu64 " misses), %" PRIu64 " expirations, %" PRIu64 " evictions\n",
+           stats.entries, stats.memory, lookups > 0 ? 100.0 * stats.hits / lookups : 0.0,
+           stats.hits, stats.misses, stats.expirations, stats.evictions);
 }
@@ -8,6 +8,7 @@
  * 
  */
 
+#define _GNU_SOURCE  // recvmmsg
 #include "nfqueue.h"
 
 
@@ -26,6 +27,24 @@ int get_pkt_id(struct nfq_data *nfad) {
 	return -1;
 }
 
+/**
+ * @brief Send the pending batch verdict of a queue, if any.
+ *
+ * @param qh queue handle
+ * @param callback_struct callback structure of the queue, containing the pending batch verdict
+ * @return -1 on error, >= 0 otherwise
+ */
+static int nfqueue_flush_verdict(struct nfq_q_handle *qh, callback_struct_t *callback_struct) {
+	if (!callback_struct->has_pending) {
+		return 0;
+	}
+	callback_struct->has_pending = false;
+	if (callback_struct->stats != NULL) {
+		__atomic_add_fetch(&callback_struct->stats->verdicts, 1, __ATOMIC_RELAXED);
+	}
+	return nfq_set_verdict_batch(qh, callback_struct->pending_id, callback_struct->pending_verdict);
+}
+
 /**
  * @brief Full callback function, compliant to the nfq_callback type.
  * 
@@ -44,10 +63,156 @@ int nfqueue_callback(struct nfq_q_handle *qh, struct nfgenmsg *nfmsg, struct nfq
     // Get packet payload
     uint8_t *payload;
     int length = nfq_get_payload(nfad, &payload);
-    if (length >= 0) {
-		verdict = (*(((callback_struct_t *) data)->func))(pkt_id, length, payload, ((callback_struct_t *) data)->arg);
+	callback_struct_t *callback_struct = (callback_struct_t *) data;
+	basic_callback *func = callback_struct->func;
+	void *arg = callback_struct->arg;
+	dispatch_table_t *dispatch = callback_struct->dispatch;
+	if (dispatch != NULL) {
+		// Shared queue: the packet mark, set by the policy's nftables rule, selects the callback function
+		uint32_t mark = nfq_get_nfmark(nfad);
+		if (mark < dispatch->num_entries && dispatch->funcs[mark] != NULL) {
+			func = dispatch->funcs[mark];
+			arg = dispatch->args[mark];
+		} else {
+			func = NULL;
+			verdict = dispatch->default_verdict;
+		}
+	}
+    if (length >= 0 && func != NULL) {
+		verdict = (*func)(pkt_id, length, payload, arg);
+	}
+	if (callback_struct->stats != NULL) {
+		__atomic_add_fetch(&callback_struct->stats->packets, 1, __ATOMIC_RELAXED);
+		if (verdict == NF_DROP) {
+			__atomic_add_fetch(&callback_struct->stats->dropped, 1, __ATOMIC_RELAXED);
+		}
+	}
+	if (!callback_struct->batch_verdicts) {
+		// The payload is not modified, hence not sent back to the kernel:
+		// it would replace the packet with its copied part, when the copy range is partial
+		return nfq_set_verdict(qh, pkt_id, verdict, 0, NULL);
+	}
+	// Batch mode: extend the pending batch verdict if it is equal,
+	// otherwise send it first, then start a new batch.
+	// Packets are handled in order, so a batch verdict covers exactly the packets of the batch.
+	int ret = 0;
+	if (callback_struct->has_pending && callback_struct->pending_verdict != verdict) {
+		ret = nfqueue_flush_verdict(qh, callback_struct);
 	}
-	return nfq_set_verdict(qh, pkt_id, verdict, length, payload);
+	callback_struct->has_pending = true;
+	callback_struct->pending_id = pkt_id;
+	callback_struct->pending_verdict = verdict;
+	return ret;
+}
+
+/**
+ * @brief Print the statistics of a queue.
+ *
+ * @param fp file to print to
+ * @param queue_num number of the queue
+ * @param stats queue statistics
+ */
+void nfqueue_stats_print(FILE *fp, uint16_t queue_num, nfqueue_stats_t *stats) {
+	fprintf(fp, "queue %hu: %" PRIu64 " packets, %" PRIu64 " dropped, %" PRIu64 " verdicts, %" PRIu64 " ENOBUFS\n",
+		queue_num,
+		__atomic_load_n(&stats->packets, __ATOMIC_RELAXED),
+		__atomic_load_n(&stats->dropped, __ATOMIC_RELAXED),
+		__atomic_load_n(&stats->verdicts, __ATOMIC_RELAXED),
+		__atomic_load_n(&stats->enobufs, __ATOMIC_RELAXED));
+}
+
+/**
+ * @brief Receive and handle packets in the default mode,
+ * one message per system call, with one verdict per packet.
+ *
+ * @param h library handle
+ * @param fd netlink socket file descriptor
+ */
+static void nfqueue_loop(struct nfq_handle *h, int fd) {
+	int rv;
+	char buf[4096] __attribute__ ((aligned));
+
+	while (1) {
+		if ((rv = recv(fd, buf, sizeof(buf), 0)) >= 0) {
+			//printf("pkt received\n");
+			nfq_handle_packet(h, buf, rv);
+			continue;
+		}
+		/* if your application is too slow to digest the packets that
+		 * are sent from kernel-space, the socket buffer that we use
+		 * to enqueue packets may fill up returning ENOBUFS. Depending
+		 * on your application, this error may be ignored. Please, see
+		 * the doxygen documentation of this library on how to improve
+		 * this situation.
+		 */
+		if (rv < 0 && errno == ENOBUFS) {
+			printf("losing packets!\n");
+			continue;
+		}
+		perror("recv failed");
+		break;
+	}
+}
+
+/**
+ * @brief Receive and handle packets in high-throughput mode,
+ * draining multiple messages per system call, and batching the verdicts.
+ *
+ * @param h library handle
+ * @param qh queue handle
+ * @param fd netlink socket file descriptor
+ * @param queue_num number of the queue
+ * @param callback_struct callback structure of the queue
+ * @param config high-throughput mode configuration
+ */
+static void nfqueue_loop_batch(struct nfq_handle *h, struct nfq_q_handle *qh, int fd, uint16_t queue_num, callback_struct_t *callback_struct, nfqueue_config_t *config) {
+	uint16_t batch_size = config->batch_size;
+	nfqueue_stats_t *stats = callback_struct->stats;
+
+	// Allocate the message buffers
+	char *bufs = malloc((size_t) batch_size * NFQUEUE_MSG_BUFSIZE);
+	struct iovec *iovecs = calloc(batch_size, sizeof(struct iovec));
+	struct mmsghdr *msgs = calloc(batch_size, sizeof(struct mmsghdr));
+	if (bufs == NULL || iovecs == NULL || msgs == NULL) {
+		fprintf(stderr, "Failed to allocate the message buffers of queue %hu\n", queue_num);
+		free(bufs);
+		free(iovecs);
+		free(msgs);
+		return;
+	}
+	for (uint16_t i = 0; i < batch_size; i++) {
+		iovecs[i].iov_base = bufs + (size_t) i * NFQUEUE_MSG_BUFSIZE;
+		iovecs[i].iov_len = NFQUEUE_MSG_BUFSIZE;
+		msgs[i].msg_hdr.msg_iov = &iovecs[i];
+		msgs[i].msg_hdr.msg_iovlen = 1;
+	}
+
+	time_t last_report = time(NULL);
+	while (1) {
+		// Block until at least one message is available, then drain the available ones
+		int rv = recvmmsg(fd, msgs, batch_size, MSG_WAITFORONE, NULL);
+		if (rv >= 0) {
+			for (int i = 0; i < rv; i++) {
+				nfq_handle_packet(h, (char *) iovecs[i].iov_base, msgs[i].msg_len);
+			}
+			nfqueue_flush_verdict(qh, callback_struct);
+		} else if (errno == ENOBUFS) {
+			// Receive buffer overrun: packets were lost (or accepted, if the queue fails open)
+			__atomic_add_fetch(&stats->enobufs, 1, __ATOMIC_RELAXED);
+		} else if (errno != EINTR) {
+			perror("recvmmsg failed");
+			break;
+		}
+		// Periodic statistics report
+		if (config->stats_interval > 0 && time(NULL) - last_report >= config->stats_interval) {
+			last_report = time(NULL);
+			nfqueue_stats_print(stderr, queue_num, stats);
+		}
+	}
+
+	free(bufs);
+	free(iovecs);
+	free(msgs);
 }
 
 /**
@@ -60,14 +225,38 @@ int nfqueue_callback(struct nfq_q_handle *qh, struct nfgenmsg *nfmsg, struct nfq
  *     uint32_t callback(int pkt_id, uint8_t *payload, void *arg)
  * @param arg the argument to pass to the basic callback function
  */
-void bind_queue(uint16_t queue_num, basic_callback *callback, void *arg)
+void bind_queue(uint16_t queue_num, basic_callback *callback, void *arg) {
+	bind_queue_config(queue_num, callback, arg, 0, NULL, NULL);
+}
+
+/**
+ * Bind queue to a basic callback function or a dispatch table,
+ * with an optional high-throughput configuration, and wait for packets.
+ *
+ * @param queue_num the number of the queue to bind to
+ * @param callback the basic callback funtion, called upon packet reception (unused if dispatch is set)
+ * @param arg the argument to pass to the basic callback function (unused if dispatch is set)
+ * @param dispatch dispatch table selecting the callback function from the packet mark, or NULL
+ * @param copy_range number of bytes of each packet copied to userspace, or 0 for the whole packet
+ * @param config high-throughput mode configuration, or NULL for the default mode
+ * @param stats queue statistics, updated in high-throughput mode, or NULL if not needed by the caller
+ */
+static void bind_queue_internal(uint16_t queue_num, basic_callback *callback, void *arg, dispatch_table_t *dispatch, uint16_t copy_range, nfqueue_config_t *config, nfqueue_stats_t *stats)
 {
 	struct nfq_handle *h;
 	struct nfq_q_handle *qh;
 	int fd;
-	int rv;
-	char buf[4096] __attribute__ ((aligned));
 
+	// Apply the default values of the unset high-throughput parameters
+	nfqueue_config_t high_throughput;
+	nfqueue_stats_t local_stats = {0};
+	if (config != NULL) {
+		high_throughput = *config;
+		high_throughput.rcvbuf = high_throughput.rcvbuf ? high_throughput.rcvbuf : NFQUEUE_DEFAULT_RCVBUF;
+		high_throughput.queue_maxlen = high_throughput.queue_maxlen ? high_throughput.queue_maxlen : NFQUEUE_DEFAULT_QUEUE_MAXLEN;
+		high_throughput.batch_size = high_throughput.batch_size ? high_throughput.batch_size : NFQUEUE_DEFAULT_BATCH_SIZE;
+		stats = stats != NULL ? stats : &local_stats;
+	}
 
 	printf("opening library handle\n");
 	h = nfq_open();
@@ -93,14 +282,19 @@ void bind_queue(uint16_t queue_num, basic_callback *callback, void *arg)
 	callback_struct_t callback_struct;
 	callback_struct.func = callback;
 	callback_struct.arg = arg;
+	callback_struct.dispatch = dispatch;
+	callback_struct.stats = config != NULL ? stats : NULL;
+	callback_struct.batch_verdicts = config != NULL;
+	callback_struct.has_pending = false;
 	qh = nfq_create_queue(h, queue_num, &nfqueue_callback, &callback_struct);
 	if (!qh) {
 		fprintf(stderr, "error during nfq_create_queue()\n");
 		exit(1);
 	}
 
-	printf("setting copy_packet mode\n");
-	if (nfq_set_mode(qh, NFQNL_COPY_PACKET, 0xffff) < 0) {
+	copy_range = copy_range ? copy_range : NFQUEUE_COPY_RANGE_FULL;
+	printf("setting copy_packet mode, with copy range %hu\n", copy_range);
+	if (nfq_set_mode(qh, NFQNL_COPY_PACKET, copy_range) < 0) {
 		fprintf(stderr, "can't set packet_copy mode\n");
 		exit(1);
 	}
@@ -117,29 +311,32 @@ void bind_queue(uint16_t queue_num, basic_callback *callback, void *arg)
 				"retrieve security context.\n");
 	}
 
+	if (config != NULL) {
+		printf("setting queue length to %u packets\n", high_throughput.queue_maxlen);
+		if (nfq_set_queue_maxlen(qh, high_throughput.queue_maxlen) < 0) {
+			fprintf(stderr, "can't set queue length\n");
+		}
+
+		printf("setting receive buffer size to %u bytes\n", high_throughput.rcvbuf);
+		nfnl_rcvbufsiz(nfq_nfnlh(h), high_throughput.rcvbuf);
+
+		if (high_throughput.fail_open) {
+			printf("setting flags to accept packets when the queue is full\n");
+			if (nfq_set_queue_flags(qh, NFQA_CFG_F_FAIL_OPEN, NFQA_CFG_F_FAIL_OPEN)) {
+				fprintf(stderr, "This kernel version does not allow to "
+						"fail open.\n");
+			}
+		}
+	}
+
 	printf("Waiting for packets...\n");
 
 	fd = nfq_fd(h);
 
-	while (1) {
-		if ((rv = recv(fd, buf, sizeof(buf), 0)) >= 0) {
-			//printf("pkt received\n");
-			nfq_handle_packet(h, buf, rv);
-			continue;
-		}
-		/* if your application is too slow to digest the packets that
-		 * are sent from kernel-space, the socket buffer that we use
-		 * to enqueue packets may fill up returning ENOBUFS. Depending
-		 * on your application, this error may be ignored. Please, see
-		 * the doxygen documentation of this library on how to improve
-		 * this situation.
-		 */
-		if (rv < 0 && errno == ENOBUFS) {
-			printf("losing packets!\n");
-			continue;
-		}
-		perror("recv failed");
-		break;
+	if (config != NULL) {
+		nfqueue_loop_batch(h, qh, fd, queue_num, &callback_struct, &high_throughput);
+	} else {
+		nfqueue_loop(h, fd);
 	}
 
 	printf("unbinding from queue %d\n", queue_num);
@@ -156,6 +353,37 @@ void bind_queue(uint16_t queue_num, basic_callback *callback, void *arg)
 	nfq_close(h);
 }
 
+/**
+ * Bind queue to callback function, with an optional high-throughput configuration,
+ * and wait for packets.
+ *
+ * @param queue_num the number of the queue to bind to
+ * @param callback the basic callback funtion, called upon packet reception
+ * @param arg the argument to pass to the basic callback function
+ * @param copy_range number of bytes of each packet copied to userspace, or 0 for the whole packet
+ * @param config high-throughput mode configuration, or NULL for the default mode
+ * @param stats queue statistics, updated in high-throughput mode, or NULL if not needed by the caller
+ */
+void bind_queue_config(uint16_t queue_num, basic_callback *callback, void *arg, uint16_t copy_range, nfqueue_config_t *config, nfqueue_stats_t *stats)
+{
+	bind_queue_internal(queue_num, callback, arg, NULL, copy_range, config, stats);
+}
+
+/**
+ * Bind a queue shared by multiple policies to a dispatch table,
+ * and wait for packets.
+ *
+ * @param queue_num the number of the queue to bind to
+ * @param dispatch the dispatch table
+ * @param copy_range number of bytes of each packet copied to userspace, or 0 for the whole packet
+ * @param config high-throughput mode configuration, or NULL for the default mode
+ * @param stats queue statistics, updated in high-throughput mode, or NULL if not needed by the caller
+ */
+void bind_queue_dispatch(uint16_t queue_num, dispatch_table_t *dispatch, uint16_t copy_range, nfqueue_config_t *config, nfqueue_stats_t *stats)
+{
+	bind_queue_internal(queue_num, NULL, NULL, dispatch, copy_range, config, stats);
+}
+
 /**
  * @brief pthread wrapper for bind_queue.
  * 
@@ -164,6 +392,10 @@ void bind_queue(uint16_t queue_num, basic_callback *callback, void *arg)
  */
 void* nfqueue_thread(void *arg) {
 	thread_arg_t *thread_arg = (thread_arg_t *) arg;
-	bind_queue(thread_arg->queue_id, thread_arg->func, thread_arg->arg);
+	if (thread_arg->dispatch != NULL) {
+		bind_queue_dispatch(thread_arg->queue_id, thread_arg->dispatch, thread_arg->copy_range, thread_arg->config, thread_arg->stats);
+	} else {
+		bind_queue_config(thread_arg->queue_id, thread_arg->func, thread_arg->arg, thread_arg->copy_range, thread_arg->config, thread_arg->stats);
+	}
 	return NULL;
 }
@@ -266,3 +266,75 @@ bool compare_ip(ip_addr_t ip_1, ip_addr_t ip_2) {
         return false;
     }
 }
+
+/**
+ * @brief Check if an IP (v4 or v6) address belongs to an IP prefix.
+ *
+ * @param prefix IP prefix
+ * @param ip_addr IP address
+ * @return true if the address belongs to the prefix, false otherwise
+ */
+bool ip_prefix_contains(ip_prefix_t prefix, ip_addr_t ip_addr) {
+    if (prefix.address.version != ip_addr.version) {
+        return false;
+    }
+    if (ip_addr.version == 4) {
+        return (ip_addr.value.ipv4 & prefix.mask.ipv4) == prefix.address.value.ipv4;
+    }
+    for (uint8_t i = 0; i < IPV6_ADDR_LENGTH; i++) {
+        if ((ip_addr.value.ipv6[i] & prefix.mask.ipv6[i]) != prefix.address.value.ipv6[i]) {
+            return false;
+        }
+    }
+    return true;
+}
+
+/**
+ * @brief Compute the 32-bit FNV-1a hash of a string.
+ *
+ * @param string the string to hash
+ * @return the hash of the string
+ */
+uint32_t string_hash(char *string) {
+    uint32_t hash = FNV_OFFSET_BASIS;
+    for (; *string != '\0'; string++) {
+        hash ^= (uint8_t) *string;
+        hash *= FNV_PRIME;
+    }
+    return hash;
+}
+
+/**
+ * @brief Check if a string set contains a given string.
+ *
+ * The string is hashed once, the hash is searched by binary search,
+ * and only the strings with the same hash are compared.
+ *
+ * @param set the string set
+ * @param string the string to search for
+ * @return true if the string is in the set, false otherwise
+ */
+bool string_set_contains(const string_set_t *set, char *string) {
+    if (string == NULL) {
+        return false;
+    }
+    uint32_t hash = string_hash(string);
+    // Binary search of the first string with the given hash
+    uint16_t low = 0;
+    uint16_t high = set->count;
+    while (low < high) {
+        uint16_t mid = low + (high - low) / 2;
+        if ((set->entries + mid)->hash < hash) {
+            low = mid + 1;
+        } else {
+            high = mid;
+        }
+    }
+    // Compare the strings with the same hash
+    for (uint16_t i = low; i < set->count && (set->entries + i)->hash == hash; i++) {
+        if (strcmp((set->entries + i)->value, string) == 0) {
+            return true;
+        }
+    }
+    return false;
+}
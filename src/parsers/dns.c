@@ -258,6 +258,103 @@ bool dns_contains_domain_name(dns_question_t *questions, uint16_t qdcount, char
     return false;
 }
 
+/**
+ * @brief Compute the hash of a domain name.
+ *
+ * The hash is the 32-bit FNV-1a hash of the domain name characters, in reverse order,
+ * such that the hashes of all the suffixes of a domain name are computed in a single pass.
+ *
+ * @param domain_name the domain name to hash
+ * @return the hash of the domain name
+ */
+uint32_t dns_domain_hash(char *domain_name) {
+    uint32_t hash = FNV_OFFSET_BASIS;
+    for (size_t i = strlen(domain_name); i > 0; i--) {
+        hash ^= (uint8_t) domain_name[i - 1];
+        hash *= FNV_PRIME;
+    }
+    return hash;
+}
+
+/**
+ * @brief Search for a pattern in a domain set.
+ *
+ * @param set the domain set
+ * @param hash hash of the domain name to search for
+ * @param wildcard whether to search for a wildcard pattern
+ * @param domain_name the domain name to search for
+ * @return the pattern, or NULL if it is not in the set
+ */
+static const dns_domain_pattern_t* dns_domain_set_find(const dns_domain_set_t *set, uint32_t hash, bool wildcard, char *domain_name) {
+    // Binary search of the first pattern with the given hash
+    uint16_t low = 0;
+    uint16_t high = set->count;
+    while (low < high) {
+        uint16_t middle = low + (high - low) / 2;
+        if (set->patterns[middle].hash < hash) {
+            low = middle + 1;
+        } else {
+            high = middle;
+        }
+    }
+    // Compare the domain names of the patterns with the given hash, to rule out collisions
+    for (; low < set->count && set->patterns[low].hash == hash; low++) {
+        if (set->patterns[low].wildcard == wildcard && strcmp(set->patterns[low].domain_name, domain_name) == 0) {
+            return set->patterns + low;
+        }
+    }
+    return NULL;
+}
+
+/**
+ * @brief Search for the pattern of a domain set matching a domain name.
+ *
+ * The domain name is hashed from its end,
+ * and the wildcard patterns are searched for at each label boundary,
+ * such that the domain name is read only once.
+ * The most specific pattern is returned:
+ * the exact domain name if the set contains it, otherwise the wildcard with the longest suffix.
+ *
+ * @param set the domain set
+ * @param domain_name the domain name to search for
+ * @return the pattern matching the domain name, or NULL if no pattern matches
+ */
+const dns_domain_pattern_t* dns_domain_set_lookup(const dns_domain_set_t *set, char *domain_name) {
+    const dns_domain_pattern_t *wildcard_pattern = NULL;
+    uint32_t hash = FNV_OFFSET_BASIS;
+    for (size_t i = strlen(domain_name); i > 0; i--) {
+        // Label boundary, preceded by a non-empty label: the hash covers the suffix after the dot
+        if (domain_name[i - 1] == '.' && set->has_wildcards && i > 1) {
+            // Suffixes are searched for from the shortest, so a match replaces any previous one
+            const dns_domain_pattern_t *pattern = dns_domain_set_find(set, hash, true, domain_name + i);
+            if (pattern != NULL) {
+                wildcard_pattern = pattern;
+            }
+        }
+        hash ^= (uint8_t) domain_name[i - 1];
+        hash *= FNV_PRIME;
+    }
+    const dns_domain_pattern_t *exact_pattern = dns_domain_set_find(set, hash, false, domain_name);
+    return exact_pattern != NULL ? exact_pattern : wildcard_pattern;
+}
+
+/**
+ * @brief Search for a domain name matching a domain set in a DNS Questions list.
+ *
+ * @param questions DNS Questions list
+ * @param qdcount number of Questions in the list
+ * @param set the domain set
+ * @return true if a domain name of the Questions list matches a pattern of the set, false otherwise
+ */
+bool dns_contains_domain_set(dns_question_t *questions, uint16_t qdcount, const dns_domain_set_t *set) {
+    for (uint16_t i = 0; i < qdcount; i++) {
+        if (dns_domain_set_lookup(set, (questions + i)->qname) != NULL) {
+            return true;
+        }
+    }
+    return false;
+}
+
 /**
  * @brief Search for a specific domain name in a DNS Questions list.
  * 
@@ -284,15 +381,23 @@ dns_question_t* dns_get_question(dns_question_t *questions, uint16_t qdcount, ch
  * @param answers DNS Answers list to search in
  * @param ancount number of Answers in the list
  * @param domain_name domain name to search for
- * @return struct ip_list representing the list of corresponding IP addresses
+ * @return struct ip_list representing the list of corresponding IP addresses,
+ *         valid for the minimum TTL of the records of the CNAME chain
  */
 ip_list_t dns_get_ip_from_name(dns_resource_record_t *answers, uint16_t ancount, char *domain_name) {
     ip_list_t ip_list;
     ip_list.ip_count = 0;
     ip_list.ip_addresses = NULL;
+    ip_list.ttl = 0;
+    bool has_ttl = false;
     char *cname = domain_name;
     for (uint16_t i = 0; i < ancount; i++) {
         if (strcmp((answers + i)->name, cname) == 0) {
+            // The addresses are valid as long as all the records of the CNAME chain are
+            if (!has_ttl || (answers + i)->ttl < ip_list.ttl) {
+                ip_list.ttl = (answers + i)->ttl;
+                has_ttl = true;
+            }
             dns_rr_type_t rtype = (answers + i)->rtype;
             if (rtype == A || rtype == AAAA)
             {
@@ -9,7 +9,202 @@
  */
 
 #include "rule_utils.h"
+#include <stdarg.h>
+#include <arpa/inet.h>
+#include <nftables/libnftables.h>
 
+// nftables context of the process, shared by all its threads
+static struct nft_ctx *nft_ctx = NULL;
+static pthread_mutex_t nft_ctx_mutex = PTHREAD_MUTEX_INITIALIZER;
+// Command sink, receiving the nftables commands instead of running them (NULL if unset)
+static nft_cmd_sink_t nft_cmd_sink = NULL;
+static void *nft_cmd_sink_arg = NULL;
+
+
+/**
+ * @brief Read the current microseconds value.
+ *
+ * @return current microseconds value
+ */
+uint64_t counter_read_microseconds() {
+    struct timeval tv;
+    int ret = gettimeofday(&tv, NULL);
+    if (ret != 0) {
+        perror("counters_read_microseconds - gettimeofday");
+        exit(EXIT_FAILURE);
+    }
+    return ((uint64_t) tv.tv_sec) * 1000000 + ((uint64_t) tv.tv_usec);
+}
+
+/**
+ * @brief Initialize the values of a packet_count_t structure.
+ *
+ * @param nft_table_name name of the nftables table containing the associated nftables counter
+ * @param nft_counter_name name of the associated nftables counter
+ * @param direction_idx index of the direction of the rule (0 for both, 1 for out, 2 for in)
+ * @return packet_count_t struct containing the initial packet count values
+ */
+packet_count_t counter_packets_init(char *nft_table_name, char *nft_counter_name, direction_t direction)
+{
+    packet_count_t packet_count;
+    packet_count.is_initialized = true;
+
+    // Initial packet count value
+    if (direction == BOTH) {
+        packet_count.packets_both = counter_read_packets(nft_table_name, nft_counter_name);
+    } else {
+        // direction == IN or direction == OUT
+        char* dir_str = direction == OUT ? "out" : "in";
+        uint16_t dir_len = direction == OUT ? 3 : 2;
+        uint16_t length = strlen(nft_counter_name) + dir_len + 2;
+        char counter[length];
+        int ret = snprintf(counter, length, "%s-%s", nft_counter_name, dir_str);
+        if (ret != length - 1)
+        {
+            fprintf(stderr, "Error while building counter name '%s-%s'\n", nft_counter_name, dir_str);
+            exit(EXIT_FAILURE);
+        }
+        if (direction == OUT) {
+            packet_count.packets_out = counter_read_packets(nft_table_name, counter);
+        } else {
+            // direction == IN
+            packet_count.packets_in = counter_read_packets(nft_table_name, counter);
+        }
+    }
+
+    return packet_count;
+}
+
+/**
+ * @brief Initialize the values of a duration_t structure.
+ *
+ * @param nft_table_name name of the nftables table containing the associated nftables counter
+ * @param nft_counter_name name of the associated nftables counter
+ * @return duration_t struct containing the initial duration value
+ */
+duration_t counter_duration_init() {
+    duration_t duration;
+    duration.is_initialized = true;
+    duration.microseconds = counter_read_microseconds();
+    return duration;
+}
+
+/**
+ * @brief Initialize the nftables context of the process, without locking it.
+ *
+ * @return true if the context is ready, false otherwise
+ */
+static bool nft_context_init_unlocked() {
+    if (nft_ctx == NULL) {
+        nft_ctx = nft_ctx_new(NFT_CTX_DEFAULT);
+        if (nft_ctx == NULL) {
+            fprintf(stderr, "Failed to create libnftables context\n");
+            return false;
+        }
+        nft_ctx_buffer_output(nft_ctx);
+        nft_ctx_buffer_error(nft_ctx);
+    }
+    return true;
+}
+
+/**
+ * @brief Initialize the nftables context of the process.
+ *
+ * @return true if the context is ready, false otherwise
+ */
+bool nft_context_init() {
+    pthread_mutex_lock(&nft_ctx_mutex);
+    bool ret = nft_context_init_unlocked();
+    pthread_mutex_unlock(&nft_ctx_mutex);
+    return ret;
+}
+
+/**
+ * @brief Free the nftables context of the process.
+ */
+void nft_context_free() {
+    pthread_mutex_lock(&nft_ctx_mutex);
+    if (nft_ctx != NULL) {
+        nft_ctx_free(nft_ctx);
+        nft_ctx = NULL;
+    }
+    pthread_mutex_unlock(&nft_ctx_mutex);
+}
+
+/**
+ * @brief Set the command sink of the process.
+ *
+ * @param sink function receiving the nftables commands instead of running them,
+ *             or NULL to run the commands again
+ * @param arg argument passed to the sink along with each command
+ */
+void nft_set_cmd_sink(nft_cmd_sink_t sink, void *arg) {
+    pthread_mutex_lock(&nft_ctx_mutex);
+    nft_cmd_sink = sink;
+    nft_cmd_sink_arg = arg;
+    pthread_mutex_unlock(&nft_ctx_mutex);
+}
+
+/**
+ * @brief Run an nftables command with the in-process libnftables context.
+ *
+ * The context is not thread-safe, so the caller must hold its lock.
+ *
+ * @param cmd nftables command to run, without the leading `nft`
+ * @param handles whether the output must contain the rule handles
+ * @return output of the command, which must be freed by the caller, or NULL if the command failed
+ */
+static char* nft_exec_context(char *cmd, bool handles) {
+    if (!nft_context_init_unlocked()) {
+        return NULL;
+    }
+    unsigned int flags = nft_ctx_output_get_flags(nft_ctx);
+    if (handles) {
+        nft_ctx_output_set_flags(nft_ctx, flags | NFT_CTX_OUTPUT_HANDLE);
+    }
+    char *output = NULL;
+    if (nft_run_cmd_from_buffer(nft_ctx, cmd) == 0) {
+        output = strdup(nft_ctx_get_output_buffer(nft_ctx));
+    } else {
+        fprintf(stderr, "Failed to run nftables command '%s': %s", cmd, nft_ctx_get_error_buffer(nft_ctx));
+    }
+    nft_ctx_output_set_flags(nft_ctx, flags);
+    return output;
+}
+
+/**
+ * @brief Run an nftables command, and retrieve its output.
+ *
+ * Uses the command sink if set, or the in-process libnftables context otherwise,
+ * while holding the nftables context lock.
+ *
+ * @param cmd nftables command to run, without the leading `nft`
+ * @param handles whether the output must contain the rule handles
+ * @return output of the command, which must be freed by the caller, or NULL if the command failed
+ */
+static char* nft_run_cmd_output(char *cmd, bool handles) {
+    pthread_mutex_lock(&nft_ctx_mutex);
+    if (nft_cmd_sink != NULL) {
+        char *output = nft_cmd_sink(cmd, nft_cmd_sink_arg);
+        pthread_mutex_unlock(&nft_ctx_mutex);
+        return output;
+    }
+    char *output = nft_exec_context(cmd, handles);
+    pthread_mutex_unlock(&nft_ctx_mutex);
+    return output;
+}
+
+/**
+ * @brief Run an nftables command, discarding its output.
+ *
+ * @param cmd nftables command to run, without the leading `nft`
+ * @return true if the command succeeded, false otherwise
+ */
+bool nft_run_cmd(char *cmd) {
+    char *output = nft_run_cmd_output(cmd, false);
+    free(output);
+    return output != NULL;
+}
 
 /**
  * @brief Generic function to read an nftables counter value.
@@ -21,28 +216,34 @@
  */
 static uint32_t counter_read_nft(char *table_name, char *counter_name, counter_type_t counter_type) {
     // Build command
-    uint16_t length = 58 + strlen(table_name) + strlen(counter_name);
+    uint16_t length = 15 + strlen(table_name) + strlen(counter_name);
     char cmd[length];
-    int ret = snprintf(cmd, length, "sudo nft list counter %s %s | grep packets | awk '{print $%hhu}'", table_name, counter_name, counter_type * 2);
+    int ret = snprintf(cmd, length, "list counter %s %s", table_name, counter_name);
     if (ret != length - 1) {
         fprintf(stderr, "Error while building command to read counter %s\n", counter_name);
         exit(EXIT_FAILURE);
     }
     // Execute command
-    FILE *fp = popen(cmd, "r");
-    if (fp == NULL) {
+    char *output = nft_run_cmd_output(cmd, false);
+    if (output == NULL) {
         fprintf(stderr, "Failed to run command '%s'\n", cmd);
         exit(EXIT_FAILURE);
     }
-    // Read and return output
-    uint32_t count;
-    ret = fscanf(fp, "%u", &count);
-    pclose(fp);
-    if (ret != 1) {
+    // Read the counter values from the output
+    uint32_t packets, bytes;
+    char *line = output;
+    ret = 0;
+    while (line != NULL && ret != 2) {
+        ret = sscanf(line, " packets %u bytes %u", &packets, &bytes);
+        line = strchr(line, '\n');
+        line = line == NULL ? NULL : line + 1;
+    }
+    free(output);
+    if (ret != 2) {
         fprintf(stderr, "Error while reading output of command '%s'\n", cmd);
         exit(EXIT_FAILURE);
     }
-    return count;
+    return counter_type == PACKETS ? packets : bytes;
 }
 
 /**
@@ -68,77 +269,454 @@ uint32_t counter_read_bytes(char *table_name, char *counter_name) {
 }
 
 /**
- * @brief Read the current microseconds value.
+ * @brief Start a new batch of nftables commands.
  *
- * @return current microseconds value
+ * @param batch pointer to the batch to initialize
  */
-uint64_t counter_read_microseconds() {
-    struct timeval tv;
-    int ret = gettimeofday(&tv, NULL);
-    if (ret != 0) {
-        perror("counters_read_microseconds - gettimeofday");
+void nft_batch_begin(nft_batch_t *batch) {
+    batch->cmds = NULL;
+    batch->length = 0;
+    batch->capacity = 0;
+    batch->num_cmds = 0;
+    batch->error = false;
+}
+
+/**
+ * @brief Add a command to a batch of nftables commands.
+ * If the command cannot be added, the whole batch is marked as failed.
+ *
+ * @param batch pointer to the batch
+ * @param format printf-like format of the nftables command, without the leading `nft`
+ * @param ... format arguments
+ * @return true if the command was added, false otherwise
+ */
+bool nft_batch_add(nft_batch_t *batch, const char *format, ...) {
+    if (batch->error) {
+        return false;
+    }
+    // Compute command length
+    va_list args;
+    va_start(args, format);
+    int cmd_length = vsnprintf(NULL, 0, format, args);
+    va_end(args);
+    if (cmd_length < 0) {
+        fprintf(stderr, "Error while building nftables command '%s'\n", format);
+        batch->error = true;
+        return false;
+    }
+    // Grow the buffer if needed, to hold the separating newline, the command and the null byte
+    size_t needed = batch->length + cmd_length + 2;
+    if (needed > batch->capacity) {
+        size_t capacity = batch->capacity == 0 ? NFT_BATCH_INITIAL_CAPACITY : batch->capacity;
+        while (capacity < needed) {
+            capacity *= 2;
+        }
+        char *tmp = realloc(batch->cmds, capacity);
+        if (tmp == NULL) {
+            fprintf(stderr, "Failed to allocate memory for nftables batch\n");
+            batch->error = true;
+            return false;
+        }
+        batch->cmds = tmp;
+        batch->capacity = capacity;
+    }
+    // Append the command
+    if (batch->num_cmds > 0) {
+        batch->cmds[batch->length++] = '\n';
+    }
+    va_start(args, format);
+    vsnprintf(batch->cmds + batch->length, cmd_length + 1, format, args);
+    va_end(args);
+    batch->length += cmd_length;
+    batch->num_cmds++;
+    return true;
+}
+
+/**
+ * @brief Discard a batch of nftables commands, without running it.
+ *
+ * @param batch pointer to the batch to discard
+ */
+void nft_batch_abort(nft_batch_t *batch) {
+    free(batch->cmds);
+    nft_batch_begin(batch);
+}
+
+/**
+ * @brief Run a batch of nftables commands as a single transaction,
+ * then discard it.
+ * Either all the commands are applied, or none of them.
+ *
+ * @param batch pointer to the batch to run
+ * @return true if the batch was successfully applied, or is empty, false otherwise
+ */
+bool nft_batch_commit(nft_batch_t *batch) {
+    bool ret;
+    if (batch->error) {
+        ret = false;
+    } else if (batch->num_cmds == 0) {
+        ret = true;
+    } else {
+        ret = nft_run_cmd(batch->cmds);
+    }
+    nft_batch_abort(batch);
+    return ret;
+}
+
+/**
+ * @brief Add the addition of an element to an nftables set to a batch.
+ * Adding an element which is already present has no effect.
+ *
+ * @param batch pointer to the batch
+ * @param nft_table nftables table containing the set, including its family (e.g. "netdev my-device")
+ * @param nft_set name of the nftables set
+ * @param element element to add, in nftables syntax
+ * @return true if the command was added to the batch, false otherwise
+ */
+bool nft_batch_add_element(nft_batch_t *batch, char *nft_table, char *nft_set, char *element) {
+    return nft_batch_add(batch, "add element %s %s { %s }", nft_table, nft_set, element);
+}
+
+/**
+ * @brief Add the deletion of an element from an nftables set to a batch.
+ * Deleting an element which is not present has no effect,
+ * as the element is added then deleted in the same transaction.
+ *
+ * @param batch pointer to the batch
+ * @param nft_table nftables table containing the set, including its family (e.g. "netdev my-device")
+ * @param nft_set name of the nftables set
+ * @param element element to delete, in nftables syntax
+ * @return true if the commands were added to the batch, false otherwise
+ */
+bool nft_batch_delete_element(nft_batch_t *batch, char *nft_table, char *nft_set, char *element) {
+    return nft_batch_add(batch, "add element %s %s { %s }", nft_table, nft_set, element) &&
+           nft_batch_add(batch, "delete element %s %s { %s }", nft_table, nft_set, element);
+}
+
+/**
+ * @brief Add the addition of an IP address, with a timeout, to an nftables set to a batch.
+ * If the address is already present, its timeout is reset to the given one:
+ * as adding an element which is already present leaves its timeout untouched,
+ * the address is first added and deleted, then added again with the new timeout.
+ *
+ * @param batch pointer to the batch
+ * @param nft_table nftables table containing the set, including its family (e.g. "netdev my-device")
+ * @param nft_set name of the nftables set, with the `timeout` flag
+ * @param ip_addr IP (v4 or v6) address to add
+ * @param timeout time after which the address is removed from the set, in seconds (at least 1)
+ * @return true if the commands were added to the batch, false otherwise
+ */
+bool nft_batch_add_ip_element(nft_batch_t *batch, char *nft_table, char *nft_set, ip_addr_t ip_addr, uint32_t timeout) {
+    char ip_str[INET6_ADDRSTRLEN];
+    const char *ret = NULL;
+    if (ip_addr.version == 4) {
+        ret = inet_ntop(AF_INET, &ip_addr.value.ipv4, ip_str, sizeof(ip_str));
+    } else if (ip_addr.version == 6) {
+        ret = inet_ntop(AF_INET6, ip_addr.value.ipv6, ip_str, sizeof(ip_str));
+    }
+    if (ret == NULL) {
+        fprintf(stderr, "Invalid IP address for nftables set %s\n", nft_set);
+        batch->error = true;
+        return false;
+    }
+    // nftables rejects a zero timeout
+    timeout = timeout > 0 ? timeout : 1;
+    return nft_batch_delete_element(batch, nft_table, nft_set, ip_str) &&
+           nft_batch_add(batch, "add element %s %s { %s timeout %" PRIu32 "s }", nft_table, nft_set, ip_str, timeout);
+}
+
+/**
+ * @brief Add an element to an nftables set.
+ * Adding an element which is already present has no effect.
+ *
+ * @param nft_table nftables table containing the set, including its family (e.g. "netdev my-device")
+ * @param nft_set name of the nftables set
+ * @param element element to add, in nftables syntax
+ * @return true if the element was successfully added, false otherwise
+ */
+bool nft_set_add_element(char *nft_table, char *nft_set, char *element) {
+    nft_batch_t batch;
+    nft_batch_begin(&batch);
+    nft_batch_add_element(&batch, nft_table, nft_set, element);
+    return nft_batch_commit(&batch);
+}
+
+/**
+ * @brief Delete an element from an nftables set.
+ * Deleting an element which is not present has no effect.
+ *
+ * @param nft_table nftables table containing the set, including its family (e.g. "netdev my-device")
+ * @param nft_set name of the nftables set
+ * @param element element to delete, in nftables syntax
+ * @return true if the element was successfully deleted, false otherwise
+ */
+bool nft_set_delete_element(char *nft_table, char *nft_set, char *element) {
+    nft_batch_t batch;
+    nft_batch_begin(&batch);
+    nft_batch_delete_element(&batch, nft_table, nft_set, element);
+    return nft_batch_commit(&batch);
+}
+
+/**
+ * @brief Create a cache of the values of an nftables table's counters.
+ *
+ * @param table_name name of the nftables table, including its family (e.g. "netdev my-device")
+ * @param interval polling interval, in microseconds: cached values are at most this old
+ * @return pointer to the newly created cache, which must be freed with `counter_cache_free`
+ */
+counter_cache_t* counter_cache_create(char *table_name, uint64_t interval) {
+    counter_cache_t *cache = malloc(sizeof(counter_cache_t));
+    if (cache == NULL) {
+        perror("counter_cache_create - malloc");
         exit(EXIT_FAILURE);
     }
-    return ((uint64_t) tv.tv_sec) * 1000000 + ((uint64_t) tv.tv_usec);
+    strncpy(cache->table_name, table_name, NFT_NAME_MAXLEN - 1);
+    cache->table_name[NFT_NAME_MAXLEN - 1] = '\0';
+    cache->interval = interval;
+    cache->last_update = 0;
+    cache->refreshing = false;
+    cache->num_counters = 0;
+    cache->capacity = 0;
+    cache->counters = NULL;
+    pthread_mutex_init(&cache->mutex, NULL);
+    pthread_cond_init(&cache->refreshed, NULL);
+    return cache;
 }
 
 /**
- * @brief Initialize the values of a packet_count_t structure.
+ * @brief Free a counter cache.
  *
- * @param nft_table_name name of the nftables table containing the associated nftables counter
+ * @param cache pointer to the counter cache to free
+ */
+void counter_cache_free(counter_cache_t *cache) {
+    if (cache == NULL) {
+        return;
+    }
+    pthread_mutex_destroy(&cache->mutex);
+    pthread_cond_destroy(&cache->refreshed);
+    free(cache->counters);
+    free(cache);
+}
+
+/**
+ * @brief Retrieve a counter from a counter cache, or add it if it is not present.
+ *
+ * @param cache pointer to the counter cache
+ * @param counter_name name of the counter
+ * @param add whether to add the counter if it is not present
+ * @return pointer to the counter value, or NULL if the counter is not present and was not added
+ */
+static counter_value_t* counter_cache_find(counter_cache_t *cache, char *counter_name, bool add) {
+    for (uint16_t i = 0; i < cache->num_counters; i++) {
+        if (strcmp(cache->counters[i].name, counter_name) == 0) {
+            return cache->counters + i;
+        }
+    }
+    if (!add) {
+        return NULL;
+    }
+    // Counter not present, add it
+    if (cache->num_counters == cache->capacity) {
+        uint16_t capacity = cache->capacity == 0 ? 16 : cache->capacity * 2;
+        counter_value_t *counters = realloc(cache->counters, capacity * sizeof(counter_value_t));
+        if (counters == NULL) {
+            perror("counter_cache_find - realloc");
+            exit(EXIT_FAILURE);
+        }
+        cache->counters = counters;
+        cache->capacity = capacity;
+    }
+    counter_value_t *counter = cache->counters + cache->num_counters++;
+    strncpy(counter->name, counter_name, NFT_NAME_MAXLEN - 1);
+    counter->name[NFT_NAME_MAXLEN - 1] = '\0';
+    counter->packets = 0;
+    counter->bytes = 0;
+    return counter;
+}
+
+/**
+ * @brief Update the values of a counter cache from a dump of the table's counters,
+ * without locking the cache.
+ *
+ * @param cache pointer to the counter cache to update
+ * @param dump dump of the table's counters
+ * @return number of counters read from the dump
+ */
+static uint16_t counter_cache_update_unlocked(counter_cache_t *cache, char *dump) {
+    uint16_t count = 0;
+    counter_value_t *counter = NULL;
+    char name[NFT_NAME_MAXLEN];
+    uint64_t packets, bytes;
+    char *line = dump;
+    while (line != NULL && *line != '\0') {
+        char *next = strchr(line, '\n');
+        if (sscanf(line, " counter %255s {", name) == 1) {
+            // Counter declaration, strip the quotes around the name (if any)
+            char *start = name[0] == '"' ? name + 1 : name;
+            size_t len = strlen(start);
+            if (len > 0 && start[len - 1] == '"') {
+                start[len - 1] = '\0';
+            }
+            counter = counter_cache_find(cache, start, true);
+        } else if (counter != NULL && sscanf(line, " packets %" SCNu64 " bytes %" SCNu64, &packets, &bytes) == 2) {
+            // Values of the last declared counter
+            counter->packets = packets;
+            counter->bytes = bytes;
+            counter = NULL;
+            count++;
+        }
+        line = next == NULL ? NULL : next + 1;
+    }
+    __atomic_store_n(&cache->last_update, counter_read_microseconds(), __ATOMIC_RELEASE);
+    return count;
+}
+
+/**
+ * @brief Update the values of a counter cache from a dump of the table's counters,
+ * as output by `nft list counters table <table>`.
+ *
+ * @param cache pointer to the counter cache to update
+ * @param dump dump of the table's counters
+ * @return number of counters read from the dump
+ */
+uint16_t counter_cache_update(counter_cache_t *cache, char *dump) {
+    pthread_mutex_lock(&cache->mutex);
+    uint16_t count = counter_cache_update_unlocked(cache, dump);
+    pthread_mutex_unlock(&cache->mutex);
+    return count;
+}
+
+/**
+ * @brief Dump the table's counters, and update the values of a counter cache.
+ * The counters are dumped without holding the cache lock,
+ * which is only taken to update the values.
+ *
+ * @param cache pointer to the counter cache to refresh
+ * @return true if the counters were successfully dumped, false otherwise
+ */
+bool counter_cache_refresh(counter_cache_t *cache) {
+    uint16_t length = 21 + strlen(cache->table_name);
+    char cmd[length];
+    int ret = snprintf(cmd, length, "list counters table %s", cache->table_name);
+    if (ret != length - 1) {
+        fprintf(stderr, "Error while building command to dump the counters of table %s\n", cache->table_name);
+        return false;
+    }
+    char *dump = nft_run_cmd_output(cmd, false);
+    if (dump == NULL) {
+        return false;
+    }
+    counter_cache_update(cache, dump);
+    free(dump);
+    return true;
+}
+
+/**
+ * @brief Read the value of an nftables counter, from a counter cache.
+ * The cache is refreshed first if its values are older than its polling interval,
+ * by a single thread, selected with an atomic flag.
+ * The other threads read the previous values,
+ * or wait for the refresh if the cache was never filled.
+ *
+ * @param cache pointer to the counter cache
+ * @param counter_name name of the nftables counter to read
+ * @param counter_type type of the counter value to read
+ * @return value of the counter, or 0 if the counter is unknown
+ */
+static uint64_t counter_cache_read(counter_cache_t *cache, char *counter_name, counter_type_t counter_type) {
+    uint64_t last_update = __atomic_load_n(&cache->last_update, __ATOMIC_ACQUIRE);
+    if (last_update == 0 || counter_read_microseconds() - last_update >= cache->interval) {
+        if (!__atomic_exchange_n(&cache->refreshing, true, __ATOMIC_ACQUIRE)) {
+            // Never dumped or outdated values: a single thread dumps the counters
+            counter_cache_refresh(cache);
+            pthread_mutex_lock(&cache->mutex);
+            __atomic_store_n(&cache->refreshing, false, __ATOMIC_RELEASE);
+            pthread_cond_broadcast(&cache->refreshed);
+            pthread_mutex_unlock(&cache->mutex);
+        } else if (last_update == 0) {
+            // Never dumped: no previous value to read, wait for the thread dumping the counters
+            pthread_mutex_lock(&cache->mutex);
+            while (__atomic_load_n(&cache->refreshing, __ATOMIC_ACQUIRE)) {
+                pthread_cond_wait(&cache->refreshed, &cache->mutex);
+            }
+            pthread_mutex_unlock(&cache->mutex);
+        }
+        // Otherwise, outdated values: the other threads read the previous values
+    }
+    pthread_mutex_lock(&cache->mutex);
+    counter_value_t *counter = counter_cache_find(cache, counter_name, false);
+    uint64_t value = 0;
+    if (counter == NULL) {
+        fprintf(stderr, "Unknown counter %s in table %s\n", counter_name, cache->table_name);
+    } else {
+        value = counter_type == PACKETS ? counter->packets : counter->bytes;
+    }
+    pthread_mutex_unlock(&cache->mutex);
+    return value;
+}
+
+/**
+ * @brief Read the packet count value of an nftables counter, from a counter cache.
+ * The cache is refreshed first if its values are older than its polling interval.
+ *
+ * @param cache pointer to the counter cache
+ * @param counter_name name of the nftables counter to read
+ * @return packet count value of the counter, or 0 if the counter is unknown
+ */
+uint64_t counter_cache_read_packets(counter_cache_t *cache, char *counter_name) {
+    return counter_cache_read(cache, counter_name, PACKETS);
+}
+
+/**
+ * @brief Read the bytes value of an nftables counter, from a counter cache.
+ * The cache is refreshed first if its values are older than its polling interval.
+ *
+ * @param cache pointer to the counter cache
+ * @param counter_name name of the nftables counter to read
+ * @return bytes value of the counter, or 0 if the counter is unknown
+ */
+uint64_t counter_cache_read_bytes(counter_cache_t *cache, char *counter_name) {
+    return counter_cache_read(cache, counter_name, BYTES);
+}
+
+/**
+ * @brief Initialize the values of a packet_count_t structure, from a counter cache.
+ *
+ * @param cache pointer to the counter cache
  * @param nft_counter_name name of the associated nftables counter
- * @param direction_idx index of the direction of the rule (0 for both, 1 for out, 2 for in)
+ * @param direction direction of the rule (BOTH, OUT or IN)
  * @return packet_count_t struct containing the initial packet count values
  */
-packet_count_t counter_packets_init(char *nft_table_name, char *nft_counter_name, direction_t direction)
-{
+packet_count_t counter_cache_packets_init(counter_cache_t *cache, char *nft_counter_name, direction_t direction) {
     packet_count_t packet_count;
     packet_count.is_initialized = true;
 
     // Initial packet count value
     if (direction == BOTH) {
-        packet_count.packets_both = counter_read_packets(nft_table_name, nft_counter_name);
+        packet_count.packets_both = counter_cache_read_packets(cache, nft_counter_name);
     } else {
         // direction == IN or direction == OUT
-        char* dir_str = direction == OUT ? "out" : "in";
-        uint16_t dir_len = direction == OUT ? 3 : 2;
-        uint16_t length = strlen(nft_counter_name) + dir_len + 2;
-        char counter[length];
-        int ret = snprintf(counter, length, "%s-%s", nft_counter_name, dir_str);
-        if (ret != length - 1)
-        {
-            fprintf(stderr, "Error while building counter name '%s-%s'\n", nft_counter_name, dir_str);
+        char counter[NFT_NAME_MAXLEN];
+        int ret = snprintf(counter, NFT_NAME_MAXLEN, "%s-%s", nft_counter_name, direction == OUT ? "out" : "in");
+        if (ret < 0 || ret >= NFT_NAME_MAXLEN) {
+            fprintf(stderr, "Error while building counter name '%s'\n", nft_counter_name);
             exit(EXIT_FAILURE);
         }
         if (direction == OUT) {
-            packet_count.packets_out = counter_read_packets(nft_table_name, counter);
+            packet_count.packets_out = counter_cache_read_packets(cache, counter);
         } else {
             // direction == IN
-            packet_count.packets_in = counter_read_packets(nft_table_name, counter);
+            packet_count.packets_in = counter_cache_read_packets(cache, counter);
         }
     }
 
     return packet_count;
 }
 
-/**
- * @brief Initialize the values of a duration_t structure.
- *
- * @param nft_table_name name of the nftables table containing the associated nftables counter
- * @param nft_counter_name name of the associated nftables counter
- * @return duration_t struct containing the initial duration value
- */
-duration_t counter_duration_init() {
-    duration_t duration;
-    duration.is_initialized = true;
-    duration.microseconds = counter_read_microseconds();
-    return duration;
-}
-
 /**
  * @brief Delete an nftables rule.
  *
- * Retrieves the rule handle,
+ * Retrieves the rule handle from a listing of the chain,
  * then deletes the rule.
  *
  * @param nft_table nftables table containing the rule
@@ -147,43 +725,42 @@ duration_t counter_duration_init() {
  * @return true if the rule was correctly deleted, false otherwise
  */
 bool delete_nft_rule(char *nft_table, char *nft_chain, char *nft_rule) {
-    uint16_t handle;
-    // Build command to read rule handle value
-    uint16_t length = 65 + strlen(nft_table) + strlen(nft_chain) + strlen(nft_rule);
-    char read_handle_cmd[length];
-    int ret = snprintf(read_handle_cmd, length, "sudo nft -a list chain %s %s | grep '%s' | grep -o -E 'handle [0-9]+$'", nft_table, nft_chain, nft_rule);
+    // Build command to list the chain, with the rule handles
+    uint16_t length = 13 + strlen(nft_table) + strlen(nft_chain);
+    char list_cmd[length];
+    int ret = snprintf(list_cmd, length, "list chain %s %s", nft_table, nft_chain);
     if (ret != length - 1) {
-        fprintf(stderr, "Error while building command to read rule handle value\n");
+        fprintf(stderr, "Error while building command to list chain %s\n", nft_chain);
         return false;
     }
-    // Execute command to read rule handle value
-    FILE *fp = popen(read_handle_cmd, "r");
-    if (fp == NULL) {
-        fprintf(stderr, "Failed to run command '%s'\n", read_handle_cmd);
+    char *listing = nft_run_cmd_output(list_cmd, true);
+    if (listing == NULL) {
         return false;
     }
-    // Read rule handle value
-    ret = fscanf(fp, "handle %hu", &handle);
-    pclose(fp);
-    if (ret != 1) {
-        fprintf(stderr, "Error while reading output of command '%s'\n", read_handle_cmd);
-        return false;
+    // Read rule handle value, at the end of the rule's line
+    uint64_t handle = 0;
+    bool found = false;
+    char *line = strstr(listing, nft_rule);
+    if (line != NULL) {
+        char *end = strchr(line, '\n');
+        if (end != NULL) {
+            *end = '\0';
+        }
+        char *handle_str = strstr(line, "# handle ");
+        found = handle_str != NULL && sscanf(handle_str, "# handle %" SCNu64, &handle) == 1;
     }
-    // Build command to delete the correspondig nftables rule
-    length = 34 + strlen(nft_table) + strlen(nft_chain);
-    char delete_handle_cmd[length];
-    ret = snprintf(delete_handle_cmd, length, "sudo nft delete rule %s %s handle %hu", nft_table, nft_chain, handle);
-    if (ret < length -3 || ret > length - 1) {
-        fprintf(stderr, "Error while building command to delete rule with handle %hu\n", handle);
+    free(listing);
+    if (!found) {
+        fprintf(stderr, "Error while reading the handle of rule '%s'\n", nft_rule);
         return false;
     }
-    // Execute command to delete the corresponding nftables rule
-    ret = system(delete_handle_cmd);
-    if (ret == -1) {
-        fprintf(stderr, "Failed to run command '%s'\n", delete_handle_cmd);
+    // Delete the correspondig nftables rule
+    nft_batch_t batch;
+    nft_batch_begin(&batch);
+    nft_batch_add(&batch, "delete rule %s %s handle %" PRIu64, nft_table, nft_chain, handle);
+    if (!nft_batch_commit(&batch)) {
         return false;
-    } else {
-        printf("Successfully deleted rule with handle %hu\n", handle);
-        return true;
     }
+    printf("Successfully deleted rule with handle %" PRIu64 "\n", handle);
+    return true;
 }
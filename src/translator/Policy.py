@@ -1,4 +1,5 @@
 from typing import Dict
+import hashlib
 from protocols.Protocol import Protocol
 
 class Policy:
@@ -10,6 +11,12 @@ class Policy:
     MATCH = 0
     ACTION = 1
 
+    # Number of bytes of a packet covering its layer 3 and 4 headers
+    # (IPv4 header with options and TCP header with options, at most 60 bytes each)
+    headers_copy_range = 128
+    # Copy range of the whole packet
+    full_copy_range = 0xffff
+
     # Metadata for supported nftables statistics
     stats_metadata = {
         "rate": {"type": MATCH, "counter": False, "template": "limit rate {}"},
@@ -18,7 +25,7 @@ class Policy:
         "duration": {"counter": True}
     }
 
-    def __init__(self, policy_name: str, profile_data: dict, device: dict, is_backward = False) -> None:
+    def __init__(self, policy_name: str, profile_data: dict, device: dict, is_backward = False, name_prefix: str = "") -> None:
         """
         Initialize a new Policy object.
 
@@ -27,18 +34,29 @@ class Policy:
             profile_data (dict): Dictionary containing the policy data from the YAML profile.
             device (dict): Dictionary containing the device metadata from the YAML profile.
             is_backward (bool): Whether the policy is backwards (i.e. the source and destination are reversed).
+            name_prefix (str): Prefix of the nftables counter names (e.g. the device name, when several devices share a table).
         """
         self.name = policy_name               # Policy name
         self.profile_data = profile_data      # Policy data from the YAML profile
         self.is_backward = is_backward        # Whether the policy is backwards (i.e. the source and destination are reversed)
         self.device = device                  # Name of the device this policy is linked to
+        self.name_prefix = name_prefix        # Prefix of the nftables counter names
         self.custom_parser = ""               # Name of the custom parser (if any)
         self.nft_matches = []                 # List of nftables matches (will be populated by parsing)
         self.nft_stats = {}                   # Dict of nftables statistics (will be populated by parsing)
         self.nft_match = ""                   # Complete nftables match (including rate and packet size)
         self.nft_action = ""                  # nftables action associated to this policy (including counters)
+        self.nft_statements = []              # List of nftables non-terminal statements of the action (e.g. counters)
+        self.nft_verdict = ""                 # nftables verdict of the action (accept or queue)
+        self.nfq_id = -1                      # Number of the nfqueue queue this policy's packets are sent to (-1 if not queued)
+        self.nfq_mark = 0                     # Packet mark identifying this policy in a shared nfqueue queue (0 if the queue is not shared)
+        self.nfq_workers = 1                  # Number of queues, from nfq_id, this policy's packets are spread over
+        self.merged_into = None               # Policy whose nftables rule also handles this policy, if the rules were merged
+        self.nft_gate = ""                    # Name of the nftables set gating this policy's rule (periodic policies only)
         self.nfq_matches = []                 # List of nfqueue matches (will be populated by parsing)
+        self.dns_sets = []                    # nftables sets of addresses learned from DNS answers, matched by this policy (will be populated by parsing)
         self.counters = {}                    # Counters associated to this policy (will be populated by parsing)
+        self.copy_range = Policy.full_copy_range  # Number of bytes of each packet copied to the nfqueue queue (will be computed by parsing)
 
         self.transient = self.is_transient()  # Whether the policy represents a transient pattern
         self.periodic = self.is_periodic()    # Whether the policy represents a periodic pattern
@@ -70,7 +88,7 @@ class Policy:
             dict: parsed stat, with the form {"template": ..., "match": ...}
         """
         parsed_stat = None
-        counter_name = self.name[:-len("-backward")] if self.is_backward else self.name
+        counter_name = self.name_prefix + (self.name[:-len("-backward")] if self.is_backward else self.name)
         value = self.profile_data["stats"][stat]
         if type(value) == dict:
             # Stat is a dictionary, and contains data for directions "out" and "in"
@@ -105,13 +123,18 @@ class Policy:
         return parsed_stat
 
     
-    def build_nft_rule(self, queue_num: int) -> str:
+    def build_nft_rule(self, queue_num: int, nfq_mark: int = 0, nfq_workers: int = 1) -> str:
         """
         Build and store the nftables match and action, as strings, for this policy.
 
         Args:
             queue_num (int): Number of the nfqueue queue corresponding to this policy,
                              or a negative number if the policy is simply `accept`
+            nfq_mark (int): Packet mark identifying this policy, if its queue is shared with other policies.
+                            Optional, default is 0 (queue not shared, packets are not marked).
+            nfq_workers (int): Number of consecutive queues, starting at `queue_num`,
+                               the packets are spread over by nftables, according to a hash of their flow.
+                               Optional, default is 1 (single queue).
         Returns:
             str: complete nftables rule for this policy
         """
@@ -130,13 +153,51 @@ class Policy:
             if "type" in Policy.stats_metadata[stat] and Policy.stats_metadata[stat]["type"] == Policy.MATCH:
                 self.nft_match += " " + (template.format(*(data)) if type(data) == list else template.format(data))
             elif "type" in Policy.stats_metadata[stat] and Policy.stats_metadata[stat]["type"] == Policy.ACTION:
-                self.nft_action += (template.format(*(data)) if type(data) == list else template.format(data)) + " "
+                self.nft_statements.append(template.format(*(data)) if type(data) == list else template.format(data))
 
         # nftables action
-        self.nft_action += f"queue num {queue_num}" if queue_num >= 0 else "accept"
+        self.nfq_id = queue_num if queue_num >= 0 else -1
+        self.nfq_mark = nfq_mark if queue_num >= 0 else 0
+        self.nfq_workers = nfq_workers if queue_num >= 0 else 1
+        # The mark is part of the verdict, as it must be set by the rule queuing the packet
+        self.nft_verdict = "accept"
+        if queue_num >= 0:
+            # Without the `fanout` flag, which selects the queue by CPU, nftables selects it by flow hash
+            queue = f"queue num {queue_num}-{queue_num + nfq_workers - 1}" if nfq_workers > 1 else f"queue num {queue_num}"
+            self.nft_verdict = f"meta mark set {nfq_mark} {queue}" if nfq_mark else queue
+        self.nft_action = " ".join(self.nft_statements + [self.nft_verdict])
 
         return self.get_nft_rule()
 
+
+    def is_mergeable(self) -> bool:
+        """
+        Check whether the nftables rule of this policy can be merged with other rules having the same match.
+        Periodic policies are excluded, as their rules are also matched against their gate set,
+        toggled at runtime, hence only match while the policy is active,
+        as well as rate-limited policies, as each `limit` statement has its own token bucket.
+        """
+        return not self.periodic and "rate" not in self.nft_stats
+
+
+    def merge_nft_rule(self, policy: 'Policy') -> None:
+        """
+        Merge the nftables rule of another policy, with the same match, into this policy's rule.
+        The merged rule combines the statements (e.g. counters) of both policies,
+        and keeps this policy's verdict, as nftables stops at the first matching rule,
+        hence the other policy's rule would never be reached.
+        If the other policy is queued, its callback never receives packets either way,
+        which `parse_policy` reports with a warning.
+
+        Args:
+            policy (Policy): Policy whose rule is merged into this policy's rule
+        """
+        for statement in policy.nft_statements:
+            if statement not in self.nft_statements:
+                self.nft_statements.append(statement)
+        self.nft_action = " ".join(self.nft_statements + [self.nft_verdict])
+        policy.merged_into = self
+
     
     def get_nft_rule(self) -> str:
         """
@@ -149,24 +210,91 @@ class Policy:
         return f"{self.nft_match} {self.nft_action}"
 
     
-    def parse(self) -> None:
+    def use_dns_sets(self) -> None:
+        """
+        Match the policy's domain names in the kernel, against nftables sets
+        filled with the addresses learned from DNS answers, instead of the DNS map of the nfqueue callback.
+        Each domain name match is moved from the nfqueue matches to the nftables matches.
+        Policies matching the same domain names share the same set.
+        """
+        nfq_matches = []
+        for nfq_match in self.nfq_matches:
+            if "dns_set" not in nfq_match:
+                nfq_matches.append(nfq_match)
+                continue
+            dns_set = nfq_match["dns_set"]
+            domain_names = dns_set["domain_names"]
+            if len(domain_names) == 1:
+                suffix = domain_names[0]
+            else:
+                suffix = hashlib.sha256(" ".join(sorted(domain_names)).encode()).hexdigest()[:8]
+            name = f"{self.name_prefix}dns-ipv{dns_set['version']}-{suffix}"
+            self.nft_matches.append({"template": f"{dns_set['selector']} @{{}}", "match": name})
+            self.dns_sets.append({"name": name, "type": dns_set["type"], "version": dns_set["version"], "domain_names": domain_names})
+        self.nfq_matches = nfq_matches
+
+
+    def set_domain_ids(self, domain_ids: dict) -> None:
+        """
+        Replace the domain names looked up in the DNS map by the nfqueue callback with their ID,
+        such that the lookup is a simple array access instead of a hashmap lookup by name.
+        Sets of domain names are replaced with the bitmask of their IDs,
+        as an initializer of 64-bit words, to be checked against the DNS map reverse index.
+
+        Args:
+            domain_ids (dict): Dictionary mapping the domain names of the device to their ID
+        """
+        mask_words = (len(domain_ids) + 63) // 64
+        for nfq_match in self.nfq_matches:
+            if "dns_map_names" not in nfq_match:
+                continue
+            names = nfq_match["dns_map_names"]
+            if type(nfq_match["match"]) == list:
+                match = []
+                for value in nfq_match["match"]:
+                    if type(value) == list:
+                        mask = sum(1 << domain_ids[name] for name in set(value))
+                        match.append(", ".join(f"{(mask >> (64 * word)) & 0xffffffffffffffff:#x}ULL" for word in range(mask_words)))
+                    else:
+                        match.append(domain_ids[value] if value in names else value)
+                nfq_match["match"] = match
+            elif nfq_match["match"] in names:
+                nfq_match["match"] = domain_ids[nfq_match["match"]]
+
+
+    def parse(self, dns_sets: bool = False) -> None:
         """
         Parse the policy and populate the related instance variables.
+
+        Args:
+            dns_sets (bool): Whether to match domain names against nftables sets of addresses learned from DNS answers.
+                             Optional, default is `False` (domain names are matched by the nfqueue callback).
         """
         # Parse protocols
         for protocol_name in self.profile_data["protocols"]:
-            try:
-                protocol = Protocol.init_protocol(protocol_name, self.profile_data["protocols"][protocol_name], self.device)
-            except ModuleNotFoundError:
+            protocol = Protocol.init_protocol(protocol_name, self.profile_data["protocols"][protocol_name], self.device)
+            if protocol is None:
                 # Unsupported protocol, skip it
                 continue
-            else:
-                # Supported protocol, parse it
-                if protocol.custom_parser:
-                    self.custom_parser = protocol_name
-                new_rules = protocol.parse(is_backward=self.is_backward, initiator=self.initiator)
-                self.nft_matches += new_rules["nft"]
-                self.nfq_matches += new_rules["nfq"]
+            # Supported protocol, parse it
+            new_rules = protocol.parse(is_backward=self.is_backward, initiator=self.initiator)
+            if protocol.custom_parser:
+                self.custom_parser = protocol_name
+                parser_copy_range = protocol.copy_range
+            self.nft_matches += new_rules["nft"]
+            self.nfq_matches += new_rules["nfq"]
+        if dns_sets:
+            self.use_dns_sets()
+
+        # Compute the copy range of the packets sent to the nfqueue queue:
+        # the callback only parses the payload if the policy has nfqueue matches,
+        # otherwise it only needs the packet headers
+        if not (self.custom_parser and self.nfq_matches):
+            self.copy_range = Policy.headers_copy_range
+        elif parser_copy_range is not None:
+            self.copy_range = min(Policy.headers_copy_range + parser_copy_range, Policy.full_copy_range)
+        else:
+            self.copy_range = Policy.full_copy_range
         
         # Parse statistics
         if "stats" in self.profile_data:
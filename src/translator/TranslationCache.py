@@ -0,0 +1,194 @@
+import os
+import json
+import hashlib
+
+class TranslationCache:
+    """
+    Incremental translation cache for a device profile.
+    Stores content hashes of the translation inputs in the device directory,
+    to skip the translation of unchanged profiles and policies.
+    """
+
+    # Name of the cache file, stored in the device directory
+    file_name = ".translator-cache.json"
+    # Cache file format version
+    format_version = 2
+    # Hash of the translator sources and templates (computed once per process)
+    translator_digest = None
+
+    def __init__(self, device_path: str, enabled: bool = True) -> None:
+        """
+        Initialize a new TranslationCache object, and load the cache file if it exists.
+
+        Args:
+            device_path (str): Path to the device directory
+            enabled (bool): Whether the cache is enabled.
+                            If `False`, the cache never hits, but is still updated.
+        """
+        self.path = os.path.join(device_path, TranslationCache.file_name)
+        self.enabled = enabled
+        self.data = {}
+        self.new_data = {"version": TranslationCache.format_version, "policies": {}}
+        if enabled and os.path.isfile(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError):
+                # Unreadable cache file, ignore it
+                self.data = {}
+            if self.data.get("version") != TranslationCache.format_version:
+                self.data = {}
+
+
+    @classmethod
+    def get_translator_digest(c) -> str:
+        """
+        Compute the hash of the translator sources and templates,
+        which acts as the translator version.
+
+        Returns:
+            str: hash of the translator sources and templates
+        """
+        if c.translator_digest is None:
+            h = hashlib.sha256()
+            translator_path = os.path.abspath(os.path.dirname(__file__))
+            for root, dirs, files in os.walk(translator_path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith(".") and d != "__pycache__")
+                for file in sorted(files):
+                    if file.endswith(".py") or file.endswith(".j2"):
+                        path = os.path.join(root, file)
+                        h.update(os.path.relpath(path, translator_path).encode())
+                        with open(path, "rb") as f:
+                            h.update(f.read())
+            c.translator_digest = h.hexdigest()
+        return c.translator_digest
+
+
+    @staticmethod
+    def hash_files(paths: list) -> str:
+        """
+        Compute the hash of the content of a list of files.
+
+        Args:
+            paths (list): List of file paths
+        Returns:
+            str: hash of the files content, or None if a file cannot be read
+        """
+        h = hashlib.sha256()
+        for path in paths:
+            try:
+                with open(path, "rb") as f:
+                    h.update(path.encode())
+                    h.update(f.read())
+            except OSError:
+                return None
+        return h.hexdigest()
+
+
+    @classmethod
+    def hash_data(c, *data) -> str:
+        """
+        Compute the hash of arbitrary (JSON-serializable) data,
+        combined with the translator hash.
+
+        Args:
+            data: data to hash
+        Returns:
+            str: hash of the data
+        """
+        h = hashlib.sha256(c.get_translator_digest().encode())
+        h.update(json.dumps(data, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+
+    def profile_key(self, profile_path: str, included_paths: list, options: dict) -> str:
+        """
+        Compute the cache key of a device profile.
+
+        Args:
+            profile_path (str): Path to the device YAML profile
+            included_paths (list): Paths to the files included by the profile
+            options (dict): Translation options
+        Returns:
+            str: cache key for the profile, or None if a file cannot be read
+        """
+        paths = [os.path.abspath(profile_path)] + sorted(included_paths)
+        files_hash = TranslationCache.hash_files(paths)
+        if files_hash is None:
+            return None
+        return TranslationCache.hash_data(files_hash, options)
+
+
+    def is_profile_up_to_date(self, profile_path: str, options: dict) -> bool:
+        """
+        Check whether the translation of a device profile is up to date,
+        i.e. neither the profile, nor the files it includes, nor the translator have changed,
+        and all the output files are still present.
+
+        Args:
+            profile_path (str): Path to the device YAML profile
+            options (dict): Translation options
+        Returns:
+            bool: True if the translation is up to date, False otherwise
+        """
+        if not self.enabled or "profile" not in self.data:
+            return False
+        key = self.profile_key(profile_path, self.data.get("included", []), options)
+        if key != self.data["profile"]:
+            return False
+        return all(os.path.isfile(output) for output in self.data.get("outputs", []))
+
+
+    def is_policy_up_to_date(self, policy_name: str, key: str, output_path: str) -> bool:
+        """
+        Check whether the nfqueue C file of a top-level policy is up to date.
+
+        Args:
+            policy_name (str): Name of the top-level policy
+            key (str): Cache key of the policy
+            output_path (str): Path to the policy nfqueue C file
+        Returns:
+            bool: True if the policy C file is up to date, False otherwise
+        """
+        self.new_data["policies"][policy_name] = key
+        return self.enabled and self.data.get("policies", {}).get(policy_name) == key and os.path.isfile(output_path)
+
+
+    def update_profile(self, profile_path: str, included_paths: list, options: dict, outputs: list) -> None:
+        """
+        Store the cache key of a device profile, and write the cache file.
+
+        Args:
+            profile_path (str): Path to the device YAML profile
+            included_paths (list): Paths to the files included by the profile
+            options (dict): Translation options
+            outputs (list): Paths to the output files of the translation
+        """
+        self.new_data["profile"] = self.profile_key(profile_path, included_paths, options)
+        self.new_data["included"] = sorted(included_paths)
+        self.new_data["outputs"] = outputs
+        with open(self.path, "w") as f:
+            json.dump(self.new_data, f, indent=2, sort_keys=True)
+
+
+    @staticmethod
+    def write_if_changed(path: str, content: str) -> bool:
+        """
+        Write content to a file, only if the file content differs,
+        to leave the modification time of unchanged files untouched.
+
+        Args:
+            path (str): Path to the file to write
+            content (str): Content to write
+        Returns:
+            bool: True if the file was written, False if it was already up to date
+        """
+        try:
+            with open(path, "r") as f:
+                if f.read() == content:
+                    return False
+        except OSError:
+            pass
+        with open(path, "w") as f:
+            f.write(content)
+        return True
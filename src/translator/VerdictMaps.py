@@ -0,0 +1,263 @@
+import ipaddress
+import itertools
+from Policy import Policy
+
+class VerdictMaps:
+    """
+    Groups the nftables rules of compatible policies into nftables verdict maps,
+    keyed on the concatenation of the policies' selectors
+    (e.g. `ip saddr . ip daddr . meta l4proto . th dport`),
+    so that a group of policies is matched with a single lookup instead of one rule per policy.
+    """
+
+    # Supported nftables match templates, mapped to the corresponding selector and nftables type
+    selectors = {
+        "ip saddr {{ {} }}": ("ip saddr", "ipv4_addr"),
+        "ip daddr {{ {} }}": ("ip daddr", "ipv4_addr"),
+        "ip6 saddr {{ {} }}": ("ip6 saddr", "ipv6_addr"),
+        "ip6 daddr {{ {} }}": ("ip6 daddr", "ipv6_addr"),
+        "meta l4proto {}": ("meta l4proto", "inet_proto"),
+        "tcp sport {{ {} }}": ("th sport", "inet_service"),
+        "tcp dport {{ {} }}": ("th dport", "inet_service"),
+        "udp sport {{ {} }}": ("th sport", "inet_service"),
+        "udp dport {{ {} }}": ("th dport", "inet_service")
+    }
+    # Order of the selectors in the map keys
+    selectors_order = ["ip saddr", "ip daddr", "ip6 saddr", "ip6 daddr", "meta l4proto", "th sport", "th dport"]
+    # Protocol families implied by nftables match templates, used to tell disjoint policies apart
+    families = {
+        "ip ": "ip",
+        "ip6 ": "ip6",
+        "ct original ip ": "ip",
+        "ct original ip6 ": "ip6",
+        "arp ": "arp"
+    }
+
+
+    def __init__(self, top_policies: dict, name_prefix: str = "") -> None:
+        """
+        Initialize a new VerdictMaps object, and group the policies into verdict maps.
+
+        Args:
+            top_policies (dict): Dictionary mapping top-level policy names to their list of single policies,
+                                 in the order of the nftables rules
+            name_prefix (str): Prefix of the map and chain names.
+                               Optional, default is an empty string.
+        """
+        self.name_prefix = name_prefix
+        self.maps = []         # List of verdict maps, with the form {"name": ..., "selectors": ..., "type": ..., "interval": ..., "elements": ..., "policies": ...}
+        self.chains = {}       # nftables actions which are not a simple verdict, mapped to the name of the chain applying them
+        self.policy_maps = {}  # Policies mapped to the verdict map they belong to
+
+        # Policies whose rule is present in the nftables ingress chain, in the order of the rules
+        policies = [
+            policy
+            for top_policy in top_policies
+            for policy in top_policies[top_policy]
+            if not policy.periodic and policy.merged_into is None
+        ]
+        matches = [VerdictMaps.get_selectors(policy) for policy in policies]
+
+        # Group policies with the same selectors
+        groups = {}
+        for i, policy in enumerate(policies):
+            selectors = matches[i]
+            if selectors is None or not VerdictMaps.is_mappable(policy, selectors):
+                continue
+            key = tuple(sorted(selectors, key=VerdictMaps.selectors_order.index))
+            if key not in groups:
+                groups[key] = {"index": i, "indices": [i]}
+                continue
+            # The policy's rule moves up to the position of the group's first rule,
+            # which does not change the ruleset semantics only if it does not overlap any rule in between
+            group = groups[key]
+            if not any(VerdictMaps.overlap(policies[i], matches[i], policies[j], matches[j]) for j in range(group["index"], i)):
+                group["indices"].append(i)
+
+        # Build a verdict map for each group of at least two policies
+        for key, group in groups.items():
+            if len(group["indices"]) < 2:
+                continue
+            verdict_map = {
+                "name": f"{name_prefix}policies_{len(self.maps)}",
+                "selectors": list(key),
+                "type": " . ".join(VerdictMaps.selectors[VerdictMaps.get_template(selector)][1] for selector in key),
+                "interval": False,
+                "elements": [],
+                "policies": [policies[i] for i in group["indices"]]
+            }
+            for i in group["indices"]:
+                policy = policies[i]
+                values = [matches[i][selector] for selector in key]
+                verdict = policy.nft_action if policy.nft_action == "accept" else f"goto {self.get_chain(policy.nft_action)}"
+                for element in itertools.product(*values):
+                    verdict_map["elements"].append({"key": " . ".join(element), "verdict": verdict})
+                    if any("/" in value or "-" in value for value in element):
+                        verdict_map["interval"] = True
+                self.policy_maps[policy] = verdict_map
+            self.maps.append(verdict_map)
+
+
+    @staticmethod
+    def get_template(selector: str) -> str:
+        """
+        Retrieve one of the nftables match templates corresponding to a selector.
+
+        Args:
+            selector (str): nftables selector
+        Returns:
+            str: nftables match template
+        """
+        return next(template for template in VerdictMaps.selectors if VerdictMaps.selectors[template][0] == selector)
+
+
+    @staticmethod
+    def get_selectors(policy: Policy) -> dict:
+        """
+        Retrieve the values matched by a policy, for each supported selector.
+        Unsupported matches are ignored.
+
+        Args:
+            policy (Policy): Policy to retrieve the selectors of
+        Returns:
+            dict: Dictionary mapping selectors to the list of matched values,
+                  or None if a selector is matched twice
+        """
+        selectors = {}
+        for match in policy.nft_matches:
+            if match["template"] not in VerdictMaps.selectors:
+                continue
+            selector = VerdictMaps.selectors[match["template"]][0]
+            if selector in selectors:
+                return None
+            selectors[selector] = [value.strip() for value in str(match["match"]).split(",")]
+        return selectors
+
+
+    @staticmethod
+    def is_mappable(policy: Policy, selectors: dict) -> bool:
+        """
+        Check whether a policy's rule can be part of a verdict map,
+        i.e. all its matches are supported selectors, with parsable values.
+
+        Args:
+            policy (Policy): Policy to check
+            selectors (dict): Selectors of the policy
+        Returns:
+            bool: True if the policy's rule can be part of a verdict map, False otherwise
+        """
+        if len(selectors) != len(policy.nft_matches):
+            return False
+        # nftables statistics which are matches (e.g. rate, packet size) cannot be part of a map key
+        for stat in policy.nft_stats:
+            if Policy.stats_metadata[stat].get("type") == Policy.MATCH:
+                return False
+        return all(VerdictMaps.parse_value(selector, value) is not None for selector in selectors for value in selectors[selector])
+
+
+    @staticmethod
+    def parse_value(selector: str, value: str):
+        """
+        Parse a value matched by a selector, to compare it with other values.
+
+        Args:
+            selector (str): nftables selector
+            value (str): matched value
+        Returns:
+            parsed value (IP network, port range or protocol name), or None if the value cannot be parsed
+        """
+        selector_type = VerdictMaps.selectors[VerdictMaps.get_template(selector)][1]
+        try:
+            if selector_type == "ipv4_addr" or selector_type == "ipv6_addr":
+                return ipaddress.ip_network(value, strict=False)
+            elif selector_type == "inet_service":
+                ports = [int(port) for port in value.split("-")]
+                return (ports[0], ports[-1]) if len(ports) <= 2 else None
+            else:
+                return value if value.isalnum() else None
+        except ValueError:
+            return None
+
+
+    @staticmethod
+    def overlap(policy_a: Policy, selectors_a: dict, policy_b: Policy, selectors_b: dict) -> bool:
+        """
+        Check whether two policies' rules could match the same packet.
+        The check is conservative: unsupported matches are considered to match any packet.
+
+        Args:
+            policy_a (Policy): First policy
+            selectors_a (dict): Selectors of the first policy
+            policy_b (Policy): Second policy
+            selectors_b (dict): Selectors of the second policy
+        Returns:
+            bool: False if the rules cannot match the same packet, True otherwise
+        """
+        # Rules for different protocol families cannot match the same packet
+        family_a = VerdictMaps.get_family(policy_a)
+        family_b = VerdictMaps.get_family(policy_b)
+        if family_a and family_b and family_a != family_b:
+            return False
+        if selectors_a is None or selectors_b is None:
+            return True
+        # Rules are disjoint if they match disjoint values for a common selector
+        for selector in selectors_a.keys() & selectors_b.keys():
+            if not any(VerdictMaps.values_overlap(selector, a, b) for a in selectors_a[selector] for b in selectors_b[selector]):
+                return False
+        return True
+
+
+    @staticmethod
+    def values_overlap(selector: str, value_a: str, value_b: str) -> bool:
+        """
+        Check whether two values matched by the same selector overlap.
+
+        Args:
+            selector (str): nftables selector
+            value_a (str): first value
+            value_b (str): second value
+        Returns:
+            bool: True if the values overlap, or cannot be parsed, False otherwise
+        """
+        a = VerdictMaps.parse_value(selector, value_a)
+        b = VerdictMaps.parse_value(selector, value_b)
+        if a is None or b is None:
+            return True
+        if isinstance(a, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+            return a.version == b.version and a.overlaps(b)
+        if isinstance(a, tuple):
+            return a[0] <= b[1] and b[0] <= a[1]
+        return a == b
+
+
+    @staticmethod
+    def get_family(policy: Policy) -> str:
+        """
+        Retrieve the protocol family implied by a policy's matches, if any.
+
+        Args:
+            policy (Policy): Policy to retrieve the family of
+        Returns:
+            str: protocol family (ip, ip6 or arp), or an empty string if the policy matches any family
+        """
+        for match in policy.nft_matches:
+            for prefix, family in VerdictMaps.families.items():
+                if match["template"].startswith(prefix):
+                    return family
+        return ""
+
+
+    def get_chain(self, action: str) -> str:
+        """
+        Retrieve the name of the chain applying an nftables action,
+        which is used as verdict map target for actions which are not a simple verdict
+        (e.g. counters followed by a queue verdict).
+
+        Args:
+            action (str): nftables action
+        Returns:
+            str: name of the chain applying the action
+        """
+        if action not in self.chains:
+            self.chains[action] = f"{self.name_prefix}action_{len(self.chains)}"
+        return self.chains[action]
@@ -0,0 +1,187 @@
+"""
+Benchmark of the IncludeLoader `!include` resolution,
+on synthetic profiles with thousands of includes.
+
+Compares the current loader (parsed document cache and single-pass "self" substitution)
+with the previous implementation, which re-parsed the included file for every include
+and walked the included member once per substituted address.
+
+Usage: python3 benchmarks/include_loader.py [--includes N] [--patterns M] [--repeat R]
+"""
+
+import os
+import sys
+import time
+import copy
+import argparse
+import tempfile
+import collections.abc
+import yaml
+
+# Import the translator's YAML loaders
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from yaml_loaders.IgnoreLoader import IgnoreLoader
+from yaml_loaders.IncludeLoader import IncludeLoader, substitute, clear_document_cache
+
+
+##### PREVIOUS IMPLEMENTATION #####
+
+class LegacyIgnoreLoader(yaml.SafeLoader):
+    """
+    Previous IgnoreLoader, based on the pure Python loader.
+    """
+
+yaml.add_multi_constructor("!", lambda loader, tag_suffix, node: None, LegacyIgnoreLoader)
+
+
+class LegacyIncludeLoader(yaml.SafeLoader):
+    """
+    Previous IncludeLoader, based on the pure Python loader.
+    """
+
+
+def legacy_update_dict_aux(d: dict, key: str, parent_key: str, current_parent_key: str, old_val: str, new_val: str) -> None:
+    for k, v in d.items():
+        if isinstance(v, collections.abc.Mapping):
+            legacy_update_dict_aux(d.get(k, {}), key, parent_key, k, old_val, new_val)
+        elif k == key and current_parent_key == parent_key and v == old_val:
+            d[k] = new_val
+
+
+def legacy_replace_self_addrs(d: dict, mac: str = "", ipv4: str = "", ipv6: str = "") -> None:
+    if mac:
+        legacy_update_dict_aux(d, "sha", "arp", "", "self", mac)
+        legacy_update_dict_aux(d, "tha", "arp", "", "self", mac)
+    if ipv4:
+        legacy_update_dict_aux(d, "src", "ipv4", "", "self", ipv4)
+        legacy_update_dict_aux(d, "dst", "ipv4", "", "self", ipv4)
+    if ipv6:
+        legacy_update_dict_aux(d, "src", "ipv6", "", "self", ipv6)
+        legacy_update_dict_aux(d, "dst", "ipv6", "", "self", ipv6)
+
+
+def legacy_construct_include(loader: LegacyIncludeLoader, node: yaml.Node) -> dict:
+    split1 = loader.construct_scalar(node).split(" ")
+    values_dict = dict(value.split(":") for value in split1[1:] if len(value.split(":")) == 2)
+    path, members = split1[0].split("#")
+    path = os.path.join(os.path.dirname(os.path.abspath(loader.stream.name)), path)
+    with open(path, "r") as f:
+        data = yaml.load(f, LegacyIgnoreLoader)
+    addrs = data["device-info"]
+    for member in members.split("."):
+        data = data[member]
+    data_top = data
+    for key, value in values_dict.items():
+        split_key = key.split(".")
+        for sub_key in split_key[:-1]:
+            data = data[sub_key]
+        data[split_key[-1]] = value
+    legacy_replace_self_addrs(data_top, addrs.get("mac", ""), addrs.get("ipv4", ""), addrs.get("ipv6", ""))
+    return data_top
+
+yaml.add_constructor("!include", legacy_construct_include, LegacyIncludeLoader)
+
+
+##### SYNTHETIC PROFILES #####
+
+def write_profiles(directory: str, num_includes: int, num_patterns: int) -> str:
+    """
+    Write a synthetic pattern library and a device profile including its patterns.
+
+    Args:
+        directory (str): Directory to write the files to
+        num_includes (int): Number of `!include` tags in the device profile
+        num_patterns (int): Number of patterns in the pattern library
+    Returns:
+        str: path to the device profile
+    """
+    library = {
+        "device-info": {"name": "library", "mac": "00:11:22:33:44:55", "ipv4": "192.168.1.2", "ipv6": "fe80::2"},
+        "patterns": {}
+    }
+    for i in range(num_patterns):
+        library["patterns"][f"pattern-{i}"] = {
+            "protocols": {
+                "dns": {"qtype": ["A", "AAAA"], "domain-name": f"domain-{i}.example.com"},
+                "udp": {"dst-port": 53},
+                "ipv4": {"src": "self", "dst": "gateway"},
+                "ipv6": {"src": "self", "dst": "gateway"},
+                "arp": {"type": "request", "sha": "self", "tha": "default"}
+            },
+            "backward": True,
+            "stats": {"rate": "10/second burst 100 packets"}
+        }
+    with open(os.path.join(directory, "library.yaml"), "w") as f:
+        yaml.safe_dump(library, f)
+
+    profile_path = os.path.join(directory, "profile.yaml")
+    with open(profile_path, "w") as f:
+        f.write("device-info:\n  name: device\n  mac: 00:00:00:00:00:01\n  ipv4: 192.168.1.1\n\n")
+        f.write("individual-policies:\n")
+        for i in range(num_includes):
+            f.write(f"  policy-{i}: !include library.yaml#patterns.pattern-{i % num_patterns} protocols.dns.domain-name:host-{i}.example.com\n")
+    return profile_path
+
+
+##### BENCHMARK #####
+
+def load(profile_path: str, loader_class: type) -> dict:
+    """
+    Load a device profile with the given loader.
+    """
+    with open(profile_path, "r") as f:
+        return yaml.load(f, loader_class)
+
+
+def best_time(func, repeat: int) -> float:
+    """
+    Return the best execution time of a function, in seconds, over `repeat` runs.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the IncludeLoader on synthetic profiles")
+    parser.add_argument("--includes", type=int, default=2000, help="Number of includes in the profile (default: 2000)")
+    parser.add_argument("--patterns", type=int, default=10, help="Number of patterns in the included library (default: 10)")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs, the best one is kept (default: 3)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        profile_path = write_profiles(directory, args.includes, args.patterns)
+
+        # Full profile loading (the previous loader is timed once, as it is orders of magnitude slower)
+        start = time.perf_counter()
+        legacy_profile = load(profile_path, LegacyIncludeLoader)
+        legacy_load = time.perf_counter() - start
+        def load_current():
+            clear_document_cache()
+            load(profile_path, IncludeLoader)
+        current_load = best_time(load_current, args.repeat)
+
+        # Both implementations must produce the same profile
+        if legacy_profile != load(profile_path, IncludeLoader):
+            print("Error: the loaders produce different profiles", file=sys.stderr)
+            sys.exit(1)
+
+        # "self" substitution only, on the included members
+        with open(os.path.join(directory, "library.yaml"), "r") as f:
+            library = yaml.load(f, IgnoreLoader)
+        addrs = library["device-info"]
+        members = [library["patterns"][f"pattern-{i % args.patterns}"] for i in range(args.includes)]
+        copies = [copy.deepcopy(member) for member in members]
+        legacy_substitution = best_time(lambda: [legacy_replace_self_addrs(member, addrs["mac"], addrs["ipv4"], addrs["ipv6"]) for member in copy.deepcopy(copies)], args.repeat)
+        deepcopy_time = best_time(lambda: copy.deepcopy(copies), args.repeat)
+        legacy_substitution -= deepcopy_time
+        current_substitution = best_time(lambda: [substitute(member, addrs, {"protocols": {"dns": {"domain-name": "host.example.com"}}}) for member in members], args.repeat)
+
+    print(f"Synthetic profile: {args.includes} includes of {args.patterns} patterns")
+    print(f"{'':<24}{'previous':>12}{'current':>12}{'speedup':>10}")
+    print(f"{'profile loading':<24}{legacy_load:>11.3f}s{current_load:>11.3f}s{legacy_load / current_load:>9.1f}x")
+    print(f"{'self substitution':<24}{legacy_substitution:>11.3f}s{current_substitution:>11.3f}s{legacy_substitution / current_substitution:>9.1f}x")
@@ -1,9 +1,77 @@
+import hashlib
 from protocols.Protocol import Protocol
 
 class Custom(Protocol):
 
     # Class variables
     custom_parser = True  # Whether the protocol has a custom parser
+    copy_range = None     # Number of bytes after the layer 3 and 4 headers needed by the custom parser,
+                          # or None if it needs the whole packet (e.g. variable-length messages)
+    # 32-bit FNV-1a parameters, must match the C `string_hash` and `dns_domain_hash` functions
+    fnv_offset_basis = 2166136261
+    fnv_prime = 16777619
+
+
+    @staticmethod
+    def string_hash(string: str) -> int:
+        """
+        Compute the hash of a string, as the C `string_hash` function:
+        the 32-bit FNV-1a hash of the string characters.
+
+        Args:
+            string (str): String to hash
+        Returns:
+            int: hash of the string
+        """
+        h = Custom.fnv_offset_basis
+        for byte in string.encode():
+            h = ((h ^ byte) * Custom.fnv_prime) & 0xffffffff
+        return h
+
+
+    @staticmethod
+    def build_string_set(strings: list) -> dict:
+        """
+        Build the static string set matching a list of strings.
+
+        Args:
+            strings (list): List of strings
+        Returns:
+            dict: string set, with its C variable name,
+                  and its entries (hash and string), sorted by hash
+        """
+        entries = [{"hash": Custom.string_hash(string), "value": string} for string in dict.fromkeys(str(string) for string in strings)]
+        entries.sort(key=lambda entry: (entry["hash"], entry["value"]))
+        # Name derived from the set content, such that policies matching the same strings share the set
+        digest = hashlib.sha256(",".join(sorted(entry["value"] for entry in entries)).encode()).hexdigest()[:8]
+        return {"name": f"string_set_{digest}", "entries": entries}
+
+
+    def add_string_field(self, field: str, string: str, is_backward: bool = False) -> None:
+        """
+        Add a new nfqueue match of a string field to the accumulator.
+        A single value is compared with `strcmp`,
+        while a list of values is looked up at once in a static string set (see `build_string_set`),
+        instead of comparing the field with each value.
+
+        Args:
+            field (str): Field to add the rule for.
+            string (str): C expression of the string to match.
+            is_backward (bool): Whether the field to add is for a backward rule.
+                                Optional, default is `False`.
+        """
+        if field not in self.protocol_data or is_backward:
+            return
+        value = self.protocol_data[field]
+        if type(value) == list and len(value) > 1:
+            string_set = Custom.build_string_set(value)
+            self.rules["nfq"].append({
+                "template": f"string_set_contains(&{{}}, {string})",
+                "match": string_set["name"],
+                "string_set": string_set
+            })
+        else:
+            self.add_field(field, {"forward": f"strcmp({string}, \"{{}}\") == 0"}, is_backward)
 
     def add_field(self, field: str, template_rules: dict, is_backward: bool = False, func = lambda x: x, backward_func = lambda x: x) -> None:
         """
@@ -5,6 +5,13 @@ class Protocol:
     """
     Generic protocol, inherited by all concrete protocols.
     """
+
+    # Registry of supported protocols, mapping protocol names to protocol classes.
+    # Populated lazily, on the first lookup of each protocol name,
+    # or explicitly with `register` (e.g. by plugins).
+    registry = {}
+    # Names which do not correspond to a supported protocol
+    unsupported = set()
     
 
     def __init__(self, protocol_data: dict, device: dict) -> None:
@@ -23,6 +30,48 @@ class Protocol:
         }
 
 
+    @classmethod
+    def register(c, protocol_name: str, cls: type) -> None:
+        """
+        Register a protocol class, e.g. provided by a plugin.
+        Overrides any protocol already registered with the same name.
+
+        Args:
+            protocol_name (str): Name of the protocol, as used in the YAML profiles.
+            cls (type): Protocol class, which must inherit from `Protocol`.
+        """
+        c.registry[protocol_name] = cls
+        c.unsupported.discard(protocol_name)
+
+
+    @classmethod
+    def get_protocol_class(c, protocol_name: str) -> type:
+        """
+        Retrieve the class of a protocol from the registry.
+        If the protocol is not registered yet, import it from the `protocols` package,
+        and cache the result, be it the protocol class or the fact that it is unsupported.
+
+        Args:
+            protocol_name (str): Name of the protocol.
+        Returns:
+            type: protocol class, or None if the protocol is not supported
+        """
+        cls = c.registry.get(protocol_name)
+        if cls is not None or protocol_name in c.unsupported:
+            return cls
+        try:
+            module = importlib.import_module(f"protocols.{protocol_name}")
+        except ModuleNotFoundError as e:
+            if e.name != f"protocols.{protocol_name}":
+                # Error in a supported protocol module
+                raise
+            c.unsupported.add(protocol_name)
+            return None
+        cls = getattr(module, protocol_name)
+        c.registry[protocol_name] = cls
+        return cls
+
+
     @classmethod
     def init_protocol(c, protocol_name: str, protocol_data: dict, device: dict) -> Protocol:
         """
@@ -32,10 +81,11 @@ class Protocol:
             protocol_name (str): Name of the protocol.
             protocol_data (dict): Dictionary containing the protocol data.
             device (dict): Dictionary containing the device metadata.
+        Returns:
+            Protocol: protocol object, or None if the protocol is not supported
         """
-        module = importlib.import_module(f"protocols.{protocol_name}")
-        cls = getattr(module, protocol_name)
-        return cls(protocol_data, device)
+        cls = c.get_protocol_class(protocol_name)
+        return cls(protocol_data, device) if cls is not None else None
 
     
     def format_list(self, l: list, func = lambda x: x) -> str:
@@ -37,7 +37,6 @@ class coap(Custom):
         self.add_field("method", rule, is_backward, func)
 
         # Handle CoAP URI
-        rule = {"forward": "strcmp(message.uri, \"{}\") == 0"}
-        self.add_field("uri", rule, is_backward)
+        self.add_string_field("uri", "message.uri", is_backward)
         
         return self.rules
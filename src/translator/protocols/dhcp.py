@@ -30,8 +30,8 @@ class dhcp(Custom):
         func = lambda dhcp_type: dhcp_type.upper()
         self.add_field("type", rules, is_backward, func)
         # Handle DHCP client MAC address
-        rules = {"forward": "strcmp(mac_hex_to_str(message.chaddr), \"{}\") == 0"}
-        # Lambda function to explicit a self MAC address
-        func = lambda mac: self.device['mac'] if mac == "self" else mac
+        rules = {"forward": "memcmp(message.chaddr, {}, MAC_ADDR_LENGTH) == 0"}
+        # Lambda function to explicit a self MAC address, and convert it to a constant byte array
+        func = lambda mac: "(const uint8_t[]) {" + ", ".join(f"{int(byte, 16):#04x}" for byte in (self.device['mac'] if mac == "self" else mac).split(":")) + "}"
         self.add_field("client-mac", rules, is_backward, func)
         return self.rules
@@ -1,3 +1,4 @@
+import hashlib
 from protocols.Custom import Custom
 
 class dns(Custom):
@@ -46,8 +47,66 @@ class dns(Custom):
         self.add_field("qtype", rules, is_backward, func)
 
         # Handle DNS domain name
-        rule = "dns_contains_domain_name(message.questions, message.header.qdcount, \"{}\")"
-        rules = {"forward": rule, "backward": rule}
-        self.add_field("domain-name", rules, is_backward)
+        domain_names = self.protocol_data.get("domain-name")
+        if type(domain_names) == list or (type(domain_names) == str and domain_names.startswith("*.")):
+            # Multiple domain names, or wildcard: match all questions against a generated domain set
+            domain_names = domain_names if type(domain_names) == list else [domain_names]
+            domain_set = dns.build_domain_set(domain_names)
+            self.rules["nfq"].append({
+                "template": "dns_contains_domain_set(message.questions, message.header.qdcount, &{})",
+                "match": domain_set["name"],
+                "domain_set": domain_set
+            })
+        elif domain_names is not None:
+            # Single domain name
+            self.rules["nfq"].append({
+                "template": "dns_contains_domain_name(message.questions, message.header.qdcount, \"{}\")",
+                "match": domain_names,
+                "domain_name": domain_names
+            })
         
         return self.rules
+
+
+    @staticmethod
+    def domain_hash(domain_name: str) -> int:
+        """
+        Compute the hash of a domain name, as the C `dns_domain_hash` function:
+        the 32-bit FNV-1a hash of the domain name characters, in reverse order.
+
+        Args:
+            domain_name (str): Domain name to hash
+        Returns:
+            int: hash of the domain name
+        """
+        h = dns.fnv_offset_basis
+        for byte in reversed(domain_name.encode()):
+            h = ((h ^ byte) * dns.fnv_prime) & 0xffffffff
+        return h
+
+
+    @staticmethod
+    def build_domain_set(domain_names: list) -> dict:
+        """
+        Build the static domain set matching a list of domain names,
+        which can contain wildcard patterns (e.g. `*.meethue.com`, matching all subdomains of `meethue.com`).
+
+        Args:
+            domain_names (list): List of domain names and wildcard patterns
+        Returns:
+            dict: domain set, with its C variable name,
+                  and its patterns (hash, wildcard flag and domain name), sorted by hash
+        """
+        patterns = []
+        for domain_name in dict.fromkeys(str(domain_name) for domain_name in domain_names):
+            wildcard = domain_name.startswith("*.")
+            name = domain_name[2:] if wildcard else domain_name
+            patterns.append({"hash": dns.domain_hash(name), "wildcard": wildcard, "domain_name": name})
+        patterns.sort(key=lambda pattern: (pattern["hash"], pattern["domain_name"]))
+        # Name derived from the set content, such that policies matching the same domains share the set
+        digest = hashlib.sha256(",".join(sorted(str(domain_name) for domain_name in domain_names)).encode()).hexdigest()[:8]
+        return {
+            "name": f"dns_domain_set_{digest}",
+            "has_wildcards": any(pattern["wildcard"] for pattern in patterns),
+            "patterns": patterns
+        }
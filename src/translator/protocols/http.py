@@ -46,7 +46,6 @@ class http(Custom):
         self.add_field("method", rule, is_backward, func)
 
         # Handle HTTP URI
-        rule = {"forward": "strcmp(message.uri, \"{}\") == 0"}
-        self.add_field("uri", rule, is_backward)
+        self.add_string_field("uri", "message.uri", is_backward)
         
         return self.rules
@@ -45,12 +45,12 @@ class igmp(Custom):
         # Handle IGMP group
         if version == 3:
             # IGMPv3: consider only the first group record's multicast address
-            rules = {"forward": "strcmp(ipv4_net_to_str((message.body.v3_membership_report.groups)->group_address), \"{}\") == 0"}
+            rules = {"forward": "(message.body.v3_membership_report.groups)->group_address == {}"}
         else:
             # IGMPv1 and IGMPv2
-            rules = {"forward": "strcmp(ipv4_net_to_str(message.body.v2_message.group_address), \"{}\") == 0"}
-        # Lambda function to explicit the address of a well-known group
-        func = lambda igmp_group: self.groups[igmp_group] if igmp_group in self.groups else igmp_group
+            rules = {"forward": "message.body.v2_message.group_address == {}"}
+        # Lambda function to explicit the address of a well-known group, as a constant in network byte order
+        func = lambda igmp_group: "IPV4_ADDR_NET(" + ", ".join(str(self.groups.get(igmp_group, igmp_group)).split(".")) + ")"
         self.add_field("group", rules, is_backward, func)
         
         return self.rules
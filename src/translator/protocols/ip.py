@@ -73,6 +73,52 @@ class ip(Protocol):
             # Address is an explicit address
             return addr
 
+
+    @staticmethod
+    def c_value(address: Union[ipaddress.IPv4Address, ipaddress.IPv6Address]) -> str:
+        """
+        Return the C initializer of an IP address value (`ip_val_t`),
+        in network byte order, without any runtime conversion.
+
+        Args:
+            address (Union[ipaddress.IPv4Address, ipaddress.IPv6Address]): IP address
+        Returns:
+            str: C initializer of the IP address value.
+        """
+        if address.version == 4:
+            return "{.ipv4 = IPV4_ADDR_NET(" + ", ".join(str(byte) for byte in address.packed) + ")}"
+        return "{.ipv6 = {" + ", ".join(f"{byte:#04x}" for byte in address.packed) + "}}"
+
+
+    def address_match(self, addr: str, packet_addr: str) -> tuple:
+        """
+        Build the nfqueue match of a packet address against an IP address alias or explicit address.
+        The matched addresses and prefixes are C constant initializers,
+        such that no address is parsed nor allocated when a packet is processed.
+        Aliases corresponding to multiple addresses or prefixes produce a disjunction.
+
+        Args:
+            addr (str): IP address alias or explicit address
+            packet_addr (str): C expression of the packet address, escaped for `str.format`
+        Returns:
+            tuple: match template, and list of the matched addresses or prefixes initializers
+        """
+        templates = []
+        values = []
+        for explicit in str(self.explicit_address(addr)).split(","):
+            network = ipaddress.ip_network(explicit.strip(), strict=False)
+            address = "{.version = " + str(network.version) + ", .value = " + ip.c_value(network.network_address) + "}"
+            if network.prefixlen == network.max_prefixlen:
+                # Single address
+                templates.append(f"compare_ip({packet_addr}, {{}})")
+                values.append(f"(ip_addr_t) {address}")
+            else:
+                # Prefix
+                templates.append(f"ip_prefix_contains({{}}, {packet_addr})")
+                values.append(f"(ip_prefix_t) {{.address = {address}, .mask = {ip.c_value(network.netmask)}}}")
+        template = templates[0] if len(templates) == 1 else f"( {' || '.join(templates)} )"
+        return template, values
+
     
     def add_addr_nfqueue(self, addr_dir: str, is_backward: bool = False) -> None:
         """
@@ -85,45 +131,68 @@ class ip(Protocol):
         """
         other_dir = "src" if addr_dir == "dst" else "dst"
         version = int(self.protocol_name[3])
-        # Template rules for a domain name
+        # Template rules for a domain name, looked up in the DNS map by its ID (see `Policy.set_domain_ids`)
         rules_domain_name = {
-            "forward": "dns_entry_contains(dns_map_get(dns_map, \"{}\"), (ip_addr_t) {{.version = " + str(version) + ", .value." + self.protocol_name + " = get_" + self.protocol_name + "_" + addr_dir + "_addr(payload)}})",
-            "backward": "dns_entry_contains(dns_map_get(dns_map, \"{}\"), (ip_addr_t) {{.version = " + str(version) + ", .value." + self.protocol_name + " = get_" + self.protocol_name + "_" + other_dir + "_addr(payload)}})"
+            "forward": "dns_map_contains_id(dns_map, {}, (ip_addr_t) {{.version = " + str(version) + ", .value." + self.protocol_name + " = get_" + self.protocol_name + "_" + addr_dir + "_addr(payload)}})",
+            "backward": "dns_map_contains_id(dns_map, {}, (ip_addr_t) {{.version = " + str(version) + ", .value." + self.protocol_name + " = get_" + self.protocol_name + "_" + other_dir + "_addr(payload)}})"
         }
-        # Template rules for an IP address
-        rules_address = {
-            "forward": "compare_ip((ip_addr_t) {{.version = " + str(version) + ", .value." + self.protocol_name + " = get_" + self.protocol_name + "_" + addr_dir + "_addr(payload)}}, ip_str_to_net(\"{}\", " + str(version) + "))",
-            "backward": "compare_ip((ip_addr_t) {{.version = " + str(version) + ", .value." + self.protocol_name + " = get_" + self.protocol_name + "_" + other_dir + "_addr(payload)}}, ip_str_to_net(\"{}\", " + str(version) + "))"
+        # Template rules for a set of domain names, looked up at once in the DNS map reverse index,
+        # by the bitmask of their IDs (see `Policy.set_domain_ids`)
+        rules_domain_set = {
+            "forward": "dns_map_contains_ip(dns_map, (ip_addr_t) {{.version = " + str(version) + ", .value." + self.protocol_name + " = get_" + self.protocol_name + "_" + addr_dir + "_addr(payload)}}, (const uint64_t[]) {{ {} }})",
+            "backward": "dns_map_contains_ip(dns_map, (ip_addr_t) {{.version = " + str(version) + ", .value." + self.protocol_name + " = get_" + self.protocol_name + "_" + other_dir + "_addr(payload)}}, (const uint64_t[]) {{ {} }})"
         }
+        # Packet addresses, matched against IP addresses (see `address_match`)
+        packet_addrs = {
+            "forward": "(ip_addr_t) {{.version = " + str(version) + ", .value." + self.protocol_name + " = get_" + self.protocol_name + "_" + addr_dir + "_addr(payload)}}",
+            "backward": "(ip_addr_t) {{.version = " + str(version) + ", .value." + self.protocol_name + " = get_" + self.protocol_name + "_" + other_dir + "_addr(payload)}}"
+        }
+        direction = "backward" if is_backward else "forward"
 
         value = self.protocol_data[addr_dir]
         rules = {}
         # If value from YAML profile is a list, produce disjunction of all elements
         if type(value) == list:
-            template = "( "
+            terms = []
             match = []
             # Value is a list
-            for i in range(len(value)):
-                if i != 0:
-                    template += " || "
-                is_ip = self.is_ip(value[i])
-                template_rules = rules_address if is_ip else rules_domain_name
-                func = self.explicit_address if is_ip else lambda x: x
-                match.append(func(value[i]))
-                if not is_backward:
-                    template += template_rules["forward"]
-                elif is_backward and "backward" in template_rules:
-                    template += template_rules["backward"]
-            rules = {"template": f"{template} )", "match": match}
+            domain_names = [v for v in value if not self.is_ip(v)]
+            for v in value:
+                if self.is_ip(v):
+                    template, values = self.address_match(v, packet_addrs[direction])
+                    terms.append(template)
+                    match += values
+                elif len(domain_names) > 1:
+                    # Multiple domain names: single check for all of them, at the position of the first one
+                    if v != domain_names[0]:
+                        continue
+                    terms.append(rules_domain_set[direction])
+                    match.append(domain_names)
+                else:
+                    terms.append(rules_domain_name[direction])
+                    match.append(v)
+            rules = {"template": f"( {' || '.join(terms)} )", "match": match}
+        elif self.is_ip(value):
+            # Value is a single IP address
+            template, values = self.address_match(value, packet_addrs[direction])
+            rules = {"template": template, "match": values if len(values) > 1 else values[0]}
         else:
-            # Value is a single element
-            is_ip = self.is_ip(value)
-            template_rules = rules_address if is_ip else rules_domain_name
-            func = self.explicit_address if is_ip else lambda x: x
-            if not is_backward:
-                rules = {"template": template_rules["forward"], "match": func(value)}
-            elif is_backward and "backward" in template_rules:
-                rules = {"template": template_rules["backward"], "match": func(value)}
+            # Value is a single domain name
+            rules = {"template": rules_domain_name[direction], "match": value}
+
+        values = value if type(value) == list else [value]
+        if rules:
+            rules["dns_map_names"] = [v for v in values if not self.is_ip(v)]
+        # Domain names only: the addresses can also be matched in an nftables set,
+        # filled with the addresses learned from DNS answers (see `Policy.use_dns_sets`)
+        if rules and not any(self.is_ip(v) for v in values):
+            set_dir = other_dir if is_backward else addr_dir
+            rules["dns_set"] = {
+                "selector": f"{self.nft_prefix} {'saddr' if set_dir == 'src' else 'daddr'}",
+                "type": f"{self.protocol_name}_addr",
+                "version": version,
+                "domain_names": values
+            }
 
         # Append rules
         if rules:
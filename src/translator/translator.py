@@ -1,12 +1,38 @@
 import os
+import sys
+import time
 import argparse
+import importlib.util
+import concurrent.futures
 from pathlib import Path
 import yaml
 import jinja2
 from Policy import Policy
+from TranslationCache import TranslationCache
+from VerdictMaps import VerdictMaps
 from yaml_loaders.IncludeLoader import IncludeLoader
 
 
+# This script's path
+script_path = os.path.abspath(os.path.dirname(__file__))
+# Name of the nftables table combining multiple devices on a gateway
+gateway_table = "gateway"
+# Network interface the nftables ingress chain is attached to
+nft_interface = "enp0s8"
+# Log levels of the generated nfqueue callbacks, mapped to their verbosity:
+# none: no logs, verdict: accepted packets only, debug: all received packets, with their parsed messages
+log_levels = {"none": 0, "verdict": 1, "debug": 2}
+# Parameters of the nfqueue high-throughput mode, in the profile's `device-info.nfqueue` section,
+# mapped to the corresponding field of the C `nfqueue_config_t` structure
+nfqueue_options = {
+    "rcvbuf": "rcvbuf",
+    "queue-maxlen": "queue_maxlen",
+    "batch-size": "batch_size",
+    "stats-interval": "stats_interval",
+    "fail-open": "fail_open"
+}
+
+
 def is_list(value: any) -> bool:
     """
     Custom filter for Jinja2, to check whether a value is a list.
@@ -65,10 +91,20 @@ def parse_policy(policy_data: dict, acc: dict, policies_count: int, parent_polic
     """
     # Create and parse policy
     policy = Policy(**policy_data)
-    policy.parse()
-    # Build policy nftables rule
-    nfq_id = acc["nfq_id"] if ((policy_data["is_backward"] and not policy.periodic) or policy.nfq_matches or policy.counters) else -1
-    policy.build_nft_rule(nfq_id)
+    policy.parse(acc["dns_sets"])
+    # Build policy nftables rule.
+    # A policy whose domain names are matched in nftables sets is still queued if it is part of an interaction,
+    # to follow the interaction's state
+    is_queued = (policy_data["is_backward"] and not policy.periodic) or policy.nfq_matches or policy.counters or (policy.dns_sets and policies_count > 1 and not policy.periodic)
+    nfq_id = acc["nfq_id"] if is_queued else -1
+    nfq_mark = 0
+    if is_queued and acc["nfq_dispatch"]:
+        # All the queued policies share the top-level policy's queue, and are told apart by their mark
+        nfq_id = acc["nfq_base"]
+        nfq_mark = acc["index"] + 1
+    if is_queued and nfq_id + acc["nfq_workers"] > acc["nfq_base"] + 100:
+        raise ValueError(f"Policy {policy_data['policy_name']} needs more than 100 nfqueue queues with {acc['nfq_workers']} workers per policy")
+    policy.build_nft_rule(nfq_id, nfq_mark, acc["nfq_workers"])
 
     # Derive policy names
     policy_name = policy_data["policy_name"]
@@ -79,15 +115,16 @@ def parse_policy(policy_data: dict, acc: dict, policies_count: int, parent_polic
     else:
         # Policy direction is forward
         default_policy_name = policy_name
+    is_interaction = parent_policy is not None
     if parent_policy is None:
         parent_policy = default_policy_name
         full_policy_name = parent_policy
     else:
         full_policy_name = f"{parent_policy}-{default_policy_name}"
 
-    # Add threads for this policy
+    # Add threads for this policy (one per worker, if the policy's queue is fanned out)
     if policy.nfq_matches or policy.counters or (policies_count > 1 and not policy.periodic):
-        acc["max_threads"] += 1
+        acc["max_threads"] += acc["nfq_workers"] if is_queued else 1
 
     # Add states for this policy (if needed)
     last_policy = acc["index"] == policies_count - 1
@@ -103,14 +140,33 @@ def parse_policy(policy_data: dict, acc: dict, policies_count: int, parent_polic
             counter = policy.counters[stat]
             acc["max_counters"][stat] = acc["max_counters"].get(stat, 0) + len(counter)
     
+    # Add nftables gate set (if periodic), shared by the forward and backward rules of the policy.
+    # The gates of the policies active in the initial state are initially enabled.
+    if policy.periodic:
+        policy.nft_gate = f"{policy.name_prefix}{full_policy_name}-gate"
+        acc["nft_gates"][policy.nft_gate] = acc["nft_gates"].get(policy.nft_gate, False) or acc["index"] == 0
+
+    # Add nftables sets of addresses learned from DNS answers (if any), shared by the device's policies
+    for dns_set in policy.dns_sets:
+        acc["nft_dns_sets"][dns_set["name"]] = dns_set["type"]
+
     # Add custom parser (if any)
     if policy.custom_parser:
         acc["custom_parsers"].add(policy.custom_parser)
 
-    # Check if this policy's nftables match is already present
-    if policy.nft_match in acc["map_rule_to_policies"]:
-        # TODO: add counter and nfqueue matches
-        pass
+    # Check if this policy's nftables match is already present,
+    # and if so, merge this policy's rule into the first rule with the same match
+    if policy.nft_match in acc["map_rule_to_policies"] and policy.is_mergeable():
+        for previous_policy in acc["map_rule_to_policies"][policy.nft_match]:
+            if previous_policy.is_mergeable():
+                previous_policy.merge_nft_rule(policy)
+                break
+    # nftables only queues a packet once, to the first matching rule,
+    # so a queued policy merged into another policy's rule never receives its packets
+    if policy.merged_into is not None and policy.nfq_id >= 0 and (policy.nfq_id, policy.nfq_mark) != (policy.merged_into.nfq_id, policy.merged_into.nfq_mark):
+        consequence = f"interaction {parent_policy} can never start" if is_interaction and acc["index"] == 0 else "its nfqueue callback is never called"
+        print(f"Warning: device {policy_data['device']['name']}: policy {policy.name} of {parent_policy} is shadowed by the rule of policy {policy.merged_into.name}, "
+              f"which queues its packets to queue {policy.merged_into.nfq_id}: {consequence}", file=sys.stderr)
 
     # Add nftables rules
     acc["top_policies"][parent_policy] = acc["top_policies"].get(parent_policy, []) + [policy]
@@ -121,66 +177,124 @@ def parse_policy(policy_data: dict, acc: dict, policies_count: int, parent_polic
         acc["map_policy_to_counters"][full_policy_name] = policy.counters["packet-count"]
 
     acc["index"] += 1
-    acc["nfq_id"] += 1
+    acc["nfq_id"] += acc["nfq_workers"]
     return policy
 
 
-# Program entry point
-if __name__ == "__main__":
-
-    # Commande line arguments
-    description = "Translate a device YAML profile to a corresponding nfqueue C code"
-    parser = argparse.ArgumentParser(description=description)
-    parser.add_argument("profile", help="Path to the device YAML profile")
-    args = parser.parse_args()
-
-    # Retrieve useful paths
-    script_path = os.path.abspath(os.path.dirname(__file__))      # This script's path
-    device_path = os.path.abspath(os.path.dirname(args.profile))  # Device profile's path
+def translate_profile(profile_path: str, use_cache: bool = True, plugins: list = [], nft_maps: bool = False, gateway: bool = False, nfq_id_range: tuple = (0, 65536), log_level: str = "debug", log_sample: int = 1, nfq_dispatch: bool = False, dns_sets: bool = False) -> dict:
+    """
+    Translate a single device YAML profile to the corresponding nfqueue C files,
+    nftables script and CMake file, written in the profile's directory.
+    Output files whose content did not change are left untouched.
 
-    # Jinja2 loader
-    loader = jinja2.FileSystemLoader(searchpath=f"{script_path}/templates")
-    env = jinja2.Environment(loader=loader, trim_blocks=True, lstrip_blocks=True)
-    # Add custom Jinja2 filters
-    env.filters["is_list"] = is_list
-    env.filters["debug"] = debug
+    Args:
+        profile_path (str): Path to the device YAML profile
+        use_cache (bool): Whether to skip the translation of profiles and policies
+                          which did not change since the last translation.
+                          Optional, default is `True`.
+        plugins (list): Paths to the loaded protocol plugins, which are part of the cache keys.
+                        Optional, default is an empty list.
+        nft_maps (bool): Whether to group the nftables rules of compatible policies into verdict maps.
+                         Optional, default is `False`.
+        gateway (bool): Whether the device is part of a gateway ruleset, shared by multiple devices.
+                        If `True`, the nftables script only contains the device's chain and objects,
+                        in the gateway table, to be combined with `write_gateway`.
+                        Optional, default is `False`.
+        nfq_id_range (tuple): Range of nfqueue queue numbers the device's policies can use,
+                              as (first, last + 1).
+                              Optional, default is all queue numbers.
+        log_level (str): Log level of the generated nfqueue callbacks, one of `log_levels`.
+                         Logs of lower levels are not compiled in.
+                         Optional, default is "debug".
+        log_sample (int): Log only 1 packet out of `log_sample`.
+                          Optional, default is 1 (log all packets).
+        nfq_dispatch (bool): Whether the queued policies of a top-level policy share a single nfqueue queue,
+                             their packets being marked with the policy's identifier,
+                             and dispatched to the policy's callback by a single thread.
+                             Optional, default is `False` (one queue and one thread per policy).
+        dns_sets (bool): Whether to match the domain names of the policies' IP addresses in nftables sets,
+                         filled by the nfqueue callbacks with the addresses answered to DNS queries,
+                         until their TTL expires, plus the DNS map's grace period (DNS_MAP_TTL_GRACE, 300 seconds),
+                         instead of sending all the policies' packets to nfqueue to look the addresses up.
+                         Optional, default is `False`.
+    Returns:
+        dict: metadata of the translated device, from the profile's `device-info`
+    Raises:
+        ValueError: if the device's policies need more nfqueue queues than available in `nfq_id_range`,
+                    or if the device's nfqueue configuration is invalid
+    """
+    device_path = os.path.abspath(os.path.dirname(profile_path))  # Device profile's path
+    # Translation options, part of the cache keys
+    options = {
+        "plugins": TranslationCache.hash_files(plugins),
+        "nft_maps": nft_maps,
+        "gateway": gateway,
+        "nfq_id_range": nfq_id_range,
+        "log_level": log_level,
+        "log_sample": log_sample,
+        "nfq_dispatch": nfq_dispatch,
+        "dns_sets": dns_sets
+    }
+
+    # Skip translation if the profile, its included files and the translator did not change
+    cache = TranslationCache(device_path, use_cache)
+    if cache.is_profile_up_to_date(profile_path, options):
+        print(f"{profile_path} is up to date.")
+        return cache.data["device"]
 
     # Load the device profile
-    with open(args.profile, "r") as f:
+    with open(profile_path, "r") as f:
         
         # Load YAML profile with custom loader
-        profile = yaml.load(f, IncludeLoader)
+        loader = IncludeLoader(f)
+        try:
+            profile = loader.get_single_data()
+        finally:
+            loader.dispose()
 
         # Get device info
         device = profile["device-info"]
+        cache.new_data["device"] = device
+        # nftables table and chain the device's rules belong to,
+        # and prefix of the nftables object names, to avoid collisions between devices sharing the gateway table
+        nft_table = f"netdev {gateway_table}" if gateway else f"netdev {device['name']}"
+        nft_chain = device["name"] if gateway else "ingress"
+        name_prefix = f"{device['name']}-" if gateway else ""
 
         # Create device directory
         nfqueues_path = f"{device_path}/nfqueues"
         Path(nfqueues_path).mkdir(parents=True, exist_ok=True)
 
-        # Initialize header Jinja2 template
-        header_tpl = env.get_template("header.c.j2")
-        header_dict = {"device": device["name"]}
+        # nfqueue runtime configuration
+        nfqueue_config = parse_nfqueue_config(device)
+        nfq_workers = parse_nfqueue_workers(device)
+
+        header_dict = {"device": device["name"], "nfqueue_config": nfqueue_config}
 
-        nfq_id_base = 0  # Base nfqueue id, will be incremented by 100 for each high-level policy
+        nfq_id_base = nfq_id_range[0]  # Base nfqueue id, will be incremented by 100 for each high-level policy
         # Accumulators
         acc = {
             "top_policies": {},
             "map_rule_to_policies": {},
             "map_policy_to_counters": {},
+            "nft_gates": {},
+            "nft_dns_sets": {}
         }
         nfqueues = []
+        nfqueue_renders = []  # Jinja2 template dictionaries of the nfqueue C files, rendered once all the policies are parsed
     
         # Loop over the device's individual policies
         if "individual-policies" in profile:
             for policy_name in profile["individual-policies"]:
                 profile_data = profile["individual-policies"][policy_name]
                 # Populate Jinja2 templates with general data for single policies
-                header_dict["policy"] = policy_name
-                header_dict["nfq_id_base"] = nfq_id_base
+                header_dict = {**header_dict, "policy": policy_name, "nfq_id_base": nfq_id_base}
                 callback_dict = {
-                    "nft_table": f"netdev {device['name']}",
-                    "top_policy": policy_name
+                    "nft_table": nft_table,
+                    "name_prefix": name_prefix,
+                    "top_policy": policy_name,
+                    "log_level": log_levels[log_level],
+                    "log_sample": log_sample
                 }
 
                 policies = []
@@ -188,7 +302,8 @@ if __name__ == "__main__":
                     "policy_name": policy_name,
                     "profile_data": profile_data,
                     "device": device,
-                    "is_backward": False
+                    "is_backward": False,
+                    "name_prefix": name_prefix
                 }
                 acc = {
                     **acc,
@@ -198,7 +313,11 @@ if __name__ == "__main__":
                     "max_threads": 0,
                     "max_counters": {},
                     "custom_parsers": set(),
-                    "nfq_id": nfq_id_base
+                    "nfq_id": nfq_id_base,
+                    "nfq_base": nfq_id_base,
+                    "nfq_dispatch": nfq_dispatch,
+                    "nfq_workers": nfq_workers,
+                    "dns_sets": dns_sets
                 }
                 
                 # Parse policy
@@ -212,13 +331,18 @@ if __name__ == "__main__":
                         "policy_name": f"{policy_name}-backward",
                         "profile_data": profile_data,
                         "device": device,
-                        "is_backward": True
+                        "is_backward": True,
+                        "name_prefix": name_prefix
                     }
                     policy_backward = parse_policy(policy_data_backward, acc, policies_count)
                     policies.append(policy_backward)
 
                 # If need for user-space matching, create nfqueue C file
                 if (is_backward and not policy.periodic) or policy.nfq_matches or policy.counters:
+                    check_nfq_id_range(device, nfq_id_base, nfq_id_range)
+                    nfqueues.append(policy_name)
+                    nfq_id_base += 100
+
                     # Retrieve Jinja2 template directories
                     header_dict = {
                         **header_dict,
@@ -229,30 +353,28 @@ if __name__ == "__main__":
                     }
                     callback_dict = {
                         **callback_dict,
+                        "nft_interface": nft_interface,
                         "multithread": acc["max_threads"] > 1,
                         "states": acc["states"],
                         "policies": policies
                     }
                     main_dict = {
+                        "nft_table": nft_table,
+                        "nfqueue_config": nfqueue_config,
+                        "nfq_dispatch": nfq_dispatch,
+                        "nfq_workers": nfq_workers,
                         "multithread": acc["max_threads"] > 1,
                         "max_counters": acc["max_counters"],
                         "policies": policies,
                         "custom_parsers": acc["custom_parsers"]
                     }
-
-                    # Render Jinja2 templates
-                    header = env.get_template("header.c.j2").render(header_dict)
-                    callback = env.get_template("callback.c.j2").render(callback_dict)
-                    main = env.get_template("main.c.j2").render(main_dict)
-
-                    # Write policy C file
-                    with open(f"{nfqueues_path}/{policy_name}.c", "w+") as fw:
-                        fw.write(header)
-                        fw.write(callback)
-                        fw.write(main)
-                    
-                    nfqueues.append(policy_name)
-                    nfq_id_base += 100
+                    nfqueue_renders.append({
+                        "name": policy_name,
+                        "key": (device, policy_name, profile_data, header_dict["nfq_id_base"]),
+                        "header": header_dict,
+                        "callback": callback_dict,
+                        "main": main_dict
+                    })
 
 
         # Loop over the device's interaction policies
@@ -260,11 +382,13 @@ if __name__ == "__main__":
             for interaction_policy_name in profile["interaction-policies"]:
                 interaction_policy = profile["interaction-policies"][interaction_policy_name]
                 # Populate Jinja2 templates with general data for interaction policies
-                header_dict["policy"] = interaction_policy_name
-                header_dict["nfq_id_base"] = nfq_id_base
+                header_dict = {**header_dict, "policy": interaction_policy_name, "nfq_id_base": nfq_id_base}
                 callback_dict = {
-                    "nft_table": f"netdev {device['name']}",
-                    "top_policy": interaction_policy_name
+                    "nft_table": nft_table,
+                    "name_prefix": name_prefix,
+                    "top_policy": interaction_policy_name,
+                    "log_level": log_levels[log_level],
+                    "log_sample": log_sample
                 }
 
                 # Iterate on single policies
@@ -284,7 +408,11 @@ if __name__ == "__main__":
                     "max_threads": 0,
                     "max_counters": {},
                     "custom_parsers": set(),
-                    "nfq_id": nfq_id_base
+                    "nfq_id": nfq_id_base,
+                    "nfq_base": nfq_id_base,
+                    "nfq_dispatch": nfq_dispatch,
+                    "nfq_workers": nfq_workers,
+                    "dns_sets": dns_sets
                 }
 
                 for single_policy_name in single_policies:
@@ -295,12 +423,17 @@ if __name__ == "__main__":
                         "policy_name": single_policy_name,
                         "profile_data": profile_data,
                         "device": device,
-                        "is_backward": is_backward
+                        "is_backward": is_backward,
+                        "name_prefix": name_prefix
                     }
                     single_policy = parse_policy(policy_data, acc, len(single_policies), interaction_policy_name)
                     policies.append(single_policy)
                 
-                # Render Jinja2 templates
+                check_nfq_id_range(device, nfq_id_base, nfq_id_range)
+                nfqueues.append(interaction_policy_name)
+                nfq_id_base += 100
+
+                # Retrieve Jinja2 template directories
                 header_dict = {
                     **header_dict,
                     "max_threads": acc["max_threads"],
@@ -308,43 +441,417 @@ if __name__ == "__main__":
                     "custom_parsers": acc["custom_parsers"],
                     "states": acc["states"]
                 }
-                header = env.get_template("header.c.j2").render(header_dict)
                 callback_dict = {
                     **callback_dict,
+                    "nft_interface": nft_interface,
                     "multithread": acc["max_threads"] > 1,
                     "states": acc["states"],
                     "policies": policies
                 }
-                callback = env.get_template("callback.c.j2").render(callback_dict)
                 main_dict = {
+                    "nft_table": nft_table,
+                    "nfqueue_config": nfqueue_config,
+                    "nfq_dispatch": nfq_dispatch,
+                    "nfq_workers": nfq_workers,
                     "multithread": acc["max_threads"] > 1,
                     "max_counters": acc["max_counters"],
-                    "policies": policies
+                    "policies": policies,
+                    "custom_parsers": acc["custom_parsers"]
                 }
-                main = env.get_template("main.c.j2").render(main_dict)
-
-                # Write policy C file
-                with open(f"{nfqueues_path}/{interaction_policy_name}.c", "w+") as fw:
-                    fw.write(header)
-                    fw.write(callback)
-                    fw.write(main)
-            
-                nfqueues.append(interaction_policy_name)
-                nfq_id_base += 100
+                nfqueue_renders.append({
+                    "name": interaction_policy_name,
+                    "key": (device, interaction_policy_name, interaction_policy, header_dict["nfq_id_base"]),
+                    "header": header_dict,
+                    "callback": callback_dict,
+                    "main": main_dict
+                })
+
+        # Render the nfqueue C files, once all the policies are parsed,
+        # as the domain name IDs and the nftables sets filled by the DNS callbacks are shared by the whole device
+        device_policies = [policy for top_policy in acc["top_policies"].values() for policy in top_policy]
+        domain_ids = get_domain_ids(device_policies)
+        for policy in device_policies:
+            policy.set_domain_ids(domain_ids)
+        dns_set_updates = get_dns_set_updates(device_policies)
+        for nfqueue_render in nfqueue_renders:
+            # Skip rendering if the policy C file is up to date
+            policy_path = f"{nfqueues_path}/{nfqueue_render['name']}.c"
+            policy_key = TranslationCache.hash_data(*nfqueue_render["key"], options, domain_ids, dns_set_updates)
+            if cache.is_policy_up_to_date(nfqueue_render["name"], policy_key, policy_path):
+                continue
+
+            # Render Jinja2 templates
+            header = get_template("header.c.j2").render(nfqueue_render["header"])
+            callback = get_template("callback.c.j2").render({**nfqueue_render["callback"], "domain_ids": domain_ids, "dns_sets": dns_set_updates})
+            main = get_template("main.c.j2").render({**nfqueue_render["main"], "domain_ids": domain_ids, "dns_sets": dns_set_updates})
+
+            # Write policy C file
+            TranslationCache.write_if_changed(policy_path, header + callback + main)
 
         # Create nftables script
         nft_dict = {
             "device": device["name"],
+            "gateway_table": gateway_table if gateway else None,
+            "nft_chain": nft_chain,
+            "nft_interface": nft_interface,
+            "name_prefix": name_prefix,
             "nft_policies": acc["top_policies"],
-            "counters": acc["map_policy_to_counters"]
+            "counters": acc["map_policy_to_counters"],
+            "gates": acc["nft_gates"],
+            "dns_sets": acc["nft_dns_sets"],
+            "maps": VerdictMaps(acc["top_policies"], name_prefix) if nft_maps else None
         }
-        env.get_template("firewall.nft.j2").stream(nft_dict).dump(f"{device_path}/firewall.nft")
+        nft_path = f"{device_path}/firewall.nft"
+        TranslationCache.write_if_changed(nft_path, get_template("firewall.nft.j2").render(nft_dict))
 
         # Create CMake file
         cmake_dict = {
             "device": device["name"],
             "nfqueues": nfqueues
         }
-        env.get_template("CMakeLists.txt.j2").stream(cmake_dict).dump(f"{device_path}/CMakeLists.txt")
+        cmake_path = f"{device_path}/CMakeLists.txt"
+        TranslationCache.write_if_changed(cmake_path, get_template("CMakeLists.txt.j2").render(cmake_dict))
+
+    # Update translation cache
+    outputs = [nft_path, cmake_path] + [f"{nfqueues_path}/{nfqueue}.c" for nfqueue in nfqueues]
+    cache.update_profile(profile_path, loader.included_paths, options, outputs)
+
+    print(f"Done translating {profile_path}.")
+    return device
+
+
+def get_domain_ids(policies: list) -> dict:
+    """
+    Give a dense integer ID to each domain name referenced by the policies of a device,
+    in the order of their first reference.
+    The IDs index the array of the DNS map holding the domain names known at translation time.
+
+    Args:
+        policies (list): Single policies of the device
+    Returns:
+        dict: Dictionary mapping domain names to their ID
+    """
+    domain_ids = {}
+    for policy in policies:
+        for nfq_match in policy.nfq_matches:
+            # Domain names matched by DNS policies, and looked up in the DNS map
+            domain_names = nfq_match.get("dns_map_names", [])
+            if "domain_name" in nfq_match:
+                domain_names = domain_names + [nfq_match["domain_name"]]
+            if "domain_set" in nfq_match:
+                domain_names = domain_names + [pattern["domain_name"] for pattern in nfq_match["domain_set"]["patterns"] if not pattern["wildcard"]]
+            for domain_name in domain_names:
+                domain_ids.setdefault(domain_name, len(domain_ids))
+        # Domain names matched in nftables sets
+        for dns_set in policy.dns_sets:
+            for domain_name in dns_set["domain_names"]:
+                domain_ids.setdefault(domain_name, len(domain_ids))
+    return domain_ids
+
+
+def get_dns_set_updates(policies: list) -> dict:
+    """
+    Retrieve the nftables sets the nfqueue callbacks must update
+    with the addresses answered to DNS queries, for each domain name.
+
+    Args:
+        policies (list): Single policies matching domain names in nftables sets
+    Returns:
+        dict: Dictionary mapping domain names to the list of nftables sets matching them,
+              with the form {"name": ..., "version": ...}
+    """
+    updates = {}
+    for policy in policies:
+        for dns_set in policy.dns_sets:
+            for domain_name in dns_set["domain_names"]:
+                sets = updates.setdefault(domain_name, [])
+                if not any(s["name"] == dns_set["name"] for s in sets):
+                    sets.append({"name": dns_set["name"], "version": dns_set["version"]})
+    return updates
+
+
+def parse_nfqueue_config(device: dict) -> dict:
+    """
+    Parse the nfqueue runtime configuration of a device,
+    from the `nfqueue` section of its `device-info`, e.g.:
+
+        nfqueue:
+          mode: high-throughput
+          rcvbuf: 8388608
+          fail-open: true
+
+    Args:
+        device (dict): Device metadata
+    Returns:
+        dict: high-throughput mode parameters, mapping the `nfqueue_config_t` fields to their C values
+              (unset parameters take their default value at runtime),
+              or None for the default mode
+    Raises:
+        ValueError: if the section contains an unknown mode or parameter, or an invalid value
+    """
+    nfqueue = device.get("nfqueue", {})
+    mode = nfqueue.get("mode", "default")
+    if mode not in ("default", "high-throughput"):
+        raise ValueError(f"Device {device['name']}: unknown nfqueue mode {mode}")
+    if mode == "default":
+        return None
+    config = {}
+    for key, value in nfqueue.items():
+        if key == "mode" or key == "workers":
+            continue
+        if key not in nfqueue_options:
+            raise ValueError(f"Device {device['name']}: unknown nfqueue parameter {key}")
+        if key == "fail-open":
+            if not isinstance(value, bool):
+                raise ValueError(f"Device {device['name']}: nfqueue parameter {key} must be a boolean")
+            config[nfqueue_options[key]] = "true" if value else "false"
+        else:
+            if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+                raise ValueError(f"Device {device['name']}: nfqueue parameter {key} must be a positive integer")
+            config[nfqueue_options[key]] = value
+    return config
+
+
+def parse_nfqueue_workers(device: dict) -> int:
+    """
+    Parse the number of worker threads per queued policy of a device,
+    from the `workers` parameter of the `nfqueue` section of its `device-info`, e.g.:
+
+        nfqueue:
+          workers: 4
+
+    With more than one worker, the policies' packets are spread over a range of queues
+    by nftables, according to a hash of their flow, each queue being handled by its own thread.
+
+    Args:
+        device (dict): Device metadata
+    Returns:
+        int: number of worker threads per queued policy (default is 1, i.e. a single queue)
+    Raises:
+        ValueError: if the number of workers is not a positive integer
+    """
+    workers = device.get("nfqueue", {}).get("workers", 1)
+    if not isinstance(workers, int) or isinstance(workers, bool) or workers <= 0:
+        raise ValueError(f"Device {device['name']}: nfqueue parameter workers must be a positive integer")
+    return workers
 
-    print(f"Done translating {args.profile}.")
+
+def check_nfq_id_range(device: dict, nfq_id_base: int, nfq_id_range: tuple) -> None:
+    """
+    Check that the nfqueue queues of a top-level policy fit in the device's range of queue numbers.
+
+    Args:
+        device (dict): Device metadata
+        nfq_id_base (int): Base nfqueue id of the top-level policy
+        nfq_id_range (tuple): Range of nfqueue queue numbers the device's policies can use, as (first, last + 1)
+    Raises:
+        ValueError: if the queues do not fit in the range
+    """
+    if nfq_id_base + 100 > nfq_id_range[1]:
+        raise ValueError(f"Device {device['name']} needs more than {nfq_id_range[1] - nfq_id_range[0]} nfqueue queues")
+
+
+def write_gateway(gateway_path: str, devices: list) -> None:
+    """
+    Write the gateway nftables script, combining the rulesets of multiple devices into a single table.
+    Packets are dispatched to the chain of their device with verdict maps on their MAC addresses:
+    a packet sent by a device, including broadcast and multicast packets, is only matched against the policies of its source device,
+    and a packet sent to a device by another host against the policies of its destination device.
+    Other packets are dropped.
+
+    Args:
+        gateway_path (str): Path to the gateway nftables script
+        devices (list): List of (device metadata, path to the device nftables script) tuples,
+                        as translated with `gateway=True`
+    """
+    gateway_devices = []
+    for device, nft_path in devices:
+        if not device.get("mac"):
+            print(f"Warning: device {device['name']}: no MAC address in device-info, its packets never reach its chain in the gateway ruleset", file=sys.stderr)
+        with open(nft_path, "r") as f:
+            gateway_devices.append({**device, "nft_script": f.read()})
+    gateway_dict = {
+        "gateway_table": gateway_table,
+        "nft_interface": nft_interface,
+        "devices": gateway_devices
+    }
+    TranslationCache.write_if_changed(gateway_path, get_template("gateway.nft.j2").render(gateway_dict))
+    print(f"Done writing gateway ruleset {gateway_path}.")
+
+
+def create_jinja_env() -> jinja2.Environment:
+    """
+    Create the Jinja2 environment used to render the templates,
+    with the translator's custom filters.
+    Compiled templates are stored in a persistent bytecode cache,
+    so that templates are only compiled again when they change.
+
+    Returns:
+        jinja2.Environment: Jinja2 environment
+    """
+    templates_path = f"{script_path}/templates"
+    loader = jinja2.FileSystemLoader(searchpath=templates_path)
+    bytecode_cache = None
+    try:
+        os.makedirs(f"{templates_path}/__pycache__", exist_ok=True)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(f"{templates_path}/__pycache__")
+    except OSError:
+        # Templates directory is not writable, compile templates in memory only
+        pass
+    env = jinja2.Environment(loader=loader, bytecode_cache=bytecode_cache, auto_reload=False, trim_blocks=True, lstrip_blocks=True)
+    # Add custom Jinja2 filters
+    env.filters["is_list"] = is_list
+    env.filters["debug"] = debug
+    return env
+
+
+# Jinja2 environment and templates, created and loaded once per process
+jinja_env = None
+templates = {}
+
+def get_template(name: str) -> jinja2.Template:
+    """
+    Retrieve a Jinja2 template, loading it on first use.
+    Templates are loaded once per process, and reused for all policies and profiles.
+
+    Args:
+        name (str): Template file name
+    Returns:
+        jinja2.Template: the template
+    """
+    global jinja_env
+    if name not in templates:
+        if jinja_env is None:
+            jinja_env = create_jinja_env()
+        templates[name] = jinja_env.get_template(name)
+    return templates[name]
+
+
+def find_profiles(paths: list) -> list:
+    """
+    Expand a list of device profile paths and directories into a list of profile paths.
+    A directory is replaced by its own `profile.yaml` file if it has one,
+    or by the `profile.yaml` files of its subdirectories otherwise.
+
+    Args:
+        paths (list): List of paths to device YAML profiles or directories
+    Returns:
+        list: List of paths to device YAML profiles
+    """
+    profiles = []
+    for path in paths:
+        if not os.path.isdir(path):
+            profiles.append(path)
+        elif os.path.isfile(os.path.join(path, "profile.yaml")):
+            profiles.append(os.path.join(path, "profile.yaml"))
+        else:
+            for subdir in sorted(os.listdir(path)):
+                profile_path = os.path.join(path, subdir, "profile.yaml")
+                if os.path.isfile(profile_path):
+                    profiles.append(profile_path)
+    return profiles
+
+
+def load_plugins(paths: list) -> None:
+    """
+    Load protocol plugins, i.e. Python files which register additional protocol classes
+    with `Protocol.register`.
+
+    Args:
+        paths (list): Paths to the plugin Python files
+    """
+    for path in paths:
+        module_name = os.path.splitext(os.path.basename(path))[0]
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+
+def init_worker(plugins: list) -> None:
+    """
+    Initializer for the batch worker processes.
+
+    Args:
+        plugins (list): Paths to the protocol plugins to load
+    """
+    load_plugins(plugins)
+
+
+def translate_profile_timed(profile_path: str, kwargs: dict) -> tuple:
+    """
+    Translate a device profile in a batch worker process, and time the translation.
+
+    Args:
+        profile_path (str): Path to the device YAML profile
+        kwargs (dict): Keyword arguments for `translate_profile`
+    Returns:
+        tuple: profile path, device metadata and translation duration in seconds
+    """
+    start = time.perf_counter()
+    device = translate_profile(profile_path, **kwargs)
+    return profile_path, device, time.perf_counter() - start
+
+
+# Program entry point
+if __name__ == "__main__":
+
+    # Commande line arguments
+    description = "Translate device YAML profiles to the corresponding nfqueue C code"
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("profiles", nargs="+", help="Paths to device YAML profiles, or directories containing them")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of profiles to translate in parallel (default: 1)")
+    parser.add_argument("--no-cache", action="store_true", help="Translate all profiles and policies, even if they did not change")
+    parser.add_argument("--plugin", action="append", default=[], help="Python file registering additional protocols with Protocol.register (can be repeated)")
+    parser.add_argument("--nft-maps", action="store_true", help="Group the nftables rules of compatible policies into verdict maps, matched with a single lookup")
+    parser.add_argument("--gateway", metavar="PATH", help="Also write a gateway nftables script to PATH, combining all the devices in a single table")
+    parser.add_argument("--queue-stride", type=int, default=2000, help="Number of nfqueue queues reserved for each device in the gateway ruleset (default: 2000)")
+    parser.add_argument("--log-level", choices=log_levels.keys(), default="debug", help="Log level of the generated nfqueue callbacks: none, verdict (accepted packets) or debug (all packets, default)")
+    parser.add_argument("--nfq-dispatch", action="store_true", help="Send the queued policies of each nfqueue program to a single queue, dispatching packets to the policies' callbacks by their mark")
+    parser.add_argument("--dns-sets", action="store_true", help="Match domain names in nftables sets, filled with the addresses answered to DNS queries until their TTL, plus a grace period of 300 seconds (DNS_MAP_TTL_GRACE), expires")
+    parser.add_argument("--log-sample", type=int, default=1, metavar="N", help="Log only 1 packet out of N (default: 1)")
+    args = parser.parse_args()
+    if args.log_sample < 1:
+        parser.error("--log-sample must be at least 1")
+
+    profiles = find_profiles(args.profiles)
+    plugins = [os.path.abspath(plugin) for plugin in args.plugin]
+    kwargs = {"use_cache": not args.no_cache, "plugins": plugins, "nft_maps": args.nft_maps, "gateway": args.gateway is not None, "log_level": args.log_level, "log_sample": args.log_sample, "nfq_dispatch": args.nfq_dispatch, "dns_sets": args.dns_sets}
+    # Keyword arguments for each profile, with disjoint nfqueue queue ranges for the devices of a gateway
+    profiles_kwargs = {
+        profile: {**kwargs, "nfq_id_range": (i * args.queue_stride, (i + 1) * args.queue_stride)} if args.gateway else kwargs
+        for i, profile in enumerate(profiles)
+    }
+    translated = {}
+
+    if len(profiles) == 1 and args.jobs == 1:
+        # Single profile, translate it in this process
+        load_plugins(plugins)
+        translated[profiles[0]] = translate_profile(profiles[0], **profiles_kwargs[profiles[0]])
+
+    else:
+        # Batch mode, translate profiles in a process pool
+        start = time.perf_counter()
+        timings = []
+        failed = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker, initargs=(plugins,)) as executor:
+            futures = {executor.submit(translate_profile_timed, profile, profiles_kwargs[profile]): profile for profile in profiles}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    timings.append(future.result())
+                except Exception as e:
+                    print(f"Error while translating {futures[future]}: {e}", file=sys.stderr)
+                    failed.append(futures[future])
+
+        # Print per-device timing summary
+        print(f"\nTranslated {len(timings)} profile(s) with {args.jobs} job(s) in {time.perf_counter() - start:.3f} s:")
+        for profile_path, device, duration in sorted(timings, key=lambda timing: timing[1]["name"]):
+            print(f"  {device['name']:<32} {duration:8.3f} s")
+            translated[profile_path] = device
+        if failed:
+            print(f"Failed to translate {len(failed)} profile(s): {', '.join(failed)}", file=sys.stderr)
+            sys.exit(1)
+
+    # Combine the translated devices in the gateway ruleset, in the profiles order
+    if args.gateway:
+        devices = [(translated[profile], os.path.join(os.path.dirname(os.path.abspath(profile)), "firewall.nft")) for profile in profiles]
+        write_gateway(args.gateway, devices)
@@ -4,9 +4,14 @@ Adapted from https://stackoverflow.com/questions/33048540/pyyaml-safe-load-how-t
 """
 
 import yaml
+# Use libyaml's C loader as base loader, if available
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 
-class IgnoreLoader(yaml.SafeLoader):
+class IgnoreLoader(SafeLoader):
     """
     Custom PyYAML loader, which ignores tags.
     """
@@ -10,75 +10,149 @@ import collections.abc
 
 # Import IgnoreLoader
 sys.path.append(os.path.abspath(os.path.dirname(__file__)))
-from IgnoreLoader import IgnoreLoader
+from IgnoreLoader import IgnoreLoader, SafeLoader
 
 
-class IncludeLoader(yaml.SafeLoader):
+# Cache of the parsed included documents,
+# mapping a file path to its modification time, size and parsed content
+document_cache = {}
+
+# Targets of the "self" address substitution,
+# mapping (parent key, key) pairs to the type of device address replacing "self"
+self_addr_targets = {
+    ("arp", "sha"): "mac",
+    ("arp", "tha"): "mac",
+    ("ipv4", "src"): "ipv4",
+    ("ipv4", "dst"): "ipv4",
+    ("ipv6", "src"): "ipv6",
+    ("ipv6", "dst"): "ipv6"
+}
+
+
+class IncludeLoader(SafeLoader):
     """
     Custom PyYAML loader, which supports inclusion of members defined in other YAML files.
     """
     def __init__(self, stream) -> None:
         # Use parent constructor
         super().__init__(stream)
+        # Path of the loaded document (the C loader does not keep the stream)
+        self.name = stream.name
+        # Paths of the files included by the loaded document
+        self.included_paths = set()
 
 
-def update_dict_aux(d: dict, key: str, parent_key: str, current_parent_key: str, old_val: str, new_val: str) -> None:
+def load_document(path: str) -> dict:
     """
-    Helper recursive function for `update_dict`.
+    Load and parse a YAML document with the IgnoreLoader,
+    or retrieve it from the document cache if the file did not change since it was parsed.
+    The returned document is shared between all includes, and must not be modified.
 
     Args:
-        d: dictionary to update
-        key: key to update the value of
-        parent_key: parent key of `key`
-        current_parent_key: current parent key
-        old_val: value to replace
-        new_val: value to replace with
+        path: path to the YAML document
+    Returns:
+        dict: parsed YAML document
     """
-    for k, v in d.items():
-        if isinstance(v, collections.abc.Mapping):
-            # Value is a dictionary itself, recursion time
-            update_dict_aux(d.get(k, {}), key, parent_key, k, old_val, new_val)
-        else:
-            # Value is a scalar
-            if k == key and current_parent_key == parent_key and v == old_val:
-                d[k] = new_val
+    stat = os.stat(path)
+    cached = document_cache.get(path)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+    with open(path, 'r') as f:
+        data = yaml.load(f, IgnoreLoader)
+    document_cache[path] = (stat.st_mtime_ns, stat.st_size, data)
+    return data
+
+
+def clear_document_cache() -> None:
+    """
+    Clear the cache of parsed included documents.
+    """
+    document_cache.clear()
 
 
-def update_dict(d: dict, key: str, parent_key: str, old_val: str, new_val: str) -> None:
+def build_overrides(values_dict: dict) -> dict:
     """
-    Recursively update all occurrences of value `old_val`,
-    which are nested under key `key` and parent key `parent_key`,
-    with `new_val` in dictionary `d`.
+    Build the tree of values to override in an included member,
+    from the dotted keys given with the `!include` tag.
+    Example: {"protocols.dns.domain-name": "a.com"} -> {"protocols": {"dns": {"domain-name": "a.com"}}}
+
+    Args:
+        values_dict: dictionary mapping dotted keys to the values to override
+    Returns:
+        dict: tree of values to override, with the values as leaves
+    """
+    overrides = {}
+    for key, value in values_dict.items():
+        split_key = key.split('.')
+        subtree = overrides
+        for sub_key in split_key[:-1]:
+            subtree = subtree.setdefault(sub_key, {})
+        subtree[split_key[-1]] = value
+    return overrides
+
+
+def substitute_value(parent_key: str, key: str, value: any, addrs: dict) -> any:
+    """
+    Replace a scalar "self" value with the corresponding device address,
+    if its (parent key, key) pair is a substitution target.
 
     Args:
-        d: dictionary to update
-        key: key to update the value of
         parent_key: parent key of `key`
-        old_val: value to replace
-        new_val: value to replace with
+        key: key of the value
+        value: value to substitute
+        addrs: device addresses, mapping address types to addresses
+    Returns:
+        any: the device address, or `value` itself if it must not be substituted
     """
-    update_dict_aux(d, key, parent_key, "", old_val, new_val)
+    if value == "self" and (parent_key, key) in self_addr_targets:
+        return addrs.get(self_addr_targets[(parent_key, key)]) or value
+    return value
 
 
-def replace_self_addrs(d: dict, mac: str = "", ipv4: str = "", ipv6: str = "") -> None:
+def substitute(d: dict, addrs: dict, overrides: dict = {}, parent_key: str = "") -> dict:
     """
-    Replace all occurrences of "self" with the given addresses.
+    Override values and replace all occurrences of "self" with the device addresses,
+    in a single traversal of dictionary `d`.
+    Dictionaries are copied on write, `d` itself is left unchanged.
 
     Args:
         d: dictionary to update
-        mac (optional): MAC address to replace "self" with
-        ipv4 (optional): IPv4 address to replace "self" with
-        ipv6 (optional): IPv6 address to replace "self" with
+        addrs: device addresses, mapping address types ("mac", "ipv4", "ipv6") to addresses
+        overrides (optional): tree of values to override, as built by `build_overrides`
+        parent_key (optional): parent key of `d`
+    Returns:
+        dict: updated copy of `d`, or `d` itself if no value was updated
     """
-    if mac:
-        update_dict(d, "sha", "arp", "self", mac)
-        update_dict(d, "tha", "arp", "self", mac)
-    if ipv4:
-        update_dict(d, "src", "ipv4", "self", ipv4)
-        update_dict(d, "dst", "ipv4", "self", ipv4)
-    if ipv6:
-        update_dict(d, "src", "ipv6", "self", ipv6)
-        update_dict(d, "dst", "ipv6", "self", ipv6)
+    updated = d
+    for k, v in d.items():
+        override = overrides.get(k)
+        if override is not None and not isinstance(override, dict):
+            # Value is overridden
+            new_v = substitute_value(parent_key, k, override, addrs)
+        elif isinstance(v, collections.abc.Mapping):
+            # Value is a dictionary itself, recursion time
+            new_v = substitute(v, addrs, override or {}, k)
+        elif override is not None:
+            raise TypeError(f"Cannot override members of non-mapping value {k}")
+        else:
+            # Value is a scalar
+            new_v = substitute_value(parent_key, k, v, addrs)
+        if new_v is not v:
+            # Copy on write
+            if updated is d:
+                updated = dict(d)
+            updated[k] = new_v
+
+    # Add overridden values which were not present
+    for k, override in overrides.items():
+        if k not in d:
+            if isinstance(override, dict):
+                raise KeyError(k)
+            if updated is d:
+                updated = dict(d)
+            updated[k] = substitute_value(parent_key, k, override, addrs)
+
+    return updated
 
 
 def construct_include(loader: IncludeLoader, node: yaml.Node) -> dict:
@@ -107,7 +181,7 @@ def construct_include(loader: IncludeLoader, node: yaml.Node) -> dict:
 
     # Split path and pattern from profile
     split2 = profile.split('#')
-    path = os.path.abspath(loader.stream.name)  # Default path, the current profile
+    path = os.path.abspath(loader.name)  # Default path, the current profile
     if len(split2) == 1:
         members = split2[0]
     elif len(split2) == 2:
@@ -115,37 +189,25 @@ def construct_include(loader: IncludeLoader, node: yaml.Node) -> dict:
             path = os.path.join(os.path.dirname(path), split2[0])
         members = split2[1]
 
-    # Load member to include
+    # Load member to include (from the document cache, which must not be modified)
+    path = os.path.normpath(path)
+    loader.included_paths.add(path)
     addrs = {}
-    data = {}
-    with open(path, 'r') as f:
-        data = yaml.load(f, IgnoreLoader)
+    data = load_document(path)
 
-        # Populate addrs
-        addrs["mac"] = data["device-info"].get("mac", "")
-        addrs["ipv4"] = data["device-info"].get("ipv4", "")
-        addrs["ipv6"] = data["device-info"].get("ipv6", "")
+    # Populate addrs
+    addrs["mac"] = data["device-info"].get("mac", "")
+    addrs["ipv4"] = data["device-info"].get("ipv4", "")
+    addrs["ipv6"] = data["device-info"].get("ipv6", "")
 
-        for member in members.split('.'):
-            data = data[member]
-    
-    # Populate values
-    data_top = data
-    for key, value in values_dict.items():
-        split_key = key.split('.')
-        i = 0
-        for sub_key in split_key:
-            if i == len(split_key) - 1:
-                data[sub_key] = value
-            else:
-                data = data[sub_key]
-                i += 1
+    for member in members.split('.'):
+        data = data[member]
     
-    # Replace "self" with actual addresses
-    if isinstance(data_top, collections.abc.Mapping):
-        replace_self_addrs(data_top, addrs["mac"], addrs["ipv4"], addrs["ipv6"])
+    # Populate values and replace "self" with actual addresses, in a single pass
+    if isinstance(data, collections.abc.Mapping):
+        data = substitute(data, addrs, build_overrides(values_dict))
     
-    return data_top
+    return data
 
 
 # Add custom constructor
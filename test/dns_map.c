@@ -23,7 +23,7 @@
 void test_dns_map_create() {
     dns_map_t *table = dns_map_create();
     CU_ASSERT_PTR_NOT_NULL(table);
-    CU_ASSERT_EQUAL(hashmap_count(table), 0);
+    CU_ASSERT_EQUAL(hashmap_count(table->names), 0);
     dns_map_free(table);
 }
 
@@ -52,7 +52,7 @@ void test_dns_map_add_remove() {
     *(google_ips + 1) = (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.2")};
     ip_list_t ip_list_google = { .ip_count = 2, .ip_addresses = google_ips };
     dns_map_add(table, "www.google.com", ip_list_google);
-    CU_ASSERT_EQUAL(hashmap_count(table), 1);
+    CU_ASSERT_EQUAL(hashmap_count(table->names), 1);
 
     // Add IP addresses for www.example.com
     ip_addr_t *example_ips = (ip_addr_t *)malloc(2 * sizeof(ip_addr_t));
@@ -60,13 +60,13 @@ void test_dns_map_add_remove() {
     *(example_ips + 1) = (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.4")};
     ip_list_t ip_list_example = {.ip_count = 2, .ip_addresses = example_ips};
     dns_map_add(table, "www.example.com", ip_list_example);
-    CU_ASSERT_EQUAL(hashmap_count(table), 2);
+    CU_ASSERT_EQUAL(hashmap_count(table->names), 2);
 
     // Remove all IP addresses
     dns_map_remove(table, "www.google.com");
-    CU_ASSERT_EQUAL(hashmap_count(table), 1);
+    CU_ASSERT_EQUAL(hashmap_count(table->names), 1);
     dns_map_remove(table, "www.example.com");
-    CU_ASSERT_EQUAL(hashmap_count(table), 0);
+    CU_ASSERT_EQUAL(hashmap_count(table->names), 0);
     dns_map_free(table);
 }
 
@@ -138,7 +138,7 @@ void test_dns_map_pop() {
         CU_ASSERT_TRUE(compare_ip(*(actual->ip_list.ip_addresses + i), *(google_ips + i)));
     }
     free(actual->ip_list.ip_addresses);
-    CU_ASSERT_EQUAL(hashmap_count(table), 1);
+    CU_ASSERT_EQUAL(hashmap_count(table->names), 1);
     actual = dns_map_pop(table, "www.google.com");
     CU_ASSERT_PTR_NULL(actual);
 
@@ -151,13 +151,255 @@ void test_dns_map_pop() {
         CU_ASSERT_TRUE(compare_ip(*(actual->ip_list.ip_addresses + i), *(example_ips + i)));
     }
     free(actual->ip_list.ip_addresses);
-    CU_ASSERT_EQUAL(hashmap_count(table), 0);
+    CU_ASSERT_EQUAL(hashmap_count(table->names), 0);
     actual = dns_map_pop(table, "www.example.com");
     CU_ASSERT_PTR_NULL(actual);
     
     dns_map_free(table);
 }
 
+/**
+ * Test adding and retrieving entries by domain name ID in a DNS table.
+ */
+void test_dns_map_ids() {
+    dns_map_t *table = dns_map_create_with_ids(2);
+    CU_ASSERT_PTR_NOT_NULL(table);
+    CU_ASSERT_EQUAL(table->num_ids, 2);
+
+    // No entry yet
+    CU_ASSERT_PTR_NULL(dns_map_get_id(table, 0));
+    CU_ASSERT_PTR_NULL(dns_map_get_id(table, 1));
+    CU_ASSERT_PTR_NULL(dns_map_get_id(table, 2));  // Unknown ID
+
+    // Add IP addresses for www.google.com, with ID 1
+    ip_addr_t *google_ips = (ip_addr_t *) malloc(2 * sizeof(ip_addr_t));
+    *google_ips = (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.1")};
+    *(google_ips + 1) = (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.2")};
+    ip_list_t ip_list_google = {.ip_count = 2, .ip_addresses = google_ips};
+    dns_map_add_id(table, 1, "www.google.com", ip_list_google);
+    CU_ASSERT_PTR_NULL(dns_map_get_id(table, 0));
+    dns_entry_t *actual = dns_map_get_id(table, 1);
+    CU_ASSERT_PTR_NOT_NULL(actual);
+    CU_ASSERT_STRING_EQUAL(actual->domain_name, "www.google.com");
+    CU_ASSERT_EQUAL(actual->ip_list.ip_count, 2);
+    CU_ASSERT_TRUE(dns_entry_contains(actual, (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.2")}));
+    // Entries added by ID are not in the domain name hashmap
+    CU_ASSERT_PTR_NULL(dns_map_get(table, "www.google.com"));
+    CU_ASSERT_EQUAL(hashmap_count(table->names), 0);
+
+    // Replace the IP addresses of www.google.com
+    ip_addr_t *new_google_ips = (ip_addr_t *) malloc(sizeof(ip_addr_t));
+    *new_google_ips = (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.3")};
+    ip_list_t new_ip_list_google = {.ip_count = 1, .ip_addresses = new_google_ips};
+    dns_map_add_id(table, 1, "www.google.com", new_ip_list_google);
+    actual = dns_map_get_id(table, 1);
+    CU_ASSERT_EQUAL(actual->ip_list.ip_count, 1);
+    CU_ASSERT_FALSE(dns_entry_contains(actual, (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.2")}));
+    CU_ASSERT_TRUE(dns_entry_contains(actual, (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.3")}));
+
+    // Adding an unknown ID has no effect
+    ip_addr_t *example_ips = (ip_addr_t *) malloc(sizeof(ip_addr_t));
+    *example_ips = (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.4")};
+    ip_list_t ip_list_example = {.ip_count = 1, .ip_addresses = example_ips};
+    dns_map_add_id(table, 2, "www.example.com", ip_list_example);
+    CU_ASSERT_PTR_NULL(dns_map_get_id(table, 2));
+
+    dns_map_free(table);
+}
+
+/**
+ * @brief Test the reverse lookup of IP addresses among a set of domain name IDs.
+ */
+void test_dns_map_contains_ip() {
+    // More than 64 IDs, such that the bitmasks span two words
+    dns_map_t *table = dns_map_create_with_ids(70);
+    CU_ASSERT_PTR_NOT_NULL(table);
+    CU_ASSERT_EQUAL(table->mask_words, 2);
+    ip_addr_t ip_1 = {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.1")};
+    ip_addr_t ip_2 = {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.2")};
+    ip_addr_t ip_3 = {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.3")};
+    const uint64_t mask_0[] = {0x1ULL, 0x0ULL};    // ID 0
+    const uint64_t mask_65[] = {0x0ULL, 0x2ULL};   // ID 65
+    const uint64_t mask_both[] = {0x1ULL, 0x2ULL}; // IDs 0 and 65
+
+    // Empty table
+    CU_ASSERT_FALSE(dns_map_contains_ip(table, ip_1, mask_both));
+
+    // Add IP addresses for www.google.com (ID 0) and www.example.com (ID 65)
+    ip_addr_t *google_ips = (ip_addr_t *) malloc(2 * sizeof(ip_addr_t));
+    *google_ips = ip_1;
+    *(google_ips + 1) = ip_2;
+    dns_map_add_id(table, 0, "www.google.com", (ip_list_t) {.ip_count = 2, .ip_addresses = google_ips});
+    ip_addr_t *example_ips = (ip_addr_t *) malloc(sizeof(ip_addr_t));
+    *example_ips = ip_2;
+    dns_map_add_id(table, 65, "www.example.com", (ip_list_t) {.ip_count = 1, .ip_addresses = example_ips});
+    CU_ASSERT_EQUAL(hashmap_count(table->addresses), 2);
+    CU_ASSERT_TRUE(dns_map_contains_ip(table, ip_1, mask_0));
+    CU_ASSERT_TRUE(dns_map_contains_ip(table, ip_2, mask_0));
+    CU_ASSERT_FALSE(dns_map_contains_ip(table, ip_3, mask_0));
+    CU_ASSERT_FALSE(dns_map_contains_ip(table, ip_1, mask_65));
+    CU_ASSERT_TRUE(dns_map_contains_ip(table, ip_2, mask_65));
+    CU_ASSERT_TRUE(dns_map_contains_ip(table, ip_1, mask_both));
+    CU_ASSERT_TRUE(dns_map_contains_id(table, 0, ip_1));
+    CU_ASSERT_FALSE(dns_map_contains_id(table, 65, ip_1));
+    CU_ASSERT_TRUE(dns_map_contains_id(table, 65, ip_2));
+    CU_ASSERT_FALSE(dns_map_contains_id(table, 1, ip_1));   // No entry
+    CU_ASSERT_FALSE(dns_map_contains_id(table, 70, ip_1));  // Unknown ID
+
+    // Replace the IP addresses of www.google.com
+    ip_addr_t *new_google_ips = (ip_addr_t *) malloc(sizeof(ip_addr_t));
+    *new_google_ips = ip_3;
+    dns_map_add_id(table, 0, "www.google.com", (ip_list_t) {.ip_count = 1, .ip_addresses = new_google_ips});
+    CU_ASSERT_EQUAL(hashmap_count(table->addresses), 2);
+    CU_ASSERT_FALSE(dns_map_contains_ip(table, ip_1, mask_both));
+    CU_ASSERT_FALSE(dns_map_contains_ip(table, ip_2, mask_0));
+    CU_ASSERT_TRUE(dns_map_contains_ip(table, ip_2, mask_65));
+    CU_ASSERT_TRUE(dns_map_contains_ip(table, ip_3, mask_0));
+
+    dns_map_free(table);
+}
+
+
+/**
+ * @brief Build a list with a single IPv4 address.
+ *
+ * @param ip_str IPv4 address in string representation
+ * @param ttl time to live of the address, in seconds
+ * @return the list of IP addresses
+ */
+static ip_list_t single_ip_list(char *ip_str, uint32_t ttl) {
+    ip_addr_t *ip_addresses = (ip_addr_t *) malloc(sizeof(ip_addr_t));
+    *ip_addresses = (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net(ip_str)};
+    return (ip_list_t) {.ip_count = 1, .ip_addresses = ip_addresses, .ttl = ttl};
+}
+
+/**
+ * @brief Test the sorting and deduplication of the IP addresses of an entry.
+ */
+void test_dns_map_dedup() {
+    dns_map_t *table = dns_map_create();
+    ip_addr_t *ips = (ip_addr_t *) malloc(4 * sizeof(ip_addr_t));
+    *ips = (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.2")};
+    *(ips + 1) = (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.1")};
+    *(ips + 2) = (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.2")};
+    *(ips + 3) = (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("10.0.0.1")};
+    dns_map_add(table, "www.google.com", (ip_list_t) {.ip_count = 4, .ip_addresses = ips, .ttl = 60});
+
+    dns_entry_t *actual = dns_map_get(table, "www.google.com");
+    CU_ASSERT_PTR_NOT_NULL(actual);
+    CU_ASSERT_EQUAL(actual->ip_list.ip_count, 3);
+    CU_ASSERT_TRUE(compare_ip(*(actual->ip_list.ip_addresses), (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("10.0.0.1")}));
+    CU_ASSERT_TRUE(compare_ip(*(actual->ip_list.ip_addresses + 1), (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.1")}));
+    CU_ASSERT_TRUE(compare_ip(*(actual->ip_list.ip_addresses + 2), (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.2")}));
+    CU_ASSERT_TRUE(dns_entry_contains(actual, (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.2")}));
+    CU_ASSERT_FALSE(dns_entry_contains(actual, (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.3")}));
+
+    dns_map_free(table);
+}
+
+/**
+ * @brief Test the expiry of entries after their TTL.
+ */
+void test_dns_map_expiry() {
+    dns_map_t *table = dns_map_create_with_ids(1);
+    table->ttl_grace = 0;
+
+    // Entries with a null TTL are expired as soon as they are added
+    dns_map_add(table, "www.google.com", single_ip_list("192.168.1.1", 0));
+    CU_ASSERT_PTR_NULL(dns_map_get(table, "www.google.com"));
+    dns_map_add_id(table, 0, "www.example.com", single_ip_list("192.168.1.2", 0));
+    CU_ASSERT_PTR_NULL(dns_map_get_id(table, 0));
+    const uint64_t mask[] = {0x1ULL};
+    CU_ASSERT_FALSE(dns_map_contains_ip(table, (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.2")}, mask));
+
+    // Entries with a positive TTL are valid until it expires
+    dns_map_add(table, "www.google.com", single_ip_list("192.168.1.1", 3600));
+    CU_ASSERT_PTR_NOT_NULL(dns_map_get(table, "www.google.com"));
+    dns_map_add_id(table, 0, "www.example.com", single_ip_list("192.168.1.2", 3600));
+    CU_ASSERT_PTR_NOT_NULL(dns_map_get_id(table, 0));
+    CU_ASSERT_TRUE(dns_map_contains_ip(table, (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.2")}, mask));
+
+    dns_map_stats_t stats = dns_map_get_stats(table);
+    CU_ASSERT_EQUAL(stats.entries, 2);
+    CU_ASSERT_EQUAL(stats.hits, 3);
+    CU_ASSERT_EQUAL(stats.misses, 3);
+
+    dns_map_free(table);
+}
+
+/**
+ * @brief Test the eviction of entries when the DNS table exceeds its memory ceiling.
+ */
+void test_dns_map_eviction() {
+    dns_map_t *table = dns_map_create();
+    table->ttl_grace = 0;
+    // Room for two entries with one IP address each
+    table->max_memory = 2 * (sizeof(dns_entry_t) + sizeof(ip_addr_t));
+
+    dns_map_add(table, "a.example.com", single_ip_list("192.168.1.1", 3600));
+    dns_map_add(table, "b.example.com", single_ip_list("192.168.1.2", 3600));
+    dns_map_stats_t stats = dns_map_get_stats(table);
+    CU_ASSERT_EQUAL(stats.entries, 2);
+    CU_ASSERT_EQUAL(stats.memory, table->max_memory);
+    CU_ASSERT_EQUAL(stats.evictions, 0);
+
+    // The least recently used entry is evicted
+    dns_map_get(table, "a.example.com")->last_used -= 10;
+    dns_map_add(table, "c.example.com", single_ip_list("192.168.1.3", 3600));
+    CU_ASSERT_PTR_NULL(dns_map_get(table, "a.example.com"));
+    CU_ASSERT_PTR_NOT_NULL(dns_map_get(table, "b.example.com"));
+    CU_ASSERT_PTR_NOT_NULL(dns_map_get(table, "c.example.com"));
+    stats = dns_map_get_stats(table);
+    CU_ASSERT_EQUAL(stats.entries, 2);
+    CU_ASSERT_EQUAL(stats.evictions, 1);
+
+    // Expired entries are evicted first
+    dns_map_add(table, "d.example.com", single_ip_list("192.168.1.4", 0));
+    CU_ASSERT_PTR_NOT_NULL(dns_map_get(table, "b.example.com"));
+    CU_ASSERT_PTR_NOT_NULL(dns_map_get(table, "c.example.com"));
+    stats = dns_map_get_stats(table);
+    CU_ASSERT_EQUAL(stats.entries, 2);
+    CU_ASSERT_EQUAL(stats.expirations, 1);
+    CU_ASSERT_EQUAL(stats.evictions, 1);
+
+    dns_map_free(table);
+}
+
+/**
+ * @brief Test the eviction order of the least recently used entries.
+ */
+void test_dns_map_eviction_lru() {
+    dns_map_t *table = dns_map_create_with_ids(1);
+    table->ttl_grace = 0;
+    // Room for three entries with one IP address each, besides the entry of the domain name ID
+    table->max_memory = 4 * sizeof(dns_entry_t) + 3 * sizeof(ip_addr_t);
+
+    dns_map_add(table, "a.example.com", single_ip_list("192.168.1.1", 3600));
+    dns_map_add(table, "b.example.com", single_ip_list("192.168.1.2", 3600));
+    dns_map_add(table, "c.example.com", single_ip_list("192.168.1.3", 3600));
+    dns_map_get(table, "a.example.com")->last_used -= 5;
+    dns_map_get(table, "b.example.com")->last_used -= 20;
+    dns_map_get(table, "c.example.com")->last_used -= 10;
+
+    // The entries are evicted from the least to the most recently used
+    dns_map_add(table, "d.example.com", single_ip_list("192.168.1.4", 3600));
+    CU_ASSERT_PTR_NULL(dns_map_get(table, "b.example.com"));
+    CU_ASSERT_PTR_NOT_NULL(dns_map_get(table, "a.example.com"));
+    dns_map_get(table, "a.example.com")->last_used -= 5;
+    dns_map_get(table, "d.example.com")->last_used -= 15;
+    dns_map_add(table, "e.example.com", single_ip_list("192.168.1.5", 3600));
+    CU_ASSERT_PTR_NULL(dns_map_get(table, "d.example.com"));
+    CU_ASSERT_PTR_NOT_NULL(dns_map_get(table, "c.example.com"));
+
+    // Entries of domain name IDs are evicted as well
+    dns_map_add_id(table, 0, "f.example.com", single_ip_list("192.168.1.6", 3600));
+    CU_ASSERT_EQUAL(dns_map_get_stats(table).entries, 3);
+    CU_ASSERT_EQUAL(dns_map_get_stats(table).evictions, 3);
+    CU_ASSERT_TRUE(dns_map_contains_id(table, 0, (ip_addr_t) {.version = 4, .value.ipv4 = ipv4_str_to_net("192.168.1.6")}));
+
+    dns_map_free(table);
+}
+
 
 /**
  * Test suite entry point.
@@ -175,6 +417,12 @@ int main(int argc, char const *argv[])
     CU_add_test(suite, "dns_map_add_remove", test_dns_map_add_remove);
     CU_add_test(suite, "dns_map_get", test_dns_map_get);
     CU_add_test(suite, "dns_map_pop", test_dns_map_pop);
+    CU_add_test(suite, "dns_map_ids", test_dns_map_ids);
+    CU_add_test(suite, "dns_map_contains_ip", test_dns_map_contains_ip);
+    CU_add_test(suite, "dns_map_dedup", test_dns_map_dedup);
+    CU_add_test(suite, "dns_map_expiry", test_dns_map_expiry);
+    CU_add_test(suite, "dns_map_eviction", test_dns_map_eviction);
+    CU_add_test(suite, "dns_map_eviction_lru", test_dns_map_eviction_lru);
     CU_basic_run_tests();
     CU_cleanup_registry();
     return 0;
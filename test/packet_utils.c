@@ -234,6 +234,75 @@ void test_compare_ip() {
     CU_ASSERT_FALSE(compare_ip(ipv6_1, ipv4_1));
 }
 
+/**
+ * @brief Unit test for the macro IPV4_ADDR_NET.
+ */
+void test_ipv4_addr_net() {
+    CU_ASSERT_EQUAL(IPV4_ADDR_NET(192, 168, 1, 161), ipv4_str_to_net("192.168.1.161"));
+    CU_ASSERT_EQUAL(IPV4_ADDR_NET(255, 255, 255, 0), ipv4_str_to_net("255.255.255.0"));
+}
+
+/**
+ * @brief Unit test for the function ip_prefix_contains.
+ */
+void test_ip_prefix_contains() {
+    // IPv4 prefix 192.168.0.0/16
+    ip_prefix_t ipv4_prefix = {
+        .address = {.version = 4, .value.ipv4 = IPV4_ADDR_NET(192, 168, 0, 0)},
+        .mask.ipv4 = IPV4_ADDR_NET(255, 255, 0, 0)
+    };
+    CU_ASSERT_TRUE(ip_prefix_contains(ipv4_prefix, (ip_addr_t) {.version = 4, .value.ipv4 = IPV4_ADDR_NET(192, 168, 1, 161)}));
+    CU_ASSERT_TRUE(ip_prefix_contains(ipv4_prefix, (ip_addr_t) {.version = 4, .value.ipv4 = IPV4_ADDR_NET(192, 168, 255, 255)}));
+    CU_ASSERT_FALSE(ip_prefix_contains(ipv4_prefix, (ip_addr_t) {.version = 4, .value.ipv4 = IPV4_ADDR_NET(192, 169, 1, 161)}));
+    CU_ASSERT_FALSE(ip_prefix_contains(ipv4_prefix, (ip_addr_t) {.version = 4, .value.ipv4 = IPV4_ADDR_NET(10, 168, 1, 161)}));
+
+    // IPv6 prefix 2001:db8::/33
+    ip_prefix_t ipv6_prefix = {
+        .address = {.version = 6, .value.ipv6 = {0x20, 0x01, 0x0d, 0xb8}},
+        .mask.ipv6 = {0xff, 0xff, 0xff, 0xff, 0x80}
+    };
+    ip_addr_t ipv6_1 = {.version = 6, .value.ipv6 = {0x20, 0x01, 0x0d, 0xb8, 0x7f, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x01}};
+    ip_addr_t ipv6_2 = {.version = 6, .value.ipv6 = {0x20, 0x01, 0x0d, 0xb8, 0x80, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x01}};
+    CU_ASSERT_TRUE(ip_prefix_contains(ipv6_prefix, ipv6_1));
+    CU_ASSERT_FALSE(ip_prefix_contains(ipv6_prefix, ipv6_2));
+
+    // Different IP versions
+    CU_ASSERT_FALSE(ip_prefix_contains(ipv4_prefix, ipv6_1));
+    CU_ASSERT_FALSE(ip_prefix_contains(ipv6_prefix, (ip_addr_t) {.version = 4, .value.ipv4 = IPV4_ADDR_NET(192, 168, 1, 161)}));
+}
+
+/**
+ * @brief Unit test for the function string_hash.
+ */
+void test_string_hash() {
+    CU_ASSERT_EQUAL(string_hash(""), 0x811c9dc5);
+    CU_ASSERT_EQUAL(string_hash("a"), 0xe40c292c);
+    CU_ASSERT_EQUAL(string_hash("foobar"), 0xbf9cf968);
+}
+
+/**
+ * @brief Unit test for the function string_set_contains.
+ */
+void test_string_set_contains() {
+    // Entries sorted by hash
+    const string_set_entry_t entries[] = {
+        {0x2a0c975eU, "/"},
+        {0x343c0fd7U, "/description.xml"},
+        {0x5a52d22dU, "/api/config"}
+    };
+    string_set_t set = {.count = 3, .entries = entries};
+    CU_ASSERT_TRUE(string_set_contains(&set, "/description.xml"));
+    CU_ASSERT_TRUE(string_set_contains(&set, "/api/config"));
+    CU_ASSERT_TRUE(string_set_contains(&set, "/"));
+    CU_ASSERT_FALSE(string_set_contains(&set, "/api"));
+    CU_ASSERT_FALSE(string_set_contains(&set, ""));
+    CU_ASSERT_FALSE(string_set_contains(&set, NULL));
+    // Precomputed hashes
+    for (uint8_t i = 0; i < set.count; i++) {
+        CU_ASSERT_EQUAL(string_hash(entries[i].value), entries[i].hash);
+    }
+}
+
 /**
  * Test suite entry point.
  */
@@ -258,6 +327,10 @@ int main(int argc, char const *argv[])
     CU_add_test(suite, "ip_str_to_net", test_ip_str_to_net);
     CU_add_test(suite, "compare_ipv6", test_compare_ipv6);
     CU_add_test(suite, "compare_ip", test_compare_ip);
+    CU_add_test(suite, "ipv4_addr_net", test_ipv4_addr_net);
+    CU_add_test(suite, "ip_prefix_contains", test_ip_prefix_contains);
+    CU_add_test(suite, "string_hash", test_string_hash);
+    CU_add_test(suite, "string_set_contains", test_string_set_contains);
     CU_basic_run_tests();
     CU_cleanup_registry();
     return 0;
@@ -159,6 +159,7 @@ void test_dns_xiaomi() {
     char *ip_address = "20.47.97.231";
     CU_ASSERT_EQUAL(ip_list.ip_count, 1);
     CU_ASSERT_STRING_EQUAL(ipv4_net_to_str(ip_list.ip_addresses->value.ipv4), ip_address);
+    CU_ASSERT_EQUAL(ip_list.ttl, 147);
     free(ip_list.ip_addresses);
     domain_name = "swag.framinem.org";
     ip_list = dns_get_ip_from_name(message.answers, message.header.ancount, domain_name);
@@ -331,6 +332,7 @@ void test_dns_office() {
     for (uint8_t i = 0; i < 4; i++) {
         CU_ASSERT_STRING_EQUAL(ipv4_net_to_str((ip_list.ip_addresses + i)->value.ipv4), ip_addresses[i]);
     }
+    CU_ASSERT_EQUAL(ip_list.ttl, 4);
     free(ip_list.ip_addresses);
     domain_name = "swag.framinem.org";
     ip_list = dns_get_ip_from_name(message.answers, message.header.ancount, domain_name);
@@ -341,6 +343,96 @@ void test_dns_office() {
     dns_free_message(message);
 }
 
+/**
+ * Unit test for the DNS domain sets.
+ */
+void test_dns_domain_set() {
+    dns_domain_pattern_t patterns[] = {
+        {dns_domain_hash("api.example.com"), false, "api.example.com"},
+        {dns_domain_hash("meethue.com"), true, "meethue.com"},
+        {dns_domain_hash("example.org"), false, "example.org"}
+    };
+    // Sort patterns by hash
+    for (uint8_t i = 0; i < 3; i++) {
+        for (uint8_t j = i + 1; j < 3; j++) {
+            if (patterns[j].hash < patterns[i].hash) {
+                dns_domain_pattern_t tmp = patterns[i];
+                patterns[i] = patterns[j];
+                patterns[j] = tmp;
+            }
+        }
+    }
+    dns_domain_set_t set = {.count = 3, .has_wildcards = true, .patterns = patterns};
+
+    // Exact patterns
+    CU_ASSERT_PTR_NOT_NULL(dns_domain_set_lookup(&set, "api.example.com"));
+    CU_ASSERT_PTR_NOT_NULL(dns_domain_set_lookup(&set, "example.org"));
+    CU_ASSERT_PTR_NULL(dns_domain_set_lookup(&set, "example.com"));
+    CU_ASSERT_PTR_NULL(dns_domain_set_lookup(&set, "www.example.org"));
+    // Wildcard pattern
+    CU_ASSERT_PTR_NOT_NULL(dns_domain_set_lookup(&set, "www.meethue.com"));
+    CU_ASSERT_PTR_NOT_NULL(dns_domain_set_lookup(&set, "a.b.meethue.com"));
+    CU_ASSERT_TRUE(dns_domain_set_lookup(&set, "www.meethue.com")->wildcard);
+    CU_ASSERT_STRING_EQUAL(dns_domain_set_lookup(&set, "www.meethue.com")->domain_name, "meethue.com");
+    CU_ASSERT_PTR_NULL(dns_domain_set_lookup(&set, "meethue.com"));
+    CU_ASSERT_PTR_NULL(dns_domain_set_lookup(&set, ".meethue.com"));
+    CU_ASSERT_PTR_NULL(dns_domain_set_lookup(&set, "wwwmeethue.com"));
+    CU_ASSERT_PTR_NULL(dns_domain_set_lookup(&set, ""));
+
+    // Questions list
+    dns_question_t questions[] = {
+        {.qname = "www.google.com", .qtype = A, .qclass = 1},
+        {.qname = "bridge.meethue.com", .qtype = A, .qclass = 1}
+    };
+    CU_ASSERT_TRUE(dns_contains_domain_set(questions, 2, &set));
+    CU_ASSERT_FALSE(dns_contains_domain_set(questions, 1, &set));
+}
+
+/**
+ * Unit test for the DNS domain sets, with overlapping exact and wildcard patterns.
+ */
+void test_dns_domain_set_overlap() {
+    dns_domain_pattern_t patterns[] = {
+        {dns_domain_hash("www.example.com"), false, "www.example.com"},
+        {dns_domain_hash("example.com"), true, "example.com"},
+        {dns_domain_hash("cdn.example.com"), true, "cdn.example.com"}
+    };
+    // Sort patterns by hash
+    for (uint8_t i = 0; i < 3; i++) {
+        for (uint8_t j = i + 1; j < 3; j++) {
+            if (patterns[j].hash < patterns[i].hash) {
+                dns_domain_pattern_t tmp = patterns[i];
+                patterns[i] = patterns[j];
+                patterns[j] = tmp;
+            }
+        }
+    }
+    dns_domain_set_t set = {.count = 3, .has_wildcards = true, .patterns = patterns};
+
+    // The exact pattern is preferred over the wildcard one
+    const dns_domain_pattern_t *pattern = dns_domain_set_lookup(&set, "www.example.com");
+    CU_ASSERT_PTR_NOT_NULL(pattern);
+    CU_ASSERT_FALSE(pattern->wildcard);
+    CU_ASSERT_STRING_EQUAL(pattern->domain_name, "www.example.com");
+    // Other subdomains match the wildcard pattern
+    pattern = dns_domain_set_lookup(&set, "api.example.com");
+    CU_ASSERT_PTR_NOT_NULL(pattern);
+    CU_ASSERT_TRUE(pattern->wildcard);
+    CU_ASSERT_STRING_EQUAL(pattern->domain_name, "example.com");
+    pattern = dns_domain_set_lookup(&set, "a.www.example.com");
+    CU_ASSERT_PTR_NOT_NULL(pattern);
+    CU_ASSERT_TRUE(pattern->wildcard);
+    CU_ASSERT_STRING_EQUAL(pattern->domain_name, "example.com");
+    // The wildcard pattern with the longest suffix is preferred
+    pattern = dns_domain_set_lookup(&set, "a.cdn.example.com");
+    CU_ASSERT_PTR_NOT_NULL(pattern);
+    CU_ASSERT_STRING_EQUAL(pattern->domain_name, "cdn.example.com");
+    pattern = dns_domain_set_lookup(&set, "cdn.example.com");
+    CU_ASSERT_PTR_NOT_NULL(pattern);
+    CU_ASSERT_STRING_EQUAL(pattern->domain_name, "example.com");
+    CU_ASSERT_PTR_NULL(dns_domain_set_lookup(&set, "example.com"));
+}
+
 /**
  * Main function for the unit tests.
  */
@@ -353,6 +445,8 @@ int main(int argc, char const *argv[])
     // Run tests
     CU_add_test(suite, "dns-xiaomi", test_dns_xiaomi);
     CU_add_test(suite, "dns-office", test_dns_office);
+    CU_add_test(suite, "dns-domain-set", test_dns_domain_set);
+    CU_add_test(suite, "dns-domain-set-overlap", test_dns_domain_set_overlap);
     CU_basic_run_tests();
     CU_cleanup_registry();
     return 0;
@@ -10,7 +10,10 @@
 
 #include <stdio.h>
 #include <stdint.h>
+#include <unistd.h>
+#include <pthread.h>
 #include <sys/time.h>
+#include <arpa/inet.h>
 // Custom libraries
 #include "rule_utils.h"
 // CUnit
@@ -98,6 +101,179 @@ void test_counter_duration_init() {
     CU_ASSERT(duration.microseconds >= timestamp);
 }
 
+/**
+ * @brief Test the update of a counter cache from a dump of the table's counters.
+ */
+void test_counter_cache_update() {
+    counter_cache_t *cache = counter_cache_create("netdev test-table", COUNTER_CACHE_DEFAULT_INTERVAL);
+    char dump[] = "table netdev test-table {\n"
+                  "\tcounter counter1 {\n"
+                  "\t\tpackets 12 bytes 3400\n"
+                  "\t}\n"
+                  "\tcounter \"counter1-out\" {\n"
+                  "\t\tpackets 5 bytes 600\n"
+                  "\t}\n"
+                  "}\n";
+    CU_ASSERT_EQUAL(counter_cache_update(cache, dump), 2);
+    CU_ASSERT_EQUAL(cache->num_counters, 2);
+    // Values are read from the cache, without dumping the counters again
+    CU_ASSERT_EQUAL(counter_cache_read_packets(cache, "counter1"), 12);
+    CU_ASSERT_EQUAL(counter_cache_read_bytes(cache, "counter1"), 3400);
+    CU_ASSERT_EQUAL(counter_cache_read_packets(cache, "counter1-out"), 5);
+    packet_count_t packet_count = counter_cache_packets_init(cache, "counter1", OUT);
+    CU_ASSERT(packet_count.is_initialized);
+    CU_ASSERT_EQUAL(packet_count.packets_out, 5);
+    // Unknown counter
+    CU_ASSERT_EQUAL(counter_cache_read_packets(cache, "counter2"), 0);
+    // Updated values
+    char dump_updated[] = "\tcounter counter1 {\n\t\tpackets 13 bytes 3500\n\t}\n";
+    CU_ASSERT_EQUAL(counter_cache_update(cache, dump_updated), 1);
+    CU_ASSERT_EQUAL(cache->num_counters, 2);
+    CU_ASSERT_EQUAL(counter_cache_read_packets(cache, "counter1"), 13);
+    counter_cache_free(cache);
+}
+
+/**
+ * @brief Test the reading of nftables counters through a counter cache.
+ */
+void test_counter_cache_read() {
+    counter_cache_t *cache = counter_cache_create("test-table", 0);
+    CU_ASSERT_TRUE(counter_cache_refresh(cache));
+    CU_ASSERT_EQUAL(counter_cache_read_packets(cache, "counter1"), 0);
+    CU_ASSERT_EQUAL(counter_cache_read_bytes(cache, "counter1"), 0);
+    packet_count_t packet_count = counter_cache_packets_init(cache, "counter1", IN);
+    CU_ASSERT(packet_count.is_initialized);
+    CU_ASSERT_EQUAL(packet_count.packets_in, 0);
+    counter_cache_free(cache);
+}
+
+/**
+ * @brief Test the addition and deletion of nftables set elements.
+ */
+void test_nft_set_elements() {
+    // Add an element, twice
+    CU_ASSERT_TRUE(nft_set_add_element("ip test-table", "test-set", "192.168.1.1"));
+    CU_ASSERT_TRUE(nft_set_add_element("ip test-table", "test-set", "192.168.1.1"));
+    // Delete the element, twice
+    CU_ASSERT_TRUE(nft_set_delete_element("ip test-table", "test-set", "192.168.1.1"));
+    CU_ASSERT_TRUE(nft_set_delete_element("ip test-table", "test-set", "192.168.1.1"));
+    // Unknown set
+    CU_ASSERT_FALSE(nft_set_add_element("ip test-table", "unknown-set", "192.168.1.1"));
+}
+
+// nftables commands recorded by the test command sink
+typedef struct {
+    uint16_t num_cmds;
+    char cmds[4][512];
+} recorded_cmds_t;
+
+/**
+ * @brief Command sink recording the nftables commands, instead of running them.
+ *
+ * @param cmd nftables command
+ * @param arg pointer to the recorded commands
+ * @return empty command output
+ */
+char* record_cmd(char *cmd, void *arg) {
+    recorded_cmds_t *recorded = (recorded_cmds_t *) arg;
+    if (recorded->num_cmds < 4) {
+        strncpy(recorded->cmds[recorded->num_cmds], cmd, 511);
+    }
+    recorded->num_cmds++;
+    return strdup("");
+}
+
+/**
+ * @brief Test the batching of nftables commands in a single transaction.
+ */
+void test_nft_batch() {
+    recorded_cmds_t recorded = {0};
+    nft_set_cmd_sink(record_cmd, &recorded);
+    // All the commands of a batch are run at once
+    nft_batch_t batch;
+    nft_batch_begin(&batch);
+    CU_ASSERT_TRUE(nft_batch_delete_element(&batch, "netdev test-table", "gate-1", "\"eth0\""));
+    CU_ASSERT_TRUE(nft_batch_add_element(&batch, "netdev test-table", "gate-2", "\"eth0\""));
+    CU_ASSERT_EQUAL(batch.num_cmds, 3);
+    CU_ASSERT_EQUAL(recorded.num_cmds, 0);
+    CU_ASSERT_TRUE(nft_batch_commit(&batch));
+    CU_ASSERT_EQUAL(recorded.num_cmds, 1);
+    CU_ASSERT_STRING_EQUAL(recorded.cmds[0],
+        "add element netdev test-table gate-1 { \"eth0\" }\n"
+        "delete element netdev test-table gate-1 { \"eth0\" }\n"
+        "add element netdev test-table gate-2 { \"eth0\" }");
+    // Empty and aborted batches are not run
+    nft_batch_begin(&batch);
+    CU_ASSERT_TRUE(nft_batch_commit(&batch));
+    nft_batch_begin(&batch);
+    nft_batch_add(&batch, "flush set netdev test-table %s", "gate-1");
+    nft_batch_abort(&batch);
+    CU_ASSERT_EQUAL(recorded.num_cmds, 1);
+    // Single commands go through the sink too
+    CU_ASSERT_TRUE(nft_set_add_element("netdev test-table", "gate-1", "\"eth0\""));
+    CU_ASSERT_EQUAL(recorded.num_cmds, 2);
+    CU_ASSERT_STRING_EQUAL(recorded.cmds[1], "add element netdev test-table gate-1 { \"eth0\" }");
+    // IP addresses are added with a timeout, which is reset if they are already present
+    nft_batch_begin(&batch);
+    CU_ASSERT_TRUE(nft_batch_add_ip_element(&batch, "netdev test-table", "dns-set", (ip_addr_t) {.version = 4, .value.ipv4 = htonl(0xc0a80101)}, 300));
+    CU_ASSERT_TRUE(nft_batch_add_ip_element(&batch, "netdev test-table", "dns-set6", (ip_addr_t) {.version = 6, .value.ipv6 = {0x20, 0x01, 0x0d, 0xb8, [15] = 0x01}}, 0));
+    CU_ASSERT_TRUE(nft_batch_commit(&batch));
+    CU_ASSERT_EQUAL(recorded.num_cmds, 3);
+    CU_ASSERT_STRING_EQUAL(recorded.cmds[2],
+        "add element netdev test-table dns-set { 192.168.1.1 }\n"
+        "delete element netdev test-table dns-set { 192.168.1.1 }\n"
+        "add element netdev test-table dns-set { 192.168.1.1 timeout 300s }\n"
+        "add element netdev test-table dns-set6 { 2001:db8::1 }\n"
+        "delete element netdev test-table dns-set6 { 2001:db8::1 }\n"
+        "add element netdev test-table dns-set6 { 2001:db8::1 timeout 1s }");
+    nft_set_cmd_sink(NULL, NULL);
+}
+
+/**
+ * @brief Command sink answering the counters dumps with a fixed dump, slowly, and counting them.
+ *
+ * @param cmd nftables command
+ * @param arg pointer to the number of dumps
+ * @return dump of the table's counters
+ */
+char* slow_dump_cmd(char *cmd, void *arg) {
+    __atomic_fetch_add((uint16_t *) arg, 1, __ATOMIC_RELAXED);
+    usleep(100000);
+    return strdup("\tcounter counter1 {\n\t\tpackets 12 bytes 3400\n\t}\n");
+}
+
+/**
+ * @brief Thread reading a counter from a counter cache.
+ *
+ * @param arg pointer to the counter cache
+ * @return packet count value of the counter
+ */
+void* read_counter_thread(void *arg) {
+    return (void *) (uintptr_t) counter_cache_read_packets((counter_cache_t *) arg, "counter1");
+}
+
+/**
+ * @brief Test that the first fill of a counter cache dumps the counters once,
+ * while the other threads wait for it.
+ */
+void test_counter_cache_first_fill() {
+    uint16_t num_dumps = 0;
+    nft_set_cmd_sink(slow_dump_cmd, &num_dumps);
+    counter_cache_t *cache = counter_cache_create("netdev test-table", COUNTER_CACHE_DEFAULT_INTERVAL);
+    pthread_t threads[4];
+    for (uint8_t i = 0; i < 4; i++) {
+        CU_ASSERT_EQUAL(pthread_create(&threads[i], NULL, read_counter_thread, cache), 0);
+    }
+    for (uint8_t i = 0; i < 4; i++) {
+        void *value;
+        pthread_join(threads[i], &value);
+        CU_ASSERT_EQUAL((uintptr_t) value, 12);
+    }
+    CU_ASSERT_EQUAL(num_dumps, 1);
+    counter_cache_free(cache);
+    nft_set_cmd_sink(NULL, NULL);
+}
+
 /**
  * @brief Test the deletion of an nftables rule.
  */
@@ -132,6 +308,7 @@ int main(int argc, char const *argv[]) {
     system("sudo nft add counter test-table counter1");
     system("sudo nft add counter test-table counter1-out");
     system("sudo nft add counter test-table counter1-in");
+    system("sudo nft add set test-table test-set { type ipv4_addr \\; }");
     // Initialize the CUnit test registry and suite
     printf("Test suite: rule_utils\n");
     if (CU_initialize_registry() != CUE_SUCCESS)
@@ -145,8 +322,14 @@ int main(int argc, char const *argv[]) {
     CU_add_test(suite, "counter_packet_init_out", test_counter_packets_init_out);
     CU_add_test(suite, "counter_packet_init_in", test_counter_packets_init_in);
     CU_add_test(suite, "counter_duration_init", test_counter_duration_init);
+    CU_add_test(suite, "counter_cache_update", test_counter_cache_update);
+    CU_add_test(suite, "counter_cache_read", test_counter_cache_read);
+    CU_add_test(suite, "counter_cache_first_fill", test_counter_cache_first_fill);
+    CU_add_test(suite, "nft_set_elements", test_nft_set_elements);
+    CU_add_test(suite, "nft_batch", test_nft_batch);
     CU_add_test(suite, "delete_nft_rule", test_delete_nft_rule);
     CU_basic_run_tests();
     CU_cleanup_registry();
+    nft_context_free();
     return 0;
 }
@@ -5,11 +5,5 @@ SCRIPTPATH="$( cd -- "$(dirname "$0")" >/dev/null 2>&1 ; pwd -P )"
 # Create dummy interface
 sudo $SCRIPTPATH/test/create_interface.sh
 
-# Iterate on all devices
-for DEVICE in $SCRIPTPATH/devices/*
-do
-    if [[ -d $DEVICE ]]
-    then
-        python3 $SCRIPTPATH/src/translator/translator.py $DEVICE/profile.yaml
-    fi
-done
+# Translate all devices, in parallel
+python3 $SCRIPTPATH/src/translator/translator.py --jobs $(nproc) $SCRIPTPATH/devices